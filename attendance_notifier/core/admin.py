@@ -1,7 +1,140 @@
 from django.contrib import admin
-from .models import Student,Teacher, Schedule, Attendance
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from .models import Student,Teacher, Schedule, Attendance, Unit, Punctuality, ScheduleReport, RejectedAttendance
 
-admin.site.register(Student)
-admin.site.register(Teacher)
-admin.site.register(Schedule)
-admin.site.register(Attendance)
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator that estimates the row count of unfiltered changelists
+
+    COUNT(*) reads the whole table, which takes seconds on a Pi once a term of
+    attendances builds up. Unfiltered lists use the row count sqlite stores in
+    sqlite_stat1 when the table is analyzed. Filtered lists are counted exactly.
+
+    The estimate is only as fresh as the last ANALYZE, so it is only trusted
+    for the first pages. Asking for the last estimated page or a later one
+    counts exactly, so the oldest rows are always reachable, and pages past
+    the end of a too high estimate show the last page instead of an error.
+    '''
+    estimated = False
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and connection.vendor == 'sqlite':
+            estimate = estimated_count(self.object_list.model._meta.db_table)
+            if estimate is not None:
+                if estimate <= self.per_page:
+                    # An estimate of less than a page would make the changelist show every row.
+                    # Counting up to one row more than a page is cheap
+                    estimate = max(estimate, self.object_list[:self.per_page + 1].count())
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        try:
+            page = int(number)
+        except (TypeError, ValueError):
+            page = None
+        if self.estimated and page is not None and page >= self.num_pages:
+            self.estimated = False
+            self.__dict__['count'] = Paginator.count.func(self)
+            self.__dict__.pop('num_pages', None)
+            # Pages linked from a too high estimate show the last page
+            return super().validate_number(max(min(page, self.num_pages), 1))
+        return super().validate_number(number)
+
+
+def estimated_count(table: str):
+    '''
+    Get the row count of a table recorded by the last ANALYZE
+
+    Parameters:
+    table (str) : Table name
+
+    Returns:
+    int | None : Row count. None if the table was never analyzed
+    '''
+    with connection.cursor() as cursor:
+        # sqlite_stat1 only exists after the first ANALYZE
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if not cursor.fetchone():
+            return None
+        cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        row = cursor.fetchone()
+    return int(row[0].split()[0]) if row else None
+
+
+@admin.register(Student)
+class StudentAdmin(admin.ModelAdmin):
+    list_display = ('lrn', 'last_name', 'first_name', 'guardian_phone_number')
+    search_fields = ('=lrn', '^last_name', '^first_name')
+    ordering = ('last_name', 'first_name')
+
+
+@admin.register(Teacher)
+class TeacherAdmin(admin.ModelAdmin):
+    list_display = ('last_name', 'first_name', 'phone_number')
+    search_fields = ('^last_name', '^first_name')
+
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'day', 'start', 'end', 'teacher', 'late_after', 'very_late_after')
+    list_select_related = ('teacher',)
+    list_filter = ('day',)
+    search_fields = ('subject', '^teacher__last_name', '^teacher__first_name')
+
+
+@admin.register(Attendance)
+class AttendanceAdmin(admin.ModelAdmin):
+    list_display = ('date', 'time_in', 'status', 'student_lrn', 'student', 'subject')
+    list_select_related = ('student', 'schedule')
+    # Both filters and the date hierarchy use indexed columns
+    list_filter = ('status', 'schedule')
+    date_hierarchy = 'date'
+    search_fields = ('=student__lrn', '^student__last_name', '^student__first_name')
+    raw_id_fields = ('student', 'schedule', 'unit')
+    ordering = ('-date', '-time_in')
+    list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(description='LRN', ordering='student__lrn')
+    def student_lrn(self, attendance):
+        return attendance.student.lrn
+
+    @admin.display(description='Subject', ordering='schedule__subject')
+    def subject(self, attendance):
+        return attendance.schedule.subject
+
+
+@admin.register(Punctuality)
+class PunctualityAdmin(admin.ModelAdmin):
+    list_display = ('term', 'student', 'schedule', 'on_time', 'late', 'very_late')
+    list_select_related = ('student', 'schedule')
+    list_filter = ('term',)
+    search_fields = ('=student__lrn', '^student__last_name', '^student__first_name')
+    raw_id_fields = ('student', 'schedule')
+
+
+@admin.register(ScheduleReport)
+class ScheduleReportAdmin(admin.ModelAdmin):
+    list_display = ('schedule', 'date', 'reported_at')
+    list_select_related = ('schedule',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('schedule',)
+
+
+@admin.register(RejectedAttendance)
+class RejectedAttendanceAdmin(admin.ModelAdmin):
+    list_display = ('unit', 'source_id', 'lrn', 'schedule_id', 'date', 'time_in', 'reason')
+    list_filter = ('unit', 'reason')
+    search_fields = ('=lrn',)
+    date_hierarchy = 'date'
+
+
+admin.site.register(Unit)
@@ -0,0 +1,127 @@
+import csv
+
+from .models import Attendance
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ('date', 'time_in', 'lrn', 'student_name', 'subject', 'schedule_id')
+
+
+def attendance_rows(start=None, end=None, schedule_id=None, chunk_size: int = 2000):
+    '''
+    Iterate over attendance rows for export using a server-side cursor
+
+    Parameters:
+    start (datetime.date) : First date to include. None for no lower bound
+    end (datetime.date) : Last date to include. None for no upper bound
+    schedule_id : Schedule ID. None for all schedules
+    chunk_size (int) : Number of rows fetched from the database at a time
+
+    Returns:
+    generator of tupple : (date, time_in, lrn, student_name, subject, schedule_id)
+    '''
+    queryset = Attendance.objects.all()
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    if schedule_id:
+        queryset = queryset.filter(schedule_id=schedule_id)
+    queryset = queryset.order_by('date', 'time_in').values_list(
+        'date', 'time_in', 'student__lrn', 'student__first_name',
+        'student__last_name', 'schedule__subject', 'schedule_id')
+    for date, time_in, lrn, first_name, last_name, subject, schedule in queryset.iterator(chunk_size=chunk_size):
+        yield (date, time_in, lrn, f'{first_name} {last_name}', subject, schedule)
+
+
+class Echo:
+    '''
+    File-like object that returns what is written instead of storing it
+    '''
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    '''
+    Encode rows as CSV lines one at a time
+
+    Parameters:
+    rows (iterable) : Rows to encode
+
+    Returns:
+    generator of str : CSV lines, starting with the header
+    '''
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(rows, file):
+    '''
+    Write rows to a CSV file incrementally
+
+    Parameters:
+    rows (iterable) : Rows to write
+    file : Text file object
+
+    Returns:
+    int : Number of rows written
+    '''
+    writer = csv.writer(file)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_parquet(rows, file, batch_size: int = 10000):
+    '''
+    Write rows to a Parquet file, one row group per batch
+
+    Parameters:
+    rows (iterable) : Rows to write
+    file : Path or binary file object
+    batch_size (int) : Number of rows buffered per row group
+
+    Returns:
+    int : Number of rows written
+    '''
+    if pyarrow is None:
+        raise RuntimeError('Parquet export requires pyarrow')
+    schema = pyarrow.schema([
+        ('date', pyarrow.date32()),
+        ('time_in', pyarrow.time64('us')),
+        ('lrn', pyarrow.string()),
+        ('student_name', pyarrow.string()),
+        ('subject', pyarrow.string()),
+        ('schedule_id', pyarrow.int64()),
+    ])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(file, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(_to_table(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(_to_table(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _to_table(batch, schema):
+    columns = list(zip(*batch)) if batch else [[] for _ in COLUMNS]
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema)
@@ -0,0 +1,46 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date: {value}. Use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Export attendance records to CSV or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--end', type=parse_date, help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--schedule', type=int, help='Only export this schedule ID')
+        parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+        parser.add_argument('--output', '-o', help='Output file. Defaults to stdout for CSV')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = export.attendance_rows(
+            start=options['start'],
+            end=options['end'],
+            schedule_id=options['schedule'],
+            chunk_size=options['chunk_size'])
+
+        if options['format'] == 'parquet':
+            if export.pyarrow is None:
+                raise CommandError('Parquet export requires pyarrow')
+            if not options['output']:
+                raise CommandError('Parquet export requires --output')
+            count = export.write_parquet(rows, options['output'])
+        elif options['output']:
+            with open(options['output'], 'w', newline='') as file:
+                count = export.write_csv(rows, file)
+        else:
+            count = export.write_csv(rows, sys.stdout)
+
+        self.stderr.write(f'Exported {count} attendance records')
@@ -0,0 +1,34 @@
+import csv
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core import punctuality
+
+
+class Command(BaseCommand):
+    help = 'Report on time, late and very late attendances of a term per student or schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', default=punctuality.school_year(datetime.date.today()),
+                            help='School year, e.g. SY2023-2024. Defaults to the current one')
+        parser.add_argument('--by', choices=('student', 'schedule'), default='student')
+        parser.add_argument('--output', '-o', help='Output CSV file. Defaults to stdout')
+
+    def handle(self, *args, **options):
+        rows = punctuality.report(options['term'], by=options['by'])
+        file = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            writer = None
+            count = 0
+            for row in rows.iterator():
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                count += 1
+        finally:
+            if options['output']:
+                file.close()
+        self.stderr.write(f'Reported {count} {options["by"]}s for {options["term"]}')
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_remove_attendance_time_out'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
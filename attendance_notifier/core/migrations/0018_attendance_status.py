@@ -0,0 +1,97 @@
+# Generated by Django 4.2.5 on 2026-10-19 13:46
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def school_year(date):
+    start = date.year if date.month >= 6 else date.year - 1
+    return f'SY{start}-{start + 1}'
+
+
+def minutes_of(time):
+    return time.hour * 60 + time.minute + time.second / 60
+
+
+def shifted(start, minutes):
+    moment = datetime.datetime.combine(datetime.date(2000, 1, 1), start) + datetime.timedelta(minutes=minutes)
+    return moment.time() if moment.day == 1 else datetime.time.max
+
+
+def classify_attendances(apps, schema_editor):
+    '''
+    Classify existing attendances and count them, so counters start complete
+    '''
+    Attendance = apps.get_model('core', 'Attendance')
+    Schedule = apps.get_model('core', 'Schedule')
+    Punctuality = apps.get_model('core', 'Punctuality')
+    for schedule in Schedule.objects.all():
+        late = shifted(schedule.start, schedule.late_after)
+        very_late = shifted(schedule.start, schedule.very_late_after)
+        attendances = Attendance.objects.filter(schedule_id=schedule.id, time_in__isnull=False)
+        attendances.filter(time_in__gt=very_late).update(status='very_late')
+        attendances.filter(time_in__gt=late, time_in__lte=very_late).update(status='late')
+        attendances.filter(time_in__lte=late).update(status='on_time')
+        if schedule.end <= schedule.start:
+            # Times in after midnight of a class that ends on the next day
+            for attendance in attendances.filter(time_in__lte=schedule.end):
+                minutes = 24 * 60 - minutes_of(schedule.start) + minutes_of(attendance.time_in)
+                status = 'very_late' if minutes > schedule.very_late_after else 'late' if minutes > schedule.late_after else 'on_time'
+                Attendance.objects.filter(id=attendance.id).update(status=status)
+
+    counters = {}
+    rows = Attendance.objects.filter(status__isnull=False).values_list('student_id', 'schedule_id', 'date', 'status')
+    for student_id, schedule_id, date, status in rows.iterator(chunk_size=2000):
+        counter = counters.setdefault((school_year(date), student_id, schedule_id), {'on_time': 0, 'late': 0, 'very_late': 0})
+        counter[status] += 1
+    Punctuality.objects.bulk_create(
+        [Punctuality(term=term, student_id=student_id, schedule_id=schedule_id, **counter)
+         for (term, student_id, schedule_id), counter in counters.items()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='status',
+            field=models.CharField(blank=True, choices=[('on_time', 'On time'), ('late', 'Late'), ('very_late', 'Very late')], db_index=True, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='late_after',
+            field=models.PositiveIntegerField(default=15),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='very_late_after',
+            field=models.PositiveIntegerField(default=30),
+        ),
+        migrations.CreateModel(
+            name='Punctuality',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=16)),
+                ('on_time', models.PositiveIntegerField(default=0)),
+                ('late', models.PositiveIntegerField(default=0)),
+                ('very_late', models.PositiveIntegerField(default=0)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.schedule')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.student')),
+            ],
+            options={
+                'verbose_name_plural': 'punctuality',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='punctuality',
+            constraint=models.UniqueConstraint(fields=('term', 'student', 'schedule'), name='unique_punctuality'),
+        ),
+        migrations.RunPython(classify_attendances, migrations.RunPython.noop),
+    ]
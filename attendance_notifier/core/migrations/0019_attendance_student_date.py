@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_attendance_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['student', 'date', 'schedule'], name='attendance_student_date'),
+        ),
+    ]
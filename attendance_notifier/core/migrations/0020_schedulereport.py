@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_attendance_student_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reported_at', models.DateTimeField(auto_now_add=True)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.schedule')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='schedulereport',
+            constraint=models.UniqueConstraint(fields=('schedule', 'date'), name='unique_schedule_report'),
+        ),
+    ]
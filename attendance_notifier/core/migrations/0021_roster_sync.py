@@ -0,0 +1,56 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_schedulereport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='server_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='server_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='server_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='RejectedAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_id', models.BigIntegerField()),
+                ('lrn', models.CharField(blank=True, max_length=255, null=True)),
+                ('schedule_id', models.BigIntegerField(blank=True, null=True)),
+                ('date', models.DateField()),
+                ('time_in', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(max_length=255)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.unit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rejectedattendance',
+            constraint=models.UniqueConstraint(fields=('unit', 'source_id'), name='unique_unit_rejected_attendance'),
+        ),
+    ]
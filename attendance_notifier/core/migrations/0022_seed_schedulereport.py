@@ -0,0 +1,37 @@
+import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def seed_reports(apps, schema_editor):
+    '''
+    Mark the classes that already ended as reported. Units reported them before
+    reports were marked, and would otherwise report them again on startup
+    '''
+    Schedule = apps.get_model('core', 'Schedule')
+    ScheduleReport = apps.get_model('core', 'ScheduleReport')
+    # Schedules are in the local time of the school, which units also run on
+    now = timezone.localtime().replace(tzinfo=None)
+    reports = []
+    # Units catch up on at most a day of reports. A class of the day before may end after midnight
+    for date in (now.date() - datetime.timedelta(days=1), now.date()):
+        for schedule in Schedule.objects.filter(day=date.isoweekday()):
+            start = datetime.datetime.combine(date, schedule.start)
+            end = datetime.datetime.combine(date, schedule.end)
+            if end <= start:
+                end += datetime.timedelta(days=1)
+            if end <= now:
+                reports.append(ScheduleReport(schedule=schedule, date=date))
+    ScheduleReport.objects.bulk_create(reports, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_roster_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_reports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_seed_schedulereport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_water', models.BigIntegerField(default=0)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_syncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unit',
+            name='roster_synced',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -2,11 +2,15 @@ from django.db import models
 from django.core.exceptions import ValidationError
 import re
 
+from notifier.punctuality import ON_TIME, LATE, VERY_LATE, classify
+
 class Student(models.Model):
     lrn = models.CharField(max_length=255, unique=True)
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
     guardian_phone_number = models.CharField(max_length=255)
+    # Id on the central server, set on classroom units by the sync
+    server_id = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def validate_philippine_phone_number(self, value):
         phone_number_pattern = r'^\+?63?[0-9]{10}$'
@@ -25,6 +29,8 @@ class Teacher(models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=255)
+    # Id on the central server, set on classroom units by the sync
+    server_id = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def validate_philippine_phone_number(self, value):
         phone_number_pattern = r'^\+?63?[0-9]{10}$'
@@ -55,6 +61,11 @@ class Schedule(models.Model):
     start = models.TimeField()
     end = models.TimeField()
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE)
+    # Minutes after the start a student is late, and very late
+    late_after = models.PositiveIntegerField(default=15)
+    very_late_after = models.PositiveIntegerField(default=30)
+    # Id on the central server, set on classroom units by the sync
+    server_id = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def check_for_conflict(self):
         conflicts = Schedule.objects.filter(
@@ -69,19 +80,157 @@ class Schedule(models.Model):
     def clean(self):
         super().clean()
         self.check_for_conflict()
+        if self.very_late_after < self.late_after:
+            raise ValidationError("Very late must not be sooner than late.")
+
+    def classify(self, time_in):
+        return classify(self.start, time_in, self.late_after, self.very_late_after, self.end)
 
     def __str__(self):
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        return f'{self.subject} ({days[self.day - 1]} {str(self.start.hour).rjust(2, "0")}:{str(self.start.minute).rjust(2, "0")} - {str(self.end.hour).rjust(2, "0")}:{str(self.end.minute).rjust(2, "0")})'
+        return f'{self.subject} ({self.get_day_display()} {self.start:%H:%M} - {self.end:%H:%M})'
 
     class Meta:
         ordering = ['day','start']
 
 class Attendance(models.Model):
+    statuses = (
+        (ON_TIME, 'On time'),
+        (LATE, 'Late'),
+        (VERY_LATE, 'Very late'),
+    )
+
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE)
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     time_in = models.TimeField(null=True)
+    # Classified from time_in when the attendance is recorded
+    status = models.CharField(max_length=16, choices=statuses, null=True, blank=True, db_index=True)
+    # Set on attendances pushed by a classroom unit. source_id is the id on the unit
+    unit = models.ForeignKey('Unit', on_delete=models.SET_NULL, null=True, blank=True)
+    source_id = models.BigIntegerField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # The attendance as the punctuality counters hold it, None when new
+        self.counted = None
+        if not self._state.adding:
+            self.counted = Attendance.objects.filter(pk=self.pk).first()
+        if self.counted and (self.counted.time_in, self.counted.schedule_id) != (self.time_in, self.schedule_id):
+            # Edited, e.g. in the admin. Classify again
+            self.status = None
+        if self.status is None and self.time_in is not None:
+            self.status = self.schedule.classify(self.time_in)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.pk}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['unit', 'source_id'], name='unique_unit_attendance'),
+        ]
+        indexes = [
+            # Duplicate checks of the scanner look up (student, schedule, date) for whole batches
+            models.Index(fields=['student', 'date', 'schedule'], name='attendance_student_date'),
+        ]
+
+
+class Unit(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    token = models.CharField(max_length=255, unique=True)
+    high_water = models.BigIntegerField(default=0)
+    last_sync = models.DateTimeField(null=True, blank=True)
+    # When the unit last pulled with the current roster version, so it has
+    # applied every roster deletion made before
+    roster_synced = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+# Attendances pushed by a unit that could not be saved, e.g. of an unknown LRN.
+# Kept so they can be fixed and entered by hand instead of being lost
+class RejectedAttendance(models.Model):
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE)
+    source_id = models.BigIntegerField()
+    lrn = models.CharField(max_length=255, null=True, blank=True)
+    schedule_id = models.BigIntegerField(null=True, blank=True)
+    date = models.DateField()
+    time_in = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=255)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.unit} {self.source_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['unit', 'source_id'], name='unique_unit_rejected_attendance'),
+        ]
+
+
+# Teachers, students and schedules deleted on the central server. Sent to units
+# so they delete exactly these, and never rows the server simply did not send
+class RosterDeletion(models.Model):
+    entity = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.entity} {self.object_id}'
+
+
+# Last attendance id the central server has, kept by the sync of a classroom
+# unit. Attendances after it are never archived, so they can still be pushed
+class SyncState(models.Model):
+    high_water = models.BigIntegerField(default=0)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.high_water}'
+
+
+# Bumped by core.signals whenever students, schedules or teachers change so
+# running scanners know what to reload
+class DataVersion(models.Model):
+    entity = models.CharField(max_length=32, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.entity} v{self.version}'
+
+
+# Attendance counts per term, student and schedule. Updated as attendances are
+# recorded so punctuality reports never scan the attendance table
+class Punctuality(models.Model):
+    term = models.CharField(max_length=16)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE)
+    on_time = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    very_late = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.term} {self.student_id} {self.schedule_id}'
+
+    class Meta:
+        verbose_name_plural = 'punctuality'
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'student', 'schedule'], name='unique_punctuality'),
+        ]
+
+
+# End of class reports sent by the unit, so each class is reported exactly once,
+# even when the unit restarts around the end of a class
+class ScheduleReport(models.Model):
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE)
+    # Date the class started
+    date = models.DateField()
+    reported_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.schedule_id} {self.date}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'date'], name='unique_schedule_report'),
+        ]
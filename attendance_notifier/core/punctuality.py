@@ -0,0 +1,69 @@
+import collections
+
+from django.db.models import F, Sum
+
+from notifier.punctuality import STATUSES, school_year
+
+from .models import Punctuality
+
+
+def counter_of(attendance):
+    '''
+    Get the counter an attendance is counted in
+
+    Parameters:
+    attendance (Attendance) : Attendance
+
+    Returns:
+    tupple : (term, student_id, schedule_id, status). status is None when not counted
+    '''
+    return (school_year(attendance.date), attendance.student_id, attendance.schedule_id, attendance.status)
+
+
+def record(attendances, count: int = 1):
+    '''
+    Add classified attendances to the punctuality counters
+
+    Parameters:
+    attendances (list of Attendance) : Attendances. Ones without a status are skipped
+    count (int) : 1 when attendances are added, -1 when they are deleted
+    '''
+    counters = collections.Counter(
+        counter_of(attendance) for attendance in attendances if attendance.status in STATUSES)
+    for (term, student_id, schedule_id, status), total in counters.items():
+        counter = Punctuality.objects.filter(term=term, student_id=student_id, schedule_id=schedule_id)
+        if count < 0:
+            # Attendances recorded before the counters existed were never counted
+            counter.filter(**{f'{status}__gte': total}).update(**{status: F(status) - total})
+            continue
+        if counter.update(**{status: F(status) + total}):
+            continue
+        _, created = Punctuality.objects.get_or_create(
+            term=term, student_id=student_id, schedule_id=schedule_id, defaults={status: total})
+        if not created:
+            # Created by another request since the update
+            counter.update(**{status: F(status) + total})
+
+
+def report(term: str, by: str = 'student'):
+    '''
+    Get the punctuality of a term per student or per schedule
+
+    Parameters:
+    term (str) : School year, e.g. SY2023-2024
+    by (str) : `student` or `schedule`
+
+    Returns:
+    QuerySet : Dicts of the student or schedule fields with on_time, late and very_late totals
+    '''
+    if by == 'student':
+        fields = ('student_id', 'student__lrn', 'student__first_name', 'student__last_name')
+    elif by == 'schedule':
+        fields = ('schedule_id', 'schedule__subject', 'schedule__day', 'schedule__start')
+    else:
+        raise ValueError(f'Unknown grouping {by}')
+    return (Punctuality.objects
+            .filter(term=term)
+            .values(*fields)
+            .annotate(**{status + '_total': Sum(status) for status in STATUSES})
+            .order_by(fields[0]))
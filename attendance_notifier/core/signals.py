@@ -0,0 +1,54 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import punctuality
+from .models import Attendance, DataVersion, RosterDeletion, Schedule, Student, Teacher
+
+ENTITIES = {
+    Student: 'student',
+    Schedule: 'schedule',
+    Teacher: 'teacher',
+}
+
+
+def bump_version(entity: str):
+    '''
+    Bump the version of an entity so scanners reload it
+    '''
+    updated = DataVersion.objects.filter(entity=entity).update(version=F('version') + 1)
+    if not updated:
+        DataVersion.objects.get_or_create(entity=entity, defaults={'version': 1})
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def entity_changed(sender, **kwargs):
+    entity = ENTITIES.get(sender)
+    if entity:
+        bump_version(entity)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_delete, sender=Teacher)
+def entity_deleted(sender, instance, **kwargs):
+    # Units delete only what the server says was deleted
+    RosterDeletion.objects.create(entity=ENTITIES[sender], object_id=instance.pk)
+
+
+@receiver(post_save, sender=Attendance)
+def attendance_saved(sender, instance, created, **kwargs):
+    if created:
+        punctuality.record([instance])
+        return
+    counted = getattr(instance, 'counted', None)
+    if counted and punctuality.counter_of(counted) != punctuality.counter_of(instance):
+        # Move the attendance to the counter it belongs to now
+        punctuality.record([counted], -1)
+        punctuality.record([instance])
+
+
+@receiver(post_delete, sender=Attendance)
+def attendance_deleted(sender, instance, **kwargs):
+    punctuality.record([instance], -1)
@@ -0,0 +1,174 @@
+import datetime
+import gzip
+import hashlib
+import json
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from . import punctuality
+from .models import Attendance, RejectedAttendance, RosterDeletion, Schedule, Student, Teacher, Unit
+
+# Attendances are pushed as rows of these columns. `id` is the id on the unit
+ATTENDANCE_COLUMNS = ('id', 'lrn', 'schedule_id', 'date', 'time_in')
+
+
+def roster():
+    '''
+    Get the teachers, students and schedules classroom units should have
+
+    Returns:
+    dict : teachers, students and schedules as lists of rows
+    '''
+    return {
+        'teachers': [list(row) for row in Teacher.objects.order_by('id').values_list(
+            'id', 'first_name', 'last_name', 'phone_number')],
+        'students': [list(row) for row in Student.objects.order_by('id').values_list(
+            'id', 'lrn', 'first_name', 'last_name', 'guardian_phone_number')],
+        'schedules': [[id, subject, day, str(start), str(end), teacher_id, late_after, very_late_after]
+                      for id, subject, day, start, end, teacher_id, late_after, very_late_after in
+                      Schedule.objects.order_by('id').values_list(
+                          'id', 'subject', 'day', 'start', 'end', 'teacher_id', 'late_after', 'very_late_after')],
+    }
+
+
+def removed():
+    '''
+    Get the teachers, students and schedules deleted on the server. Units
+    delete exactly these, so a roster that is missing rows never deletes anything
+
+    Returns:
+    dict : teachers, students and schedules as lists of ids
+    '''
+    deleted = {'teachers': [], 'students': [], 'schedules': []}
+    for entity, object_id in RosterDeletion.objects.order_by('id').values_list('entity', 'object_id'):
+        deleted[entity + 's'].append(object_id)
+    return deleted
+
+
+def confirm_roster(unit: Unit, synced_at: datetime.datetime):
+    '''
+    Remember that a unit has the roster of a moment, with every deletion made
+    before it, and drop the deletions every unit has
+
+    Parameters:
+    unit (Unit) : Unit that pulled the current roster version
+    synced_at (datetime.datetime) : When the roster was read
+
+    Returns:
+    int : Number of deletions dropped
+    '''
+    unit.roster_synced = synced_at
+    unit.save(update_fields=['roster_synced'])
+    return prune_deletions()
+
+
+def prune_deletions():
+    '''
+    Drop the roster deletions made before the oldest roster a unit has
+
+    Returns:
+    int : Number of deletions dropped
+    '''
+    if Unit.objects.filter(roster_synced=None).exists():
+        # A unit that never confirmed a roster may still have any deleted row
+        return 0
+    oldest = Unit.objects.aggregate(oldest=Min('roster_synced'))['oldest']
+    if oldest is None:
+        return 0
+    deleted, _ = RosterDeletion.objects.filter(deleted_at__lt=oldest).delete()
+    return deleted
+
+
+def roster_version(data: dict):
+    '''
+    Get a version string that changes whenever the roster changes
+
+    Parameters:
+    data (dict) : Roster
+
+    Returns:
+    str : Version
+    '''
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def decode_body(request):
+    '''
+    Decode a JSON request body, gzip compressed or not
+
+    Parameters:
+    request (HttpRequest) : Request
+
+    Returns:
+    dict : Decoded body
+    '''
+    body = request.body
+    if request.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def apply_push(unit: Unit, columns, rows):
+    '''
+    Save attendances pushed by a unit
+
+    Rows whose LRN or schedule does not exist here are rejected and kept as
+    RejectedAttendance, so the high water mark can move past them without
+    losing them. Pushing the same rows twice is harmless, they are matched by
+    unit and id on the unit. Attendances are classified with the schedules of the server.
+
+    Parameters:
+    unit (Unit) : Unit pushing the attendances
+    columns (list of str) : Column names of the rows
+    rows (list of list) : Attendances
+
+    Returns:
+    dict : accepted, rejected and the new high_water of the unit
+    '''
+    if list(columns) != list(ATTENDANCE_COLUMNS):
+        raise ValueError(f'Expected columns {ATTENDANCE_COLUMNS}')
+    if not rows:
+        return {'accepted': 0, 'rejected': 0, 'high_water': unit.high_water}
+
+    students = dict(Student.objects.filter(lrn__in={row[1] for row in rows}).values_list('lrn', 'id'))
+    schedules = Schedule.objects.in_bulk({row[2] for row in rows})
+    attendances = []
+    rejected = []
+    for source_id, lrn, schedule_id, date, time_in in rows:
+        time_in = datetime.time.fromisoformat(time_in) if time_in else None
+        if lrn not in students or schedule_id not in schedules:
+            rejected.append(RejectedAttendance(
+                unit=unit,
+                source_id=source_id,
+                lrn=lrn,
+                schedule_id=schedule_id,
+                date=datetime.date.fromisoformat(date),
+                time_in=time_in,
+                reason='Unknown LRN' if lrn not in students else 'Unknown schedule'))
+            continue
+        attendances.append(Attendance(
+            unit=unit,
+            source_id=source_id,
+            student_id=students[lrn],
+            schedule_id=schedule_id,
+            date=datetime.date.fromisoformat(date),
+            time_in=time_in,
+            status=schedules[schedule_id].classify(time_in) if time_in else None))
+    accepted = len(attendances)
+
+    with transaction.atomic():
+        # Only count attendances that are new in the punctuality counters
+        existing = set(Attendance.objects.filter(
+            unit=unit, source_id__in=[attendance.source_id for attendance in attendances]).values_list('source_id', flat=True))
+        attendances = [attendance for attendance in attendances if attendance.source_id not in existing]
+        Attendance.objects.bulk_create(attendances, ignore_conflicts=True)
+        RejectedAttendance.objects.bulk_create(rejected, ignore_conflicts=True)
+        punctuality.record(attendances)
+
+        unit.high_water = max(unit.high_water, max(row[0] for row in rows))
+        unit.last_sync = timezone.now()
+        unit.save(update_fields=['high_water', 'last_sync'])
+    return {'accepted': accepted, 'rejected': len(rejected), 'high_water': unit.high_water}
+
@@ -1,3 +1,239 @@
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from . import export, sync
+from .admin import AttendanceAdmin, EstimatedCountPaginator
+from .models import (LATE, ON_TIME, VERY_LATE, Attendance, Punctuality, RejectedAttendance, RosterDeletion, Schedule, Student,
+                     Teacher, Unit)
+
+
+class SyncTest(TestCase):
+
+    def setUp(self):
+        self.unit = Unit.objects.create(name='Room 1', token='secret')
+        teacher = Teacher.objects.create(first_name='Ana', last_name='Cruz', phone_number='+639170000001')
+        self.student = Student.objects.create(lrn='SRV1', first_name='Ben', last_name='Reyes', guardian_phone_number='+639170000011')
+        self.schedule = Schedule.objects.create(subject='Math', day=1, start=datetime.time(8), end=datetime.time(9), teacher=teacher)
+
+    def pull(self, version=''):
+        return self.client.get('/sync/pull/', {'version': version}, HTTP_AUTHORIZATION='Token secret').json()
+
+    def push(self, rows):
+        body = gzip.compress(json.dumps({'columns': sync.ATTENDANCE_COLUMNS, 'rows': rows}).encode())
+        return self.client.post('/sync/push/', body, content_type='application/json',
+                                HTTP_CONTENT_ENCODING='gzip', HTTP_AUTHORIZATION='Token secret').json()
+
+    def test_pull_lists_deleted_rows(self):
+        response = self.pull()
+        self.assertEqual(response['removed']['students'], [])
+        student_id = self.student.id
+        self.student.delete()
+        response = self.pull(response['version'])
+        self.assertEqual(response['removed']['students'], [student_id])
+        self.assertEqual(response['roster']['students'], [])
+
+    def test_only_roster_deletions_are_recorded(self):
+        self.push([[1, 'SRV1', self.schedule.id, '2026-10-19', '08:01:00']])
+        Attendance.objects.get().delete()
+        Unit.objects.create(name='Room 2', token='other').delete()
+        self.assertFalse(RosterDeletion.objects.exists())
+        self.student.delete()
+        self.assertEqual(list(RosterDeletion.objects.values_list('entity', flat=True)), ['student'])
+
+    def test_deletions_every_unit_has_are_dropped(self):
+        other = Unit.objects.create(name='Room 2', token='other')
+        student_id = self.student.id
+        self.student.delete()
+        version = self.pull()['version']
+        # Room 1 has the deletion, Room 2 never pulled
+        self.pull(version)
+        self.assertEqual(RosterDeletion.objects.count(), 1)
+        other_pull = self.client.get('/sync/pull/', {'version': ''}, HTTP_AUTHORIZATION='Token other').json()
+        self.assertEqual(other_pull['removed']['students'], [student_id])
+        self.client.get('/sync/pull/', {'version': other_pull['version']}, HTTP_AUTHORIZATION='Token other')
+        self.assertFalse(RosterDeletion.objects.exists())
+        other.refresh_from_db()
+        self.assertIsNotNone(other.roster_synced)
+        # The roster version does not change when deletions are dropped
+        self.assertNotIn('roster', self.pull(version))
+
+    def test_pull_omits_unchanged_roster(self):
+        response = self.pull()
+        self.assertNotIn('roster', self.pull(response['version']))
+
+    def test_push_keeps_rejected_rows(self):
+        response = self.push([
+            [1, 'SRV1', self.schedule.id, '2026-10-19', '08:01:00'],
+            [2, 'UNKNOWN', self.schedule.id, '2026-10-19', '08:02:00'],
+            [3, 'SRV1', None, '2026-10-19', '08:03:00'],
+        ])
+        self.assertEqual((response['accepted'], response['rejected'], response['high_water']), (1, 2, 3))
+        self.assertEqual(Attendance.objects.get().source_id, 1)
+        rejected = RejectedAttendance.objects.order_by('source_id')
+        self.assertEqual([(row.source_id, row.reason) for row in rejected], [(2, 'Unknown LRN'), (3, 'Unknown schedule')])
+
+        # Pushing the same rows again changes nothing
+        self.push([[2, 'UNKNOWN', self.schedule.id, '2026-10-19', '08:02:00']])
+        self.assertEqual(RejectedAttendance.objects.count(), 2)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+
+class PunctualityTest(TestCase):
+
+    def setUp(self):
+        teacher = Teacher.objects.create(first_name='Ana', last_name='Cruz', phone_number='+639170000001')
+        self.schedule = Schedule.objects.create(subject='Math', day=1, start=datetime.time(8), end=datetime.time(9), teacher=teacher)
+        self.student = Student.objects.create(lrn='SRV1', first_name='Ben', last_name='Reyes', guardian_phone_number='+639170000011')
+        self.attendance = Attendance.objects.create(student=self.student, schedule=self.schedule,
+                                                    date=datetime.date(2026, 10, 19), time_in=datetime.time(8, 1))
+
+    def counts(self):
+        counter = Punctuality.objects.get(term='SY2026-2027', student=self.student, schedule=self.schedule)
+        return (counter.on_time, counter.late, counter.very_late)
+
+    def test_admin_edit_of_time_in_reclassifies(self):
+        self.assertEqual((self.attendance.status, self.counts()), (ON_TIME, (1, 0, 0)))
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.post(f'/admin/core/attendance/{self.attendance.id}/change/', {
+            'student': self.student.id,
+            'schedule': self.schedule.id,
+            'date': '2026-10-19',
+            'time_in': '08:40:00',
+            'status': ON_TIME,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.attendance.refresh_from_db()
+        self.assertEqual((self.attendance.status, self.counts()), (VERY_LATE, (0, 0, 1)))
+
+    def test_time_in_after_midnight_of_an_overnight_class(self):
+        self.schedule.start, self.schedule.end = datetime.time(22), datetime.time(1)
+        self.schedule.save()
+        attendance = Attendance.objects.create(student=self.student, schedule=self.schedule,
+                                               date=datetime.date(2026, 10, 20), time_in=datetime.time(0, 30))
+        self.assertEqual(attendance.status, VERY_LATE)
+
+    def test_save_without_changes_keeps_the_counters(self):
+        self.attendance.status = LATE
+        self.attendance.save()
+        self.assertEqual(self.counts(), (0, 1, 0))
+        self.attendance.save()
+        self.assertEqual(self.counts(), (0, 1, 0))
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        teacher = Teacher.objects.create(first_name='Ana', last_name='Cruz', phone_number='+639170000001')
+        self.math = Schedule.objects.create(subject='Math', day=1, start=datetime.time(8), end=datetime.time(9), teacher=teacher)
+        self.science = Schedule.objects.create(subject='Science', day=1, start=datetime.time(9), end=datetime.time(10), teacher=teacher)
+        student = Student.objects.create(lrn='SRV1', first_name='Ben', last_name='Reyes', guardian_phone_number='+639170000011')
+        for day, schedule, time_in in ((20, self.science, 9), (19, self.math, 8), (19, self.science, 9), (21, self.math, 8)):
+            Attendance.objects.create(student=student, schedule=schedule, date=datetime.date(2026, 10, day), time_in=datetime.time(time_in, 5))
+
+    def test_rows_are_ordered_and_filtered(self):
+        rows = list(export.attendance_rows(start=datetime.date(2026, 10, 19), end=datetime.date(2026, 10, 20), chunk_size=1))
+        self.assertEqual([(row[0].day, row[4]) for row in rows], [(19, 'Math'), (19, 'Science'), (20, 'Science')])
+        self.assertEqual(rows[0][1:4], (datetime.time(8, 5), 'SRV1', 'Ben Reyes'))
+        rows = list(export.attendance_rows(schedule_id=self.math.id))
+        self.assertEqual([row[0].day for row in rows], [19, 21])
+
+    def test_download_is_staff_only(self):
+        response = self.client.get('/export/attendance/')
+        self.assertEqual(response.status_code, 302)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/export/attendance/', {'start': '2026-10-21'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['date,time_in,lrn,student_name,subject,schedule_id', f'2026-10-21,08:05:00,SRV1,Ben Reyes,Math,{self.math.id}'])
+        self.assertEqual(self.client.get('/export/attendance/', {'start': 'yesterday'}).status_code, 400)
+
+    def test_command_writes_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'attendance.csv')
+            stderr = io.StringIO()
+            call_command('export_attendance', '--schedule', str(self.science.id), '--output', output, stderr=stderr)
+            with open(output) as file:
+                self.assertEqual(len(file.read().splitlines()), 3)
+        self.assertIn('Exported 2 attendance records', stderr.getvalue())
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet_has_every_row(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'attendance.parquet')
+            self.assertEqual(export.write_parquet(export.attendance_rows(), output, batch_size=3), 4)
+            table = export.pyarrow.parquet.read_table(output)
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(table.column('subject').to_pylist()[0], 'Math')
+
+
+class EstimatedCountPaginatorTest(TestCase):
+
+    def setUp(self):
+        teacher = Teacher.objects.create(first_name='Ana', last_name='Cruz', phone_number='+639170000001')
+        schedule = Schedule.objects.create(subject='Math', day=1, start=datetime.time(8), end=datetime.time(9), teacher=teacher)
+        student = Student.objects.create(lrn='SRV1', first_name='Ben', last_name='Reyes', guardian_phone_number='+639170000011')
+        Attendance.objects.bulk_create(
+            Attendance(student=student, schedule=schedule, date=datetime.date(2026, 1, 1) + datetime.timedelta(days=i))
+            for i in range(25))
+
+    def set_estimate(self, rows):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_attendance')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = %s WHERE tbl = 'core_attendance'", [f'{rows} 1'])
+
+    def paginator(self):
+        return EstimatedCountPaginator(Attendance.objects.order_by('-date'), 10)
+
+    def test_first_pages_use_the_estimate(self):
+        self.set_estimate(1000)
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(1).object_list.count(), 10)
+        self.assertEqual(paginator.count, 1000)
+
+    def test_too_low_estimate_still_reaches_the_oldest_rows(self):
+        self.set_estimate(12)
+        paginator = self.paginator()
+        self.assertEqual(paginator.num_pages, 2)
+        page = paginator.page(2)
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual(len(paginator.page(3).object_list), 5)
+        self.assertTrue(page.has_next())
+
+    def test_too_high_estimate_never_gives_an_empty_last_page(self):
+        self.set_estimate(1000)
+        paginator = self.paginator()
+        self.assertEqual(paginator.num_pages, 100)
+        page = paginator.page(100)
+        self.assertEqual((page.number, len(page.object_list)), (3, 5))
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_estimate_of_an_empty_table_still_paginates(self):
+        self.set_estimate(0)
+        paginator = self.paginator()
+        self.assertEqual(paginator.count, 11)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(len(paginator.page(3).object_list), 5)
+
+    @mock.patch.object(AttendanceAdmin, 'list_per_page', 10)
+    def test_changelist_reaches_the_last_page(self):
+        self.set_estimate(12)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/admin/core/attendance/', {'p': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '?p=3')
+        response = self.client.get('/admin/core/attendance/', {'p': 3})
+        self.assertEqual(len(response.context['cl'].result_list), 5)
@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('export/attendance/', views.export_attendance, name='export_attendance'),
+    path('sync/pull/', views.sync_pull, name='sync_pull'),
+    path('sync/push/', views.sync_push, name='sync_push'),
+]
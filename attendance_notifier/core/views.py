@@ -1,4 +1,82 @@
+import datetime
+import functools
+import tempfile
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import export, sync
+from .models import Unit
 
 def index(request):
     return redirect('admin/')
+
+@staff_member_required
+def export_attendance(request):
+    try:
+        start = datetime.date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        end = datetime.date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+        schedule_id = int(request.GET['schedule']) if request.GET.get('schedule') else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid start, end or schedule')
+
+    rows = export.attendance_rows(start=start, end=end, schedule_id=schedule_id)
+    filename = f'attendance-{start or "all"}-{end or "all"}'
+
+    if request.GET.get('format') == 'parquet':
+        if export.pyarrow is None:
+            return HttpResponseBadRequest('Parquet export requires pyarrow')
+        # Parquet needs its footer written last, so spool to disk instead of memory
+        file = tempfile.TemporaryFile()
+        export.write_parquet(rows, file)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True, filename=f'{filename}.parquet')
+
+    response = StreamingHttpResponse(export.iter_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+def unit_required(view):
+    '''
+    Authenticate a classroom unit by the `Authorization: Token <token>` header
+    '''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        unit = Unit.objects.filter(token=token).first() if scheme == 'Token' and token else None
+        if not unit:
+            return JsonResponse({'error': 'Invalid unit token'}, status=401)
+        return view(request, unit, *args, **kwargs)
+    return wrapper
+
+@csrf_exempt
+@require_GET
+@unit_required
+def sync_pull(request, unit):
+    now = timezone.now()
+    data = sync.roster()
+    # A deletion always changes the roster, so the roster alone is versioned.
+    # Dropping deletions every unit has applied then never changes the version
+    version = sync.roster_version(data)
+    response = {'high_water': unit.high_water, 'version': version}
+    if request.GET.get('version') == version:
+        sync.confirm_roster(unit, now)
+    else:
+        response['roster'] = data
+        response['removed'] = sync.removed()
+    return JsonResponse(response)
+
+@csrf_exempt
+@require_POST
+@unit_required
+def sync_push(request, unit):
+    try:
+        body = sync.decode_body(request)
+        result = sync.apply_push(unit, body['columns'], body['rows'])
+    except (KeyError, ValueError, TypeError, OSError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
@@ -1 +1,5 @@
-from .notifier import Notifier
\ No newline at end of file
+from .notifier import Notifier
+from .camera import CameraSettings
+from .archive import AttendanceArchiver
+from .runtime import NotifierRuntime
+from .sync import UnitSync
\ No newline at end of file
@@ -0,0 +1,97 @@
+import datetime
+import logging
+import os
+import threading
+
+from .database import NotifierDatabase
+
+logger = logging.getLogger(__name__)
+
+class AttendanceArchiver(threading.Thread):
+    '''
+    Background thread that moves old attendances to archive databases in chunks
+
+    Old attendances are archived on start and then every `interval` seconds
+    until the thread is stopped. With `synced`, only attendances the central
+    server already has are archived, so unpushed ones are never lost to it.
+
+    Parameters:
+    database (str) : Database path
+    archive_dir (str) : Directory where archive databases are stored
+    keep_days (int) : Number of days of attendance kept in the main database
+    chunk_size (int) : Number of attendances moved per transaction
+    pause (float) : Seconds to wait between chunks so the scanner can use the database
+    interval (float) : Seconds between archiving runs
+    synced (bool) : Only archive attendances up to the high water mark of the unit sync
+    '''
+
+    def __init__(self, database: str, archive_dir: str, keep_days: int = 180, chunk_size: int = 500, pause: float = 1,
+                 interval: float = 24 * 3600, synced: bool = False):
+        '''
+        Background thread that moves old attendances to archive databases in chunks
+
+        Parameters:
+        database (str) : Database path
+        archive_dir (str) : Directory where archive databases are stored
+        keep_days (int) : Number of days of attendance kept in the main database
+        chunk_size (int) : Number of attendances moved per transaction
+        pause (float) : Seconds to wait between chunks so the scanner can use the database
+        interval (float) : Seconds between archiving runs
+        synced (bool) : Only archive attendances up to the high water mark of the unit sync
+        '''
+        super().__init__(name='attendance-archiver', daemon=True)
+        self.database_path = database
+        self.archive_dir = archive_dir
+        self.keep_days = keep_days
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.interval = interval
+        self.synced = synced
+        self.stopped = threading.Event()
+
+    def run(self):
+        '''
+        Archive old attendances every `interval` seconds until the thread is stopped
+        '''
+        while not self.stopped.is_set():
+            try:
+                self.archive()
+            except Exception:
+                logger.exception('Archiving attendances failed')
+            self.stopped.wait(self.interval)
+
+    def archive(self):
+        '''
+        Move every attendance older than `keep_days` to the archive databases
+
+        Returns:
+        int : Number of attendances moved
+        '''
+        os.makedirs(self.archive_dir, exist_ok=True)
+        # sqlite connections cannot be shared between threads
+        database = NotifierDatabase(self.database_path)
+        cutoff = datetime.date.today() - datetime.timedelta(days=self.keep_days)
+        total = 0
+        try:
+            max_id = None
+            if self.synced:
+                # Nothing is archived before the first sync
+                max_id = database.get_sync_high_water() or 0
+            while not self.stopped.is_set():
+                moved = database.archive_attendances(cutoff, self.archive_dir, self.chunk_size, max_id=max_id)
+                if not moved:
+                    break
+                total += moved
+                self.stopped.wait(self.pause)
+            if total and not self.stopped.is_set():
+                database.analyze('core_attendance')
+        finally:
+            database.close()
+        logger.info('Archived attendances', extra={'archived': total, 'cutoff': str(cutoff), 'max_id': max_id})
+        return total
+
+    def stop(self):
+        '''
+        Stop archiving after the current chunk
+        '''
+        self.stopped.set()
@@ -0,0 +1,284 @@
+import dataclasses
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+# V4L2 values of CAP_PROP_AUTO_EXPOSURE
+MANUAL_EXPOSURE = 1
+AUTO_EXPOSURE = 3
+
+
+@dataclass
+class CameraSettings:
+    '''
+    Capture settings of the QR code camera
+
+    A small resolution is enough for a badge held in front of the camera and
+    is much cheaper to decode. A buffer of one frame makes every read return
+    the latest frame instead of one captured a few hundred milliseconds ago.
+    '''
+    width: int = 640
+    height: int = 480
+    fps: int = 15
+    buffer_size: int = 1
+    fourcc: str = 'MJPG'
+    # None keeps the automatic focus and exposure of the driver
+    focus: float = None
+    exposure: float = None
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Load settings saved by `save`
+
+        Parameters:
+        path (str) : Settings file path
+
+        Returns:
+        CameraSettings : Settings, the defaults if the file does not exist
+        '''
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as file:
+            values = json.load(file)
+        fields = {field.name for field in dataclasses.fields(cls)}
+        return cls(**{key: value for key, value in values.items() if key in fields})
+
+    def save(self, path: str):
+        '''
+        Save the settings as JSON
+
+        Parameters:
+        path (str) : Settings file path
+        '''
+        with open(path, 'w') as file:
+            json.dump(dataclasses.asdict(self), file, indent=2)
+
+    def apply(self, capture):
+        '''
+        Apply the settings to an opened camera
+
+        Parameters:
+        capture (cv2.VideoCapture) : Camera
+
+        Returns:
+        bool : Whether the driver accepted the resolution
+        '''
+        # The format must be set before the resolution for V4L2 to pick the right mode
+        if self.fourcc:
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        capture.set(cv2.CAP_PROP_FPS, self.fps)
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        if self.focus is None:
+            capture.set(cv2.CAP_PROP_AUTOFOCUS, 1)
+        else:
+            capture.set(cv2.CAP_PROP_AUTOFOCUS, 0)
+            capture.set(cv2.CAP_PROP_FOCUS, self.focus)
+        if self.exposure is None:
+            capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, AUTO_EXPOSURE)
+        else:
+            capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, MANUAL_EXPOSURE)
+            capture.set(cv2.CAP_PROP_EXPOSURE, self.exposure)
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if (width, height) != (self.width, self.height):
+            logger.warning('Camera resolution not supported', extra={
+                'requested': f'{self.width}x{self.height}', 'actual': f'{width}x{height}'})
+            return False
+        return True
+
+
+def open_camera(index = 0, settings: CameraSettings = None):
+    '''
+    Open a camera with the given capture settings
+
+    Parameters:
+    index (int | str) : Camera index, or a video file to play instead
+    settings (CameraSettings) : Capture settings. Defaults if not given
+
+    Returns:
+    cv2.VideoCapture : Opened camera
+    '''
+    capture = cv2.VideoCapture(index)
+    (settings or CameraSettings()).apply(capture)
+    return capture
+
+
+def candidate_settings(base: CameraSettings = None):
+    '''
+    Settings tried by `autotune`, from the cheapest to decode
+
+    Parameters:
+    base (CameraSettings) : Settings whose focus and exposure are kept
+
+    Returns:
+    list of CameraSettings : Candidates
+    '''
+    base = base or CameraSettings()
+    candidates = []
+    for width, height in ((320, 240), (640, 480), (800, 600), (1280, 720)):
+        for fourcc in ('MJPG', 'YUYV'):
+            for fps in (15, 30):
+                candidates.append(dataclasses.replace(base, width=width, height=height, fourcc=fourcc, fps=fps))
+    return candidates
+
+
+def benchmark(capture, decode, settings: CameraSettings, frames: int = 30, warmup: int = 5, expected=None):
+    '''
+    Measure how fast and how reliably QR codes are read with the given settings
+
+    Parameters:
+    capture (cv2.VideoCapture) : Camera pointed at a test QR code
+    decode (callable) : Called as decode(frame). Returns the QR code data or None
+    settings (CameraSettings) : Settings to measure
+    frames (int) : Frames read and decoded
+    warmup (int) : Frames skipped after the settings change
+    expected (set of str) : Data of the test QR codes. Any data is accepted if not given
+
+    Returns:
+    tupple : (success_rate, seconds_per_frame), None if the settings are not supported
+    '''
+    if not settings.apply(capture):
+        return None
+    for _ in range(warmup):
+        capture.read()
+    decoded = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        ret, frame = capture.read()
+        if not ret:
+            continue
+        data = decode(frame)
+        if data is not None and (not expected or data in expected):
+            decoded += 1
+    elapsed = time.perf_counter() - start
+    return decoded / frames, elapsed / frames
+
+
+def autotune(capture, decode, candidates=None, frames: int = 30, min_success: float = 0.9, expected=None):
+    '''
+    Find the fastest settings that still read test QR codes reliably
+
+    Hold one of the test QR codes in front of the camera while tuning.
+
+    Parameters:
+    capture (cv2.VideoCapture) : Camera
+    decode (callable) : Called as decode(frame). Returns the QR code data or None
+    candidates (list of CameraSettings) : Settings to try. `candidate_settings()` if not given
+    frames (int) : Frames measured per candidate
+    min_success (float) : Fraction of frames that must decode for a candidate to be reliable
+    expected (set of str) : Data of the test QR codes. Any data is accepted if not given
+
+    Returns:
+    CameraSettings | None : Fastest reliable settings. None if no candidate is reliable
+    '''
+    best = None
+    best_time = None
+    for settings in candidates or candidate_settings():
+        result = benchmark(capture, decode, settings, frames, expected=expected)
+        if result is None:
+            continue
+        success_rate, seconds_per_frame = result
+        logger.info('Camera settings measured', extra={
+            'settings': dataclasses.asdict(settings),
+            'success_rate': round(success_rate, 3),
+            'ms_per_frame': round(seconds_per_frame * 1000, 2)})
+        if success_rate >= min_success and (best_time is None or seconds_per_frame < best_time):
+            best, best_time = settings, seconds_per_frame
+    return best
+
+
+class MotionGate:
+    '''
+    Skip QR code decoding while the scene in front of the camera is static
+
+    Every frame is shrunk to a small grayscale image and compared to a
+    reference frame, which costs a fraction of a full decode. Frames are only
+    decoded while something moves and for `hold` seconds after. When nothing
+    has moved for `idle_after` seconds the scanner reads frames at `idle_fps`
+    to save CPU. A frame is still decoded every `recheck` seconds in case a
+    badge is held perfectly still.
+
+    Parameters:
+    threshold (float) : Mean pixel difference, 0 to 255, that counts as motion
+    hold (float) : Seconds frames are decoded after the last motion
+    idle_after (float) : Seconds without motion before reading at `idle_fps`
+    idle_fps (float) : Frames read per second while idle
+    recheck (float) : Seconds between decodes of a static scene
+    size (tupple) : (width, height) frames are shrunk to before comparing
+    '''
+
+    def __init__(self, threshold: float = 4, hold: float = 2, idle_after: float = 10, idle_fps: float = 2,
+                 recheck: float = 5, size: tuple = (64, 48)):
+        '''
+        Skip QR code decoding while the scene in front of the camera is static
+
+        Parameters:
+        threshold (float) : Mean pixel difference, 0 to 255, that counts as motion
+        hold (float) : Seconds frames are decoded after the last motion
+        idle_after (float) : Seconds without motion before reading at `idle_fps`
+        idle_fps (float) : Frames read per second while idle
+        recheck (float) : Seconds between decodes of a static scene
+        size (tupple) : (width, height) frames are shrunk to before comparing
+        '''
+        self.threshold = threshold
+        self.hold = hold
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        self.recheck = recheck
+        self.size = size
+        self.reference = None
+        self.last_motion = time.monotonic()
+        self.last_decode = 0
+        self.decoded = 0
+        self.skipped = 0
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.last_motion >= self.idle_after
+
+    def delay(self):
+        '''
+        Get the seconds to wait before reading the next frame
+
+        Returns:
+        float : Delay, 0 unless idle
+        '''
+        return 1 / self.idle_fps if self.idle else 0
+
+    def check(self, frame):
+        '''
+        Check whether a frame is worth decoding
+
+        Parameters:
+        frame (numpy.ndarray) : BGR frame
+
+        Returns:
+        bool : Whether the frame should be decoded
+        '''
+        now = time.monotonic()
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+        # The reference only changes on motion, so slow movement still adds up to motion
+        if self.reference is None or cv2.absdiff(small, self.reference).mean() >= self.threshold:
+            self.reference = small
+            self.last_motion = now
+        if now - self.last_motion < self.hold or now - self.last_decode >= self.recheck:
+            if now - self.last_motion >= self.hold:
+                # Static scene, follow lighting changes without counting them as motion
+                self.reference = small
+            self.last_decode = now
+            self.decoded += 1
+            return True
+        self.skipped += 1
+        return False
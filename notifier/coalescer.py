@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+from .inbox import normalize_number
+
+logger = logging.getLogger(__name__)
+
+class Coalescer:
+    '''
+    Combine messages to the same number into one digest
+
+    The first message to a number opens a window. Messages added to that
+    number before the window closes are sent together in one SMS. Urgent
+    messages skip the window and are sent right away.
+
+    With a journal, held messages are kept on disk until their digest is
+    sent, and the ones a previous run still held open a new window.
+
+    Parameters:
+    send (callable) : Called as send(number, message) to send a message
+    window (float) : Seconds messages to a number are held before sending
+    footer (str) : Text appended once to every sent message
+    journal (SmsJournal) : Journal of held messages. Messages are only kept in memory if not given
+    '''
+
+    def __init__(self, send, window: float = 300, footer: str = '', journal = None):
+        '''
+        Combine messages to the same number into one digest
+
+        Parameters:
+        send (callable) : Called as send(number, message) to send a message
+        window (float) : Seconds messages to a number are held before sending
+        footer (str) : Text appended once to every sent message
+        journal (SmsJournal) : Journal of held messages. Messages are only kept in memory if not given
+        '''
+        self.send = send
+        self.window = window
+        self.footer = footer
+        self.journal = journal
+        # normalized number -> (number, opened, messages, journal ids)
+        self.pending = {}
+        self.lock = threading.Lock()
+        if journal is not None:
+            for entry in journal.pending('digest'):
+                self.__hold(entry['number'], entry['message'], entry['id'])
+
+    def add(self, number: str, message: str, urgent: bool = False):
+        '''
+        Add a message
+
+        Parameters:
+        number (str) : Number to send message to. Should contain country code
+        message (str) : Message to send, without footer
+        urgent (bool) : Send immediately instead of waiting for the window
+        '''
+        if urgent or self.window <= 0:
+            self.send(number, message + self.footer)
+            return
+        journal_id = self.journal.add('digest', number, message) if self.journal is not None else None
+        self.__hold(number, message, journal_id)
+
+    def __hold(self, number: str, message: str, journal_id):
+        key = normalize_number(number)
+        with self.lock:
+            if key not in self.pending:
+                self.pending[key] = (number, time.monotonic(), [], [])
+            self.pending[key][2].append(message)
+            if journal_id is not None:
+                self.pending[key][3].append(journal_id)
+
+    def flush(self, force: bool = False):
+        '''
+        Send the digests whose window has closed
+
+        Parameters:
+        force (bool) : Send all digests regardless of their window
+
+        Returns:
+        int : Number of digests sent
+        '''
+        now = time.monotonic()
+        with self.lock:
+            due = [key for key, (_, opened, _, _) in self.pending.items() if force or now - opened >= self.window]
+            digests = [self.pending.pop(key) for key in due]
+        for number, _, messages, journal_ids in digests:
+            self.send(number, '\n\n'.join(messages) + self.footer)
+            if journal_ids:
+                # Only once the digest is queued, so a crash in between sends it twice rather than never
+                self.journal.done(*journal_ids)
+            if len(messages) > 1:
+                logger.info('Coalesced SMS', extra={'number': number, 'messages': len(messages)})
+        return len(due)
@@ -0,0 +1,358 @@
+import dataclasses
+import logging
+import os
+from dataclasses import dataclass, field
+
+from .database import PRAGMAS
+from .decoders import DECODERS
+from .drivers import INDICATORS, CAMERAS, MODEMS, STORES
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = 'notifier.toml'
+
+class ConfigError(ValueError):
+    '''
+    Raised when the configuration cannot be read or is invalid
+    '''
+
+
+def setting(default, reload: bool = False, path: bool = False):
+    '''
+    Declare a configuration setting
+
+    Parameters:
+    default : Default value. Lists and dicts are copied for every config
+    reload (bool) : Applied on SIGHUP. Other settings need a restart
+    path (bool) : Relative paths are resolved against the directory of the configuration file
+    '''
+    metadata = {'reload': reload, 'path': path}
+    if isinstance(default, (list, dict)):
+        return field(default_factory=lambda: type(default)(default), metadata=metadata)
+    return field(default=default, metadata=metadata)
+
+
+@dataclass
+class LogConfig:
+    file: str = setting('attendance-notifier.log', path=True)
+    level: str = setting('INFO', reload=True)
+
+
+@dataclass
+class DatabaseConfig:
+    path: str = setting('attendance_notifier/db.sqlite3', path=True)
+    # `sqlite`, or `memory` to work on a copy that is never saved
+    store: str = setting('sqlite')
+    journal: str = setting('attendance-journal.jsonl', path=True)
+    # Queued SMS, kept until sent
+    sms_journal: str = setting('sms-journal.jsonl', path=True)
+    archive_dir: str = setting('attendance_notifier/archive', path=True)
+    archive_after_days: int = setting(180)
+    # e.g. {synchronous = 'NORMAL', cache_size = -8000}
+    pragmas: dict = setting({})
+
+
+@dataclass
+class CameraConfig:
+    driver: str = setting('opencv')
+    # Camera index or video file for `opencv`, image directory for `folder`
+    source: str = setting('0')
+    # Written by `python main.py autotune`
+    settings_file: str = setting('camera.json', path=True)
+    preview: bool = setting(True)
+    motion_threshold: float = setting(4, reload=True)
+    motion_hold: float = setting(2, reload=True)
+    idle_after: float = setting(10, reload=True)
+    idle_fps: float = setting(2, reload=True)
+    recheck: float = setting(5, reload=True)
+
+
+@dataclass
+class DecodeConfig:
+    decoder: str = setting('pyzbar', reload=True)
+    scan_timeout: float = setting(1, reload=True)
+    batch: bool = setting(False, reload=True)
+    batch_window: float = setting(0.5, reload=True)
+    batch_ttl: float = setting(5, reload=True)
+    debounce: float = setting(10, reload=True)
+
+
+@dataclass
+class SmsConfig:
+    driver: str = setting('sim808')
+    ports: list = setting(['/dev/ttyUSB0'])
+    coalesce_window: float = setting(300, reload=True)
+    footer: str = setting('\n\n\nThis is a generated message. Please do not reply!', reload=True)
+    min_interval: float = setting(5, reload=True)
+    max_attempts: int = setting(5, reload=True)
+    backoff: float = setting(30, reload=True)
+    max_backoff: float = setting(1800, reload=True)
+    poll_interval: float = setting(0.5, reload=True)
+
+
+@dataclass
+class LedConfig:
+    driver: str = setting('gpio')
+    # RGBY pins (R, G, B, Y), follows BCM pinout
+    pins: tuple = setting((18, 23, 24, 17))
+    accept_delay: float = setting(3, reload=True)
+    reject_delay: float = setting(1, reload=True)
+    repeat_delay: float = setting(0.3, reload=True)
+
+
+@dataclass
+class SyncConfig:
+    url: str = setting('')
+    token: str = setting('')
+
+
+@dataclass
+class Config:
+    '''
+    Settings of a classroom unit, one dataclass per TOML table
+    '''
+    log: LogConfig = field(default_factory=LogConfig)
+    database: DatabaseConfig = field(default_factory=DatabaseConfig)
+    camera: CameraConfig = field(default_factory=CameraConfig)
+    decode: DecodeConfig = field(default_factory=DecodeConfig)
+    sms: SmsConfig = field(default_factory=SmsConfig)
+    led: LedConfig = field(default_factory=LedConfig)
+    sync: SyncConfig = field(default_factory=SyncConfig)
+
+    def validate(self):
+        '''
+        Check the settings
+
+        Raises:
+        ConfigError : Every invalid setting
+        '''
+        errors = []
+        for section, setting_field, value in self.settings():
+            name = f'{section}.{setting_field.name}'
+            if setting_field.type in (int, float) and value < 0:
+                errors.append(f'{name} must not be negative')
+
+        if logging.getLevelName(self.log.level.upper()) not in range(0, 51):
+            errors.append(f'log.level {self.log.level} is not a logging level')
+        for name, value, drivers in (
+                ('database.store', self.database.store, STORES),
+                ('camera.driver', self.camera.driver, CAMERAS),
+                ('sms.driver', self.sms.driver, MODEMS),
+                ('led.driver', self.led.driver, INDICATORS)):
+            if value not in drivers:
+                errors.append(f'{name} {value} is not one of {", ".join(drivers)}')
+        for name in self.decode.decoder.split(','):
+            if name.strip() not in DECODERS:
+                errors.append(f'decode.decoder {name.strip()} is not one of {", ".join(DECODERS)}')
+        for name, value in self.database.pragmas.items():
+            if name not in PRAGMAS:
+                errors.append(f'database.pragmas {name} is not one of {", ".join(PRAGMAS)}')
+            elif not isinstance(value, int) and not str(value).isidentifier():
+                errors.append(f'database.pragmas {name} must be an integer or a keyword')
+        for name in ('camera.idle_fps', 'decode.scan_timeout', 'sms.max_attempts', 'sms.poll_interval'):
+            section, key = name.split('.')
+            if getattr(getattr(self, section), key) <= 0:
+                errors.append(f'{name} must be positive')
+        if len(self.led.pins) != 4:
+            errors.append('led.pins must be the 4 RGBY pins')
+        if not self.sms.ports:
+            errors.append('sms.ports must not be empty')
+        if self.sync.url and not self.sync.token:
+            errors.append('sync.token is needed with sync.url')
+        if errors:
+            raise ConfigError('Invalid configuration: ' + '; '.join(errors))
+
+    def settings(self):
+        '''
+        Iterate over every setting
+
+        Returns:
+        generator of tupple : (section name, dataclasses.Field, value)
+        '''
+        for section in dataclasses.fields(self):
+            values = getattr(self, section.name)
+            for setting_field in dataclasses.fields(values):
+                yield section.name, setting_field, getattr(values, setting_field.name)
+
+
+def _convert(value, kind: type, name: str):
+    '''
+    Convert a TOML or environment value to the type of a setting
+    '''
+    from_env = isinstance(value, str) and kind is not str
+    if kind is bool:
+        if from_env and value.lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if from_env and value.lower() in ('0', 'false', 'no', 'off', ''):
+            return False
+        if isinstance(value, bool):
+            return value
+    elif kind in (int, float):
+        if from_env:
+            try:
+                return kind(value)
+            except ValueError:
+                pass
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and (kind is float or isinstance(value, int)):
+            return kind(value)
+    elif kind is str:
+        # A camera index may be written as a number
+        if isinstance(value, (str, int)) and not isinstance(value, bool):
+            return str(value)
+    elif kind in (list, tuple):
+        items = [item.strip() for item in value.split(',') if item.strip()] if from_env else value
+        if isinstance(items, (list, tuple)):
+            if kind is tuple:
+                try:
+                    return tuple(int(item) for item in items)
+                except (TypeError, ValueError):
+                    pass
+            else:
+                return [str(item) for item in items]
+    elif kind is dict:
+        if from_env:
+            items = dict(item.split('=', 1) for item in value.split(',') if '=' in item)
+            return {key.strip(): int(item) if item.strip().lstrip('-').isdigit() else item.strip()
+                    for key, item in items.items()}
+        if isinstance(value, dict):
+            return value
+    raise ConfigError(f'{name} must be {kind.__name__}, got {value!r}')
+
+
+def load_config(path: str = None, environ = None):
+    '''
+    Load the configuration from a TOML file and environment variables
+
+    Every setting can be overridden by NOTIFIER_<TABLE>_<KEY>, e.g.
+    NOTIFIER_SMS_COALESCE_WINDOW=60. Settings that are not set keep their
+    defaults, so a missing file gives the default configuration.
+
+    Parameters:
+    path (str) : TOML file. NOTIFIER_CONFIG or notifier.toml if not given
+    environ (dict) : Environment variables. os.environ if not given
+
+    Returns:
+    Config : Validated configuration
+
+    Raises:
+    ConfigError : The file cannot be read or a setting is invalid
+    '''
+    environ = os.environ if environ is None else environ
+    path = path or environ.get('NOTIFIER_CONFIG', DEFAULT_PATH)
+    data = {}
+    if os.path.exists(path):
+        if tomllib is None:
+            raise ConfigError(f'Reading {path} needs Python 3.11 or the tomli package')
+        try:
+            with open(path, 'rb') as file:
+                data = tomllib.load(file)
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            raise ConfigError(f'Cannot read {path}: {e}') from e
+    base = os.path.dirname(os.path.abspath(path))
+
+    config = Config()
+    for section in dataclasses.fields(config):
+        table = data.pop(section.name, {})
+        if not isinstance(table, dict):
+            raise ConfigError(f'{section.name} must be a table')
+        values = getattr(config, section.name)
+        for setting_field in dataclasses.fields(values):
+            name = f'{section.name}.{setting_field.name}'
+            variable = f'NOTIFIER_{section.name}_{setting_field.name}'.upper()
+            if variable in environ:
+                value = environ[variable]
+            elif setting_field.name in table:
+                value = table[setting_field.name]
+            else:
+                value = getattr(values, setting_field.name)
+            table.pop(setting_field.name, None)
+            value = _convert(value, setting_field.type, name)
+            if setting_field.metadata['path'] and value:
+                value = os.path.join(base, os.path.expanduser(value))
+            setattr(values, setting_field.name, value)
+        if table:
+            raise ConfigError(f'Unknown settings {", ".join(section.name + "." + key for key in table)}')
+    if data:
+        raise ConfigError(f'Unknown tables {", ".join(data)}')
+    config.validate()
+    return config
+
+
+def apply_config(config: Config, machine, runtime = None):
+    '''
+    Apply the settings that can change while running
+
+    Parameters:
+    config (Config) : Configuration
+    machine (Notifier) : Notifier
+    runtime (NotifierRuntime) : Runtime of the notifier, if running
+    '''
+    logging.getLogger().setLevel(config.log.level.upper())
+
+    gate = machine.motion_gate
+    gate.threshold = config.camera.motion_threshold
+    gate.hold = config.camera.motion_hold
+    gate.idle_after = config.camera.idle_after
+    gate.idle_fps = config.camera.idle_fps
+    gate.recheck = config.camera.recheck
+
+    if config.decode.decoder != machine.decoder_name:
+        machine.set_decoder(config.decode.decoder)
+    machine.recent_codes.ttl = config.decode.batch_ttl
+
+    machine.coalescer.window = config.sms.coalesce_window
+    machine.coalescer.footer = config.sms.footer
+    outbox = machine.outbox
+    outbox.min_interval = config.sms.min_interval
+    outbox.max_attempts = config.sms.max_attempts
+    outbox.backoff = config.sms.backoff
+    outbox.max_backoff = config.sms.max_backoff
+
+    if runtime:
+        runtime.scan_timeout = config.decode.scan_timeout
+        runtime.batch = config.decode.batch
+        runtime.batch_window = config.decode.batch_window
+        runtime.recent_scans.ttl = config.decode.debounce
+        runtime.outbox_interval = config.sms.poll_interval
+        runtime.accept_delay = config.led.accept_delay
+        runtime.reject_delay = config.led.reject_delay
+        runtime.repeat_delay = config.led.repeat_delay
+
+
+def reload_config(config: Config, machine, runtime = None, path: str = None):
+    '''
+    Load the configuration again and apply what can change while running
+
+    An invalid file is logged and the current configuration is kept.
+
+    Parameters:
+    config (Config) : Current configuration
+    machine (Notifier) : Notifier
+    runtime (NotifierRuntime) : Runtime of the notifier, if running
+    path (str) : TOML file. NOTIFIER_CONFIG or notifier.toml if not given
+
+    Returns:
+    Config : Configuration in use
+    '''
+    try:
+        new = load_config(path)
+    except ConfigError as e:
+        logger.error('Configuration not reloaded', extra={'error': str(e)})
+        return config
+    restart = [f'{section}.{setting_field.name}'
+               for (section, setting_field, old), (_, _, value) in zip(config.settings(), new.settings())
+               if old != value and not setting_field.metadata['reload']]
+    if restart:
+        logger.warning('Restart to apply settings', extra={'settings': restart})
+    apply_config(new, machine, runtime)
+    logger.info('Configuration reloaded')
+    return new
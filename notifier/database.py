@@ -1,12 +1,233 @@
 import sqlite3
 import datetime
+import itertools
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
 
-class NotifierDatabase:
+from .punctuality import STATUSES, classify, school_year
+from .records import Schedule, Student, Teacher, Attendee, Absentee, StudentAttendance, parse_time
+
+# Pragmas that can be set from the configuration
+PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout', 'temp_store', 'wal_autocheckpoint')
+
+# Prepared statements kept per connection. Batch queries pass their keys as one
+# JSON array, so their SQL is the same for any number of keys and stays cached
+CACHED_STATEMENTS = 256
+
+# Names of shared in-memory databases
+_memory_databases = itertools.count()
+
+class Store(ABC):
+    '''
+    Base class of the databases a notifier runs on
+
+    Declares what the runtime needs to scan, record attendances, send end of
+    class reports and stay healthy. NotifierDatabase implements it on sqlite.
+    '''
+
+    @abstractmethod
+    def close(self):
+        '''
+        Close the store
+        '''
+
+    @abstractmethod
+    def reconnect(self):
+        '''
+        Reconnect the calling thread after a failure
+        '''
+
+    @abstractmethod
+    def check_writable(self):
+        '''
+        Check that the store can be written to
+
+        Raises:
+        sqlite3.Error : The store cannot be written to
+        '''
+
+    @abstractmethod
+    def set_pragmas(self, pragmas: dict):
+        '''
+        Tune the store
+
+        Parameters:
+        pragmas (dict) : Pragma name -> value
+        '''
+
+    @abstractmethod
+    def data_version(self):
+        '''
+        Get a number that changes whenever another connection commits
+
+        Returns:
+        int : Data version
+        '''
+
+    @abstractmethod
+    def get_entity_versions(self):
+        '''
+        Get the version of every entity, bumped when it is edited
+
+        Returns:
+        dict : Entity name -> version
+        '''
+
+    @abstractmethod
+    def get_schedules_on(self, day: int):
+        '''
+        Get the schedules of a day of the week
+
+        Parameters:
+        day (int) : Day of the week, 1 = Monday to 7 = Sunday
+
+        Returns:
+        list of Schedule : Schedules ordered by start
+        '''
+
+    @abstractmethod
+    def get_schedule_by_id(self, schedule_id):
+        '''
+        Get a schedule
+
+        Parameters:
+        schedule_id : Schedule ID
+
+        Returns:
+        Schedule | None : Schedule
+        '''
+
+    @abstractmethod
+    def get_all_students(self):
+        '''
+        Get every student
+
+        Returns:
+        list of Student : Students
+        '''
+
+    @abstractmethod
+    def get_students_by_lrns(self, lrns):
+        '''
+        Get the students of several LRNs
+
+        Parameters:
+        lrns (iterable of str) : LRNs
+
+        Returns:
+        dict : LRN -> Student, without unknown LRNs
+        '''
+
+    @abstractmethod
+    def get_teacher(self, teacher_id):
+        '''
+        Get a teacher
+
+        Parameters:
+        teacher_id : Teacher ID
+
+        Returns:
+        Teacher | None : Teacher
+        '''
+
+    @abstractmethod
+    def attendance_exists_many(self, keys):
+        '''
+        Check which attendances exist
+
+        Parameters:
+        keys (iterable of tupple) : (student_id, schedule_id, date)
+
+        Returns:
+        set of tupple : Keys with an attendance
+        '''
+
+    @abstractmethod
+    def add_attendance(self, student_id, schedule_id, date: datetime.date, time_in: datetime.time):
+        '''
+        Record an attendance
+
+        Parameters:
+        student_id : Student ID
+        schedule_id : Schedule ID
+        date (datetime.date) : Date
+        time_in (datetime.time) : Time in
+        '''
+
+    @abstractmethod
+    def add_attendances(self, attendances):
+        '''
+        Record several attendances at once, skipping the ones that exist
+
+        Parameters:
+        attendances (iterable of tupple) : (student_id, schedule_id, date, time_in)
+
+        Returns:
+        int : Number of attendances added
+        '''
+
+    @abstractmethod
+    def get_attendance(self, date: datetime.date, schedule_id):
+        '''
+        Get the attendees of a class
+
+        Parameters:
+        date (datetime.date) : Date
+        schedule_id : Schedule ID
+
+        Returns:
+        list of Attendee : Attendees
+        '''
+
+    @abstractmethod
+    def get_absents(self, date: datetime.date, schedule_id):
+        '''
+        Get the absentees of a class
+
+        Parameters:
+        date (datetime.date) : Date
+        schedule_id : Schedule ID
+
+        Returns:
+        list of Absentee : Absentees
+        '''
+
+    @abstractmethod
+    def report_exists(self, schedule_id, date: datetime.date):
+        '''
+        Check if the end of class report of a class was sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class starts
+
+        Returns:
+        bool : Sent
+        '''
+
+    @abstractmethod
+    def add_report(self, schedule_id, date: datetime.date):
+        '''
+        Mark the end of class report of a class as sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class starts
+        '''
+
+
+class NotifierDatabase(Store):
     '''
     Initialize a database for notifier class
-        
+
+    Every thread gets its own connection, opened on first use, so several
+    worker threads can query at the same time. Connections of `:memory:` share
+    one in-memory database.
+
     Parameters:
-    database (str): Path of sqlite database
+    database (str): Path of sqlite database, or `:memory:`
     '''
 
     def __init__(self, database):
@@ -14,10 +235,120 @@ class NotifierDatabase:
         Initialize a database for notifier class
             
         Parameters:
-        database (str) : Path of sqlite database
+        database (str) : Path of sqlite database, or `:memory:`
+        '''
+        self.path = database
+        if database == ':memory:':
+            self.uri = f'file:notifier-{next(_memory_databases)}?mode=memory&cache=shared'
+        else:
+            self.uri = None
+        self.pragmas = {}
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        # Opened right away so a bad path fails here. It also keeps an in-memory database alive
+        self.__connect()
+
+    def __connect(self):
+        if self.uri:
+            connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        else:
+            # Only used by this thread, but closed by `close` from any thread
+            connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        self.local.connection = connection
+        self.local.cursor = connection.cursor()
+        # One cursor per record type, each with its own row factory
+        self.local.record_cursors = {}
+        with self.lock:
+            self.connections.append(connection)
+        self.__apply_pragmas(self.pragmas)
+
+    def __local(self):
+        '''
+        Returns the thread local state, connecting the calling thread if needed
+        '''
+        if getattr(self.local, 'connection', None) is None:
+            self.__connect()
+        return self.local
+
+    @property
+    def database(self):
+        '''
+        sqlite3.Connection : Connection of the calling thread
+        '''
+        return self.__local().connection
+
+    @property
+    def cursor(self):
+        '''
+        sqlite3.Cursor : Cursor of the calling thread
+        '''
+        return self.__local().cursor
+
+    @property
+    def record_cursors(self):
+        return self.__local().record_cursors
+
+    def close(self):
+        '''
+        Close the connections of every thread
+        '''
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+        self.local = threading.local()
+
+    def reconnect(self):
+        '''
+        Close the connection of the calling thread and open it again with the
+        same pragmas. An in-memory database is kept, since reopening it would lose its rows
+        '''
+        if self.uri:
+            return
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            with self.lock:
+                if connection in self.connections:
+                    self.connections.remove(connection)
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        self.__connect()
+
+    def check_writable(self):
+        '''
+        Check that the database can be written to by taking the write lock
+        and releasing it without changing anything
+
+        Raises:
+        sqlite3.Error : The database is locked, read-only or corrupt
+        '''
+        if self.database.in_transaction:
+            return
+        self.cursor.execute('BEGIN IMMEDIATE')
+        self.database.rollback()
+
+    def __query(self, record, query: str, values = ()):
+        '''
+        Execute a query and return a cursor that builds records of the given type
+
+        Parameters:
+        record (type) : Record type with a `from_row` row factory
+        query (str) : SQL query
+        values (tupple) : Query parameters
+
+        Returns:
+        sqlite3.Cursor : Cursor that returns records
         '''
-        self.database = sqlite3.connect(database)
-        self.cursor = self.database.cursor()
+        cursor = self.record_cursors.get(record)
+        if cursor is None:
+            cursor = self.database.cursor()
+            cursor.row_factory = record.from_row
+            self.record_cursors[record] = cursor
+        cursor.execute(query, values)
+        return cursor
 
     def lrn_exists(self, lrn: str):
         '''
@@ -43,11 +374,10 @@ class NotifierDatabase:
         Get all existing schedules
 
         Returns:
-        list of tupple : (id, subject, start, end, teacher_id)
+        list of Schedule : (id, subject, start, end, teacher_id)
         '''
         query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule'
-        self.cursor.execute(query)
-        results = self.cursor.fetchall()
+        results = self.__query(Schedule, query).fetchall()
         return results
         
     def get_current_schedule(self):
@@ -55,13 +385,12 @@ class NotifierDatabase:
         Get schedule based on current date and time
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         now = datetime.datetime.now()
         query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? AND ? BETWEEN start and end'
         values = (now.date().weekday() + 1, now.time().strftime('%H:%M:%S'))
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Schedule, query, values).fetchone()
         return result
     
     def get_current_previous_schedule(self):
@@ -69,13 +398,12 @@ class NotifierDatabase:
         Get previous schedule based on current date and time
 
         Returns:
-        tupple : (id, id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         now = datetime.datetime.now()
         query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? AND end < ? ORDER BY end DESC'
         values = (now.date().weekday() + 1, now.time().strftime('%H:%M:%S'))
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Schedule, query, values).fetchone()
         return result
 
     def get_schedule(self, day: int, time: datetime.time):
@@ -87,12 +415,11 @@ class NotifierDatabase:
         time (datetime.time) : Time to check
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? AND ? BETWEEN start and end'
         values = (day, str(time))
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Schedule, query, values).fetchone()
         return result
     
     def get_previous_schedule(self, day: int, time: datetime.time):
@@ -104,14 +431,135 @@ class NotifierDatabase:
         time (datetime.time) : Time to check
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? AND end < ? ORDER BY end DESC'
         values = (day, str(time))
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Schedule, query, values).fetchone()
+        return result
+
+    def get_schedule_by_id(self, schedule_id):
+        '''
+        Get a schedule by primary key
+
+        Returns:
+        Schedule : (id, subject, start, end, teacher_id)
+        '''
+        query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE id = ?'
+        values = (schedule_id,)
+        result = self.__query(Schedule, query, values).fetchone()
+        return result
+
+    def get_next_schedule(self, day: int, time: datetime.time):
+        '''
+        Get the next schedule starting after the given day and time on the same day
+
+        Parameters:
+        day (int) : Day of the week (1 = Monday, 7 = Sunday)
+        time (datetime.time) : Time to check
+
+        Returns:
+        Schedule : (id, subject, start, end, teacher_id)
+        '''
+        query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? AND start > ? ORDER BY start'
+        values = (day, time.strftime('%H:%M:%S'))
+        result = self.__query(Schedule, query, values).fetchone()
         return result
 
+    def get_schedules_on(self, day: int):
+        '''
+        Get the schedules of a day of the week
+
+        Parameters:
+        day (int) : Day of the week (1 = Monday, 7 = Sunday)
+
+        Returns:
+        list of Schedule : (id, subject, start, end, teacher_id)
+        '''
+        query = 'SELECT id, subject, start, end, teacher_id FROM core_schedule WHERE day = ? ORDER BY start'
+        values = (day,)
+        results = self.__query(Schedule, query, values).fetchall()
+        return results
+
+    def report_exists(self, schedule_id, date: datetime.date):
+        '''
+        Check if the end of class report of a class was sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class started
+
+        Returns:
+        bool : Exists
+        '''
+        query = 'SELECT 1 FROM core_schedulereport WHERE schedule_id = ? AND date = ?'
+        values = (schedule_id, str(date))
+        self.cursor.execute(query, values)
+        return self.cursor.fetchone() is not None
+
+    def add_report(self, schedule_id, date: datetime.date):
+        '''
+        Mark the end of class report of a class as sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class started
+
+        Returns:
+        bool : False if it was already marked
+        '''
+        query = '''
+            INSERT INTO core_schedulereport(schedule_id, date, reported_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(schedule_id, date) DO NOTHING
+        '''
+        values = (schedule_id, str(date), datetime.datetime.now().isoformat(' '))
+        with self.database:
+            self.cursor.execute(query, values)
+        return self.cursor.rowcount == 1
+
+    def set_pragmas(self, pragmas: dict):
+        '''
+        Tune the connection, e.g. {'synchronous': 'NORMAL', 'cache_size': -8000}.
+        Applied to the connection of the calling thread and to every connection opened later
+
+        Parameters:
+        pragmas (dict) : Pragma name -> integer or keyword value. Names must be in PRAGMAS
+        '''
+        for name, value in pragmas.items():
+            if name not in PRAGMAS:
+                raise ValueError(f'Unsupported pragma {name}')
+            if not isinstance(value, int) and not str(value).isidentifier():
+                raise ValueError(f'Invalid value {value!r} for pragma {name}')
+        self.pragmas = dict(pragmas)
+        self.__apply_pragmas(self.pragmas)
+
+    def __apply_pragmas(self, pragmas: dict):
+        for name, value in pragmas.items():
+            self.cursor.execute(f'PRAGMA {name} = {value}')
+            self.cursor.fetchall()
+
+    def data_version(self):
+        '''
+        Get the sqlite data version. It changes whenever another connection commits,
+        so it is a cheap way to know if anything needs to be reloaded
+
+        Returns:
+        int : Data version
+        '''
+        self.cursor.execute('PRAGMA data_version')
+        return self.cursor.fetchone()[0]
+
+    def get_entity_versions(self):
+        '''
+        Get the version of every entity. A version is bumped whenever the entity changes
+
+        Returns:
+        dict : entity (`student`, `schedule` or `teacher`) -> version
+        '''
+        self.cursor.execute('SELECT entity, version FROM core_dataversion')
+        return dict(self.cursor.fetchall())
+
     def get_attendance(self, date: datetime.date, schedule_id):
         '''
         Get list of students who attend a subject on specific date
@@ -121,10 +569,10 @@ class NotifierDatabase:
         schedule_id : Schedule ID
 
         Returns:
-        tupple : (student_name, lrn, guardian_phone_number, time_in)
+        list of Attendee : (name, lrn, guardian_phone_number, time_in, status)
         '''
         query = '''
-            SELECT s.first_name || ' ' || s.last_name AS student_name, s.LRN, s.guardian_phone_number, a.time_in
+            SELECT s.first_name || ' ' || s.last_name AS student_name, s.LRN, s.guardian_phone_number, a.time_in, a.status
             FROM core_student s
             JOIN core_attendance a ON s.id = a.student_id
             JOIN core_schedule sch ON a.schedule_id = sch.id
@@ -132,8 +580,7 @@ class NotifierDatabase:
             AND a.schedule_id = ?
         '''
         values = (date, schedule_id)
-        self.cursor.execute(query, values)
-        results = self.cursor.fetchall()
+        results = self.__query(Attendee, query, values).fetchall()
         return results
     
     def get_absents(self, date : datetime.date, schedule_id):
@@ -145,7 +592,7 @@ class NotifierDatabase:
         schedule_id : Schedule ID
 
         Returns:
-        tupple : (student_name, lrn, guardian_phone_number)
+        list of Absentee : (name, lrn, guardian_phone_number)
         '''
         attendance_query = '''
             SELECT DISTINCT s.id
@@ -168,8 +615,7 @@ class NotifierDatabase:
             FROM core_student
             WHERE id IN ({});
         '''.format(', '.join('?' for _ in absent_students))
-        self.cursor.execute(absent_students_query, tuple(absent_students))
-        results = self.cursor.fetchall()
+        results = self.__query(Absentee, absent_students_query, tuple(absent_students)).fetchall()
         return results
     
     def attendance_exists(self, student_id, schedule_id, date: datetime.date):
@@ -198,7 +644,34 @@ class NotifierDatabase:
             return True
         else:
             return False
-        
+
+    def attendance_exists_many(self, keys):
+        '''
+        Check which of several attendances exist, in one query
+
+        Parameters:
+        keys (iterable of tupple) : (student_id, schedule_id, date)
+
+        Returns:
+        set of tupple : The given keys that exist
+        '''
+        keys = list(keys)
+        if not keys:
+            return set()
+        query = '''
+            SELECT k.key
+            FROM json_each(?) k
+            WHERE EXISTS (
+                SELECT 1 FROM core_attendance a
+                WHERE a.student_id = json_extract(k.value, '$[0]')
+                AND a.date = json_extract(k.value, '$[2]')
+                AND a.schedule_id = json_extract(k.value, '$[1]')
+            )
+        '''
+        values = (json.dumps([[student_id, schedule_id, str(date)] for student_id, schedule_id, date in keys]),)
+        self.cursor.execute(query, values)
+        return {keys[index] for index, in self.cursor.fetchall()}
+
     def add_attendance(self, student_id, schedule_id, date: datetime.date, time_in: datetime.time):
         '''
         Add attendance to database
@@ -211,51 +684,177 @@ class NotifierDatabase:
         Returns:
         bool : Success
         '''
-        query = 'INSERT INTO core_attendance(student_id, schedule_id, date, time_in) VALUES (?, ?, ?, ?)'
-        values = (student_id, schedule_id, date, str(time_in))
-        if self.attendance_exists(student_id, schedule_id, date):
-            return False
-        self.cursor.execute(query, values)
-        self.database.commit()
-        return True
-    
+        return self.add_attendances([(student_id, schedule_id, date, time_in)]) == 1
+
+    def add_attendances(self, attendances):
+        '''
+        Add several attendances in one transaction. Attendances that already exist are skipped
+
+        Every attendance is classified as on time, late or very late with the
+        thresholds of its schedule, and counted in the punctuality counters of
+        its term in the same transaction. Existing attendances are found with
+        one query and the rows are written with executemany, so the cost of a
+        batch barely depends on its size.
+
+        Parameters:
+        attendances (list of tupple) : (student_id, schedule_id, date, time_in)
+
+        Returns:
+        int : Number of attendances added
+        '''
+        insert = '''
+            INSERT INTO core_attendance(student_id, schedule_id, date, time_in, status)
+            VALUES (?, ?, ?, ?, ?)
+        '''
+        count = '''
+            INSERT INTO core_punctuality(term, student_id, schedule_id, on_time, late, very_late)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(term, student_id, schedule_id) DO UPDATE SET
+                on_time = on_time + excluded.on_time,
+                late = late + excluded.late,
+                very_late = very_late + excluded.very_late
+        '''
+        rows = {}
+        for student_id, schedule_id, date, time_in in attendances:
+            if isinstance(date, str):
+                date = datetime.date.fromisoformat(date)
+            if isinstance(time_in, str):
+                time_in = parse_time(time_in)
+            # The first attendance of a student in a class wins, like separate inserts would
+            rows.setdefault((student_id, schedule_id, date), time_in)
+        if not rows:
+            return 0
+        thresholds = self.__get_thresholds({schedule_id for _, schedule_id, _ in rows})
+        # Take the write lock before the existence check so no other writer can slip in between
+        if not self.database.in_transaction:
+            self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            existing = self.attendance_exists_many(rows)
+            added = []
+            counters = {}
+            for key, time_in in rows.items():
+                if key in existing:
+                    continue
+                student_id, schedule_id, date = key
+                status = None
+                if time_in is not None and schedule_id in thresholds:
+                    status = classify(time_in=time_in, **thresholds[schedule_id])
+                added.append((student_id, schedule_id, str(date), str(time_in) if time_in is not None else None, status))
+                if status:
+                    counter = counters.setdefault((school_year(date), student_id, schedule_id), [0] * len(STATUSES))
+                    counter[STATUSES.index(status)] += 1
+            self.cursor.executemany(insert, added)
+            self.cursor.executemany(count, [key + tuple(counter) for key, counter in counters.items()])
+            self.database.commit()
+        except BaseException:
+            self.database.rollback()
+            raise
+        return len(added)
+
+    def __get_thresholds(self, schedule_ids):
+        '''
+        Get the lateness thresholds of schedules
+
+        Returns:
+        dict : Schedule ID -> start, end, late_after and very_late_after
+        '''
+        schedule_ids = list(schedule_ids)
+        placeholders = ', '.join('?' for _ in schedule_ids)
+        query = f'SELECT id, start, end, late_after, very_late_after FROM core_schedule WHERE id IN ({placeholders})'
+        self.cursor.execute(query, schedule_ids)
+        return {id: {'start': parse_time(start), 'end': parse_time(end), 'late_after': late_after, 'very_late_after': very_late_after}
+                for id, start, end, late_after, very_late_after in self.cursor.fetchall()}
+
+    def get_student_attendance(self, student_id, date: datetime.date):
+        '''
+        Get the subjects a student attended on specific date
+
+        Parameters:
+        student_id: Student ID
+        date (datetime.date) : Date
+
+        Returns:
+        list of StudentAttendance : (subject, time_in)
+        '''
+        query = '''
+            SELECT sch.subject, a.time_in
+            FROM core_attendance a
+            JOIN core_schedule sch ON a.schedule_id = sch.id
+            WHERE a.student_id = ?
+            AND a.date = ?
+            ORDER BY a.time_in
+        '''
+        values = (student_id, date)
+        results = self.__query(StudentAttendance, query, values).fetchall()
+        return results
+
     def get_student(self, student_id):
         '''
         Get a student by primary key
 
         Returns:
-        tupple : (id, first_name, last_name, guardian_phone_number, LRN)
+        Student : (id, first_name, last_name, guardian_phone_number, LRN)
         '''
         query = 'SELECT id, first_name, last_name, guardian_phone_number, lrn FROM core_student WHERE id = ?'
         values = (student_id,)
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Student, query, values).fetchone()
         return result
     
+    def get_all_students(self):
+        '''
+        Get all students
+
+        Returns:
+        list of Student : (id, first_name, last_name, guardian_phone_number, LRN)
+        '''
+        query = 'SELECT id, first_name, last_name, guardian_phone_number, lrn FROM core_student'
+        results = self.__query(Student, query).fetchall()
+        return results
+
     def get_student_by_lrn(self, lrn: str):
         '''
         Get a student by lrn
 
         Returns:
-        tupple : (id, first_name, last_name, guardian_phone_number, LRN)
+        Student : (id, first_name, last_name, guardian_phone_number, LRN)
         '''
         query = 'SELECT id, first_name, last_name, guardian_phone_number, lrn FROM core_student WHERE lrn = ?'
         values = (lrn,)
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Student, query, values).fetchone()
         return result
     
+    def get_students_by_lrns(self, lrns):
+        '''
+        Get several students by lrn, in one query
+
+        Parameters:
+        lrns (iterable of str) : LRNs
+
+        Returns:
+        dict : LRN -> Student, only for the LRNs that exist
+        '''
+        lrns = list(lrns)
+        if not lrns:
+            return {}
+        query = '''
+            SELECT id, first_name, last_name, guardian_phone_number, lrn
+            FROM core_student
+            WHERE lrn IN (SELECT value FROM json_each(?))
+        '''
+        values = (json.dumps(lrns),)
+        results = self.__query(Student, query, values).fetchall()
+        return {student.lrn: student for student in results}
+
     def get_teacher(self, teacher_id):
         '''
         Get a teacher by primary key
 
         Returns:
-        tupple : (id, first_name, last_name, phone_number)
+        Teacher : (id, first_name, last_name, phone_number)
         '''
         query = 'SELECT id, first_name, last_name, phone_number FROM core_teacher WHERE id = ?'
         values = (teacher_id,)
-        self.cursor.execute(query, values)
-        result = self.cursor.fetchone()
+        result = self.__query(Teacher, query, values).fetchone()
         return result
     
     def get_all_attendance(self):
@@ -266,10 +865,260 @@ class NotifierDatabase:
         self.cursor.execute(query)
         results = self.cursor.fetchall()
         return results
+
+    def iter_attendance(self, start: datetime.date = None, end: datetime.date = None, schedule_id = None, batch_size: int = 500):
+        '''
+        Iterate over attendances without loading the whole table in memory
+
+        Parameters:
+        start (datetime.date) : First date to include. None for no lower bound
+        end (datetime.date) : Last date to include. None for no upper bound
+        schedule_id : Schedule ID. None for all schedules
+        batch_size (int) : Number of rows fetched from sqlite at a time
+
+        Returns:
+        generator of tupple : (date, time_in, lrn, student_name, subject, schedule_id)
+        '''
+        query = '''
+            SELECT a.date, a.time_in, s.lrn, s.first_name || ' ' || s.last_name AS student_name, sch.subject, a.schedule_id
+            FROM core_attendance a
+            JOIN core_student s ON a.student_id = s.id
+            JOIN core_schedule sch ON a.schedule_id = sch.id
+            WHERE 1 = 1
+        '''
+        values = []
+        if start:
+            query += ' AND a.date >= ?'
+            values.append(start)
+        if end:
+            query += ' AND a.date <= ?'
+            values.append(end)
+        if schedule_id:
+            query += ' AND a.schedule_id = ?'
+            values.append(schedule_id)
+        query += ' ORDER BY a.date, a.time_in'
+        # Use a dedicated cursor so other queries can run while iterating
+        cursor = self.database.cursor()
+        try:
+            cursor.execute(query, values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
     
+    def get_attendance_since(self, last_id: int, limit: int = 500):
+        '''
+        Get attendances added after an attendance, for syncing
+
+        Parameters:
+        last_id (int) : ID of the last attendance already synced
+        limit (int) : Maximum number of attendances returned
+
+        Returns:
+        list of tupple : (id, lrn, schedule_id, date, time_in), where schedule_id is the
+        id on the central server. None for schedules that were never synced
+        '''
+        query = '''
+            SELECT a.id, s.lrn, sch.server_id, a.date, a.time_in
+            FROM core_attendance a
+            LEFT JOIN core_student s ON a.student_id = s.id
+            LEFT JOIN core_schedule sch ON a.schedule_id = sch.id
+            WHERE a.id > ?
+            ORDER BY a.id
+            LIMIT ?
+        '''
+        values = (last_id, limit)
+        self.cursor.execute(query, values)
+        results = self.cursor.fetchall()
+        return results
+
+    def get_sync_high_water(self):
+        '''
+        Get the ID of the last attendance the central server has
+
+        Returns:
+        int | None : Attendance ID. None if the unit never synced
+        '''
+        self.cursor.execute('SELECT high_water FROM core_syncstate WHERE id = 1')
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def set_sync_high_water(self, high_water: int):
+        '''
+        Remember the ID of the last attendance the central server has
+
+        Parameters:
+        high_water (int) : Attendance ID
+        '''
+        # Stored in UTC like the Django project does
+        synced_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None).isoformat(' ')
+        self.cursor.execute('''
+            INSERT INTO core_syncstate (id, high_water, synced_at) VALUES (1, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET high_water = excluded.high_water, synced_at = excluded.synced_at
+        ''', (high_water, synced_at))
+        self.database.commit()
+
+    def update_roster(self, teachers, students, schedules, removed = None):
+        '''
+        Update teachers, students and schedules with the ones of the central server
+
+        Rows are matched by the id on the server, kept in `server_id`. A row not
+        seen before is matched with a local row of the same LRN, phone number of
+        the teacher, or day and time of the schedule, so the first sync never
+        overwrites a local row that happens to have the same id. Rows the server
+        did not send are kept. Only the ones in `removed` are deleted.
+
+        Parameters:
+        teachers (list) : (id, first_name, last_name, phone_number)
+        students (list) : (id, lrn, first_name, last_name, guardian_phone_number)
+        schedules (list) : (id, subject, day, start, end, teacher_id, late_after, very_late_after)
+        removed (dict) : teachers, students and schedules -> ids deleted on the server
+        '''
+        removed = removed or {}
+        tables = (
+            ('teachers', 'core_teacher', ('first_name', 'last_name', 'phone_number'), ('phone_number',), teachers),
+            ('students', 'core_student', ('lrn', 'first_name', 'last_name', 'guardian_phone_number'), ('lrn',), students),
+            ('schedules', 'core_schedule', ('subject', 'day', 'start', 'end', 'teacher_id', 'late_after', 'very_late_after'),
+             ('day', 'start', 'end'), schedules),
+        )
+        with self.database:
+            # Server id -> local id of the teachers, to point schedules at them
+            teacher_ids = {}
+            for name, table, columns, natural_key, rows in tables:
+                self.cursor.execute(
+                    f'DELETE FROM {table} WHERE server_id IN (SELECT value FROM json_each(?))',
+                    (json.dumps(removed.get(name, [])),))
+                names = ', '.join(f'"{column}"' for column in columns)
+                key_names = ', '.join(f'"{column}"' for column in natural_key)
+                self.cursor.execute(f'SELECT id, server_id, {key_names} FROM {table}')
+                synced = {}
+                unsynced = {}
+                for id, server_id, *key in self.cursor.fetchall():
+                    if server_id is None:
+                        unsynced[tuple(str(value) for value in key)] = id
+                    else:
+                        synced[server_id] = id
+                for server_id, *values in rows:
+                    if name == 'schedules':
+                        values[columns.index('teacher_id')] = teacher_ids.get(values[columns.index('teacher_id')])
+                    key = tuple(str(values[columns.index(column)]) for column in natural_key)
+                    id = synced.get(server_id)
+                    if id is None:
+                        id = unsynced.pop(key, None)
+                    if id is None:
+                        # Keep the id of the server when it is free, like a fresh unit would
+                        placeholders = ', '.join('?' for _ in columns)
+                        self.cursor.execute(f'''
+                            INSERT INTO {table} (id, server_id, {names})
+                            VALUES ((SELECT ? WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE id = ?)), ?, {placeholders})
+                        ''', (server_id, server_id, server_id, *values))
+                        id = self.cursor.lastrowid
+                    else:
+                        updates = ', '.join(f'"{column}" = ?' for column in columns)
+                        self.cursor.execute(f'UPDATE {table} SET server_id = ?, {updates} WHERE id = ?', (server_id, *values, id))
+                    if name == 'teachers':
+                        teacher_ids[server_id] = id
+            # Tell running scanners to reload, like the signals of the Django app do
+            for entity in ('teacher', 'student', 'schedule'):
+                self.cursor.execute('''
+                    INSERT INTO core_dataversion (entity, version) VALUES (?, 1)
+                    ON CONFLICT(entity) DO UPDATE SET version = version + 1
+                ''', (entity,))
+
+    def analyze(self, table: str = 'core_attendance'):
+        '''
+        Refresh the statistics sqlite keeps of a table, including its row count
+        used by the admin for estimated counts
+
+        Parameters:
+        table (str) : Table name
+        '''
+        self.cursor.execute(f'ANALYZE "{table}"')
+        self.database.commit()
+
     def truncate_attendances(self):
         '''
         Delete all records on attendance table
         '''
         query = 'DELETE FROM core_attendance'
-        self.cursor.execute(query)
\ No newline at end of file
+        self.cursor.execute(query)
+        self.database.commit()
+
+    def archive_attendances(self, cutoff: datetime.date, archive_dir: str, chunk_size: int = 500, term = None, max_id: int = None):
+        '''
+        Move one chunk of attendances older than cutoff to per-term archive databases
+
+        Rows are copied with their status, student and schedule details so the
+        history survives deletion of the student or schedule. Copying is idempotent, so a chunk
+        interrupted between the archive and the delete is simply archived again.
+
+        Parameters:
+        cutoff (datetime.date) : Attendances before this date are archived
+        archive_dir (str) : Directory where archive databases are stored
+        chunk_size (int) : Maximum number of attendances moved
+        term (callable) : Returns the archive name of a date. Defaults to school_year
+        max_id (int) : Only attendances up to this ID are archived, e.g. the ones the central server has
+
+        Returns:
+        int : Number of attendances moved. 0 when nothing is left to archive
+        '''
+        term = term or school_year
+        query = '''
+            SELECT a.id, a.date, a.time_in, a.student_id, a.schedule_id, s.lrn,
+                s.first_name || ' ' || s.last_name AS student_name, sch.subject, a.status
+            FROM core_attendance a
+            LEFT JOIN core_student s ON a.student_id = s.id
+            LEFT JOIN core_schedule sch ON a.schedule_id = sch.id
+            WHERE a.date < ? AND a.id <= ?
+            ORDER BY a.date
+            LIMIT ?
+        '''
+        cursor = self.database.cursor()
+        # The largest sqlite integer when every attendance may be archived
+        cursor.execute(query, (cutoff, max_id if max_id is not None else 2 ** 63 - 1, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        terms = {}
+        for row in rows:
+            date = datetime.date.fromisoformat(row[1])
+            terms.setdefault(term(date), []).append(row)
+
+        for name, term_rows in terms.items():
+            archive = sqlite3.connect(os.path.join(archive_dir, f'attendance-{name}.sqlite3'))
+            try:
+                archive.execute('''
+                    CREATE TABLE IF NOT EXISTS core_attendance (
+                        id INTEGER PRIMARY KEY,
+                        date DATE NOT NULL,
+                        time_in TIME,
+                        student_id INTEGER,
+                        schedule_id INTEGER,
+                        lrn TEXT,
+                        student_name TEXT,
+                        subject TEXT,
+                        status TEXT
+                    )
+                ''')
+                columns = {column[1] for column in archive.execute('PRAGMA table_info(core_attendance)')}
+                if 'status' not in columns:
+                    # Archived before attendances were classified
+                    archive.execute('ALTER TABLE core_attendance ADD COLUMN status TEXT')
+                archive.execute('CREATE INDEX IF NOT EXISTS core_attendance_date ON core_attendance (date)')
+                archive.executemany('''
+                    INSERT OR IGNORE INTO core_attendance
+                        (id, date, time_in, student_id, schedule_id, lrn, student_name, subject, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', term_rows)
+                archive.commit()
+            finally:
+                archive.close()
+
+        cursor.executemany('DELETE FROM core_attendance WHERE id = ?', [(row[0],) for row in rows])
+        self.database.commit()
+        cursor.close()
+        return len(rows)
\ No newline at end of file
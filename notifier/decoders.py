@@ -0,0 +1,265 @@
+import argparse
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from pyzbar import pyzbar
+except ImportError:
+    pyzbar = None
+
+logger = logging.getLogger(__name__)
+
+
+class DecodedCode(NamedTuple):
+    data: str
+    # Corners of the code in the frame, as a list of (x, y)
+    polygon: list
+
+
+class Decoder(ABC):
+    '''
+    Base class of QR code decoder backends
+
+    Subclasses set `name` and implement `decode`.
+    '''
+    name = None
+
+    @classmethod
+    def available(cls):
+        '''
+        Check whether the libraries the backend needs are installed
+
+        Returns:
+        bool : Whether the backend can be used
+        '''
+        return True
+
+    @abstractmethod
+    def decode(self, frame):
+        '''
+        Decode all QR codes in a frame
+
+        Parameters:
+        frame (numpy.ndarray) : BGR or grayscale frame
+
+        Returns:
+        list of DecodedCode : Decoded codes, empty if none were found
+        '''
+
+
+def _grayscale(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+class PyzbarDecoder(Decoder):
+    '''
+    ZBar based decoder. Fast on clean, well lit codes
+    '''
+    name = 'pyzbar'
+
+    @classmethod
+    def available(cls):
+        # Frames are converted to grayscale with OpenCV
+        return pyzbar is not None and cv2 is not None
+
+    def decode(self, frame):
+        codes = pyzbar.decode(_grayscale(frame), symbols=[pyzbar.ZBarSymbol.QRCODE])
+        return [DecodedCode(code.data.decode('utf-8'), [(point.x, point.y) for point in code.polygon]) for code in codes]
+
+
+class OpenCVDecoder(Decoder):
+    '''
+    Decoder using cv2.QRCodeDetector, which reads several codes per frame
+    '''
+    name = 'opencv'
+
+    @classmethod
+    def available(cls):
+        return cv2 is not None
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def decode(self, frame):
+        found, texts, points, _ = self.detector.detectAndDecodeMulti(_grayscale(frame))
+        if not found:
+            return []
+        return [DecodedCode(text, [tuple(map(int, point)) for point in corners])
+                for text, corners in zip(texts, points) if text]
+
+
+class WeChatDecoder(Decoder):
+    '''
+    Decoder using the CNN based WeChat detector of opencv-contrib-python
+
+    Much better on crumpled, blurry or small codes but slower. Without the
+    model files it falls back to the traditional detector of the library.
+
+    Parameters:
+    model_dir (str) : Directory of detect.prototxt, detect.caffemodel, sr.prototxt and sr.caffemodel
+    '''
+    name = 'wechat'
+
+    def __init__(self, model_dir: str = None):
+        '''
+        Decoder using the CNN based WeChat detector of opencv-contrib-python
+
+        Parameters:
+        model_dir (str) : Directory of detect.prototxt, detect.caffemodel, sr.prototxt and sr.caffemodel
+        '''
+        if model_dir:
+            files = [os.path.join(model_dir, name) for name in ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+            self.detector = cv2.wechat_qrcode_WeChatQRCode(*files)
+        else:
+            self.detector = cv2.wechat_qrcode_WeChatQRCode()
+
+    @classmethod
+    def available(cls):
+        return hasattr(cv2, 'wechat_qrcode_WeChatQRCode')
+
+    def decode(self, frame):
+        texts, points = self.detector.detectAndDecode(frame)
+        return [DecodedCode(text, [tuple(map(int, point)) for point in corners])
+                for text, corners in zip(texts, points) if text]
+
+
+class CascadeDecoder(Decoder):
+    '''
+    Try decoders in order and return the codes of the first one that finds any
+
+    Put the fastest decoder first so the slower, more robust ones only run on
+    frames it could not read.
+
+    Parameters:
+    decoders (list of Decoder) : Decoders, fastest first
+    '''
+    name = 'cascade'
+
+    def __init__(self, decoders: list):
+        '''
+        Try decoders in order and return the codes of the first one that finds any
+
+        Parameters:
+        decoders (list of Decoder) : Decoders, fastest first
+        '''
+        self.decoders = decoders
+
+    def decode(self, frame):
+        for decoder in self.decoders:
+            codes = decoder.decode(frame)
+            if codes:
+                return codes
+        return []
+
+
+DECODERS = {decoder.name: decoder for decoder in (PyzbarDecoder, OpenCVDecoder, WeChatDecoder)}
+
+
+def available_decoders():
+    '''
+    Get the names of the decoder backends that can be used
+
+    Returns:
+    list of str : Backend names
+    '''
+    return [name for name, decoder in DECODERS.items() if decoder.available()]
+
+
+def create_decoder(name: str):
+    '''
+    Create a decoder by name
+
+    Several comma separated names, e.g. `pyzbar,wechat`, create a cascade that
+    tries them in order. Backends that are not installed are left out of a
+    cascade but are an error when named alone.
+
+    Parameters:
+    name (str) : Backend name or comma separated names
+
+    Returns:
+    Decoder : Decoder
+    '''
+    names = [part.strip() for part in name.split(',') if part.strip()]
+    for part in names:
+        if part not in DECODERS:
+            raise ValueError(f'Unknown decoder {part}, expected one of {", ".join(DECODERS)}')
+    if len(names) == 1:
+        decoder = DECODERS[names[0]]
+        if not decoder.available():
+            raise RuntimeError(f'Decoder {names[0]} is not installed')
+        return decoder()
+    decoders = [DECODERS[part]() for part in names if DECODERS[part].available()]
+    if not decoders:
+        raise RuntimeError(f'None of the decoders {name} is installed')
+    return CascadeDecoder(decoders)
+
+
+def benchmark_decoders(path: str, decoders: dict, expected=None, limit: int = None):
+    '''
+    Compare decoders on recorded footage
+
+    Parameters:
+    path (str) : Video file, or image sequence pattern such as `frames/%04d.png`
+    decoders (dict) : Decoders by name
+    expected (set of str) : Data of the codes in the footage. Any data counts if not given
+    limit (int) : Maximum number of frames read
+
+    Returns:
+    dict : frames, decoded, decode_rate and ms_per_frame by decoder name
+    '''
+    frames = []
+    capture = cv2.VideoCapture(path)
+    while limit is None or len(frames) < limit:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        raise ValueError(f'No frames read from {path}')
+
+    results = {}
+    for name, decoder in decoders.items():
+        decoded = 0
+        start = time.perf_counter()
+        for frame in frames:
+            codes = decoder.decode(frame)
+            if any(not expected or code.data in expected for code in codes):
+                decoded += 1
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'frames': len(frames),
+            'decoded': decoded,
+            'decode_rate': decoded / len(frames),
+            'ms_per_frame': elapsed / len(frames) * 1000,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare QR code decoders on recorded footage')
+    parser.add_argument('footage', help='Video file or image sequence pattern')
+    parser.add_argument('--decoder', action='append', dest='decoders',
+                        help='Decoder or comma separated cascade to compare. Repeatable. All installed decoders if not given')
+    parser.add_argument('--expect', action='append', help='Data of a code in the footage. Repeatable')
+    parser.add_argument('--limit', type=int, help='Maximum number of frames read')
+    args = parser.parse_args(argv)
+
+    names = args.decoders or available_decoders()
+    decoders = {name: create_decoder(name) for name in names}
+    results = benchmark_decoders(args.footage, decoders, set(args.expect) if args.expect else None, args.limit)
+    print(f'{"decoder":<24} {"decoded":>12} {"rate":>7} {"ms/frame":>9}')
+    for name, result in sorted(results.items(), key=lambda item: item[1]['ms_per_frame']):
+        print(f'{name:<24} {result["decoded"]:>5}/{result["frames"]:<6} {result["decode_rate"]:>7.1%} {result["ms_per_frame"]:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+import datetime
+import itertools
+import os
+import random
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+
+from .camera import CameraSettings, open_camera
+from .database import NotifierDatabase, Store
+from .sim808 import Modem, Sim808, SmsError
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Colors of the RGBY LED, in the order of its pins
+COLORS = ('red', 'green', 'blue', 'yellow')
+
+
+class Indicator(ABC):
+    '''
+    Base class of status LED drivers
+
+    Subclasses set `name` and implement `show`.
+    '''
+    name = None
+
+    @abstractmethod
+    def show(self, color: str):
+        '''
+        Light the LED in one color
+
+        Parameters:
+        color (str) : `red`, `green`, `blue` or `yellow`. Anything else turns the LED off
+        '''
+
+    def off(self):
+        '''
+        Turn off the LED
+        '''
+        self.show(None)
+
+
+class GpioIndicator(Indicator):
+    '''
+    RGBY LED wired to the GPIO pins of a Raspberry Pi
+
+    Parameters:
+    pins (tupple) : RGBY pins (R, G, B, Y), follows BCM pinout
+    gpio (module) : Module with the RPi.GPIO API. RPi.GPIO if not given
+    '''
+    name = 'gpio'
+
+    def __init__(self, pins: tuple, gpio = None):
+        '''
+        RGBY LED wired to the GPIO pins of a Raspberry Pi
+
+        Parameters:
+        pins (tupple) : RGBY pins (R, G, B, Y), follows BCM pinout
+        gpio (module) : Module with the RPi.GPIO API. RPi.GPIO if not given
+        '''
+        if gpio is None:
+            # Only available on a Raspberry Pi
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.pins = pins
+        self.gpio.setwarnings(False)
+        self.gpio.setmode(self.gpio.BCM)
+        for pin in pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+
+    def show(self, color: str):
+        for pin_color, pin in zip(COLORS, self.pins):
+            self.gpio.output(pin, self.gpio.HIGH if pin_color == color else self.gpio.LOW)
+
+
+class MemoryIndicator(Indicator):
+    '''
+    LED that only remembers its color and counts the changes
+    '''
+    name = 'memory'
+
+    def __init__(self, pins: tuple = None):
+        self.color = None
+        self.changes = 0
+
+    def show(self, color: str):
+        color = color if color in COLORS else None
+        if color != self.color:
+            self.changes += 1
+        self.color = color
+
+
+class Camera(ABC):
+    '''
+    Base class of camera drivers other than cv2.VideoCapture, with the same API
+
+    Subclasses set `name` and implement `next_frame`. Reads are paced to the
+    configured FPS like a real camera.
+
+    Parameters:
+    fps (float) : Frames per second
+    '''
+    name = None
+
+    def __init__(self, fps: float = 15):
+        '''
+        Base class of camera drivers other than cv2.VideoCapture, with the same API
+
+        Parameters:
+        fps (float) : Frames per second
+        '''
+        self.fps = fps
+        self.frames = 0
+        self.last_read = 0
+
+    @abstractmethod
+    def next_frame(self):
+        '''
+        Get the next frame
+
+        Returns:
+        numpy.ndarray | None : BGR frame. None when there are no more frames
+        '''
+
+    def read(self):
+        delay = self.last_read + 1 / self.fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.last_read = time.monotonic()
+        frame = self.next_frame()
+        if frame is None:
+            return False, None
+        self.frames += 1
+        return True, frame
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        pass
+
+
+class FolderCamera(Camera):
+    '''
+    Camera that plays the images of a directory in name order, over and over
+
+    Parameters:
+    directory (str) : Directory of images, e.g. photos of QR code badges
+    fps (float) : Frames per second
+    '''
+    name = 'folder'
+
+    def __init__(self, directory: str, fps: float = 15):
+        '''
+        Camera that plays the images of a directory in name order, over and over
+
+        Parameters:
+        directory (str) : Directory of images, e.g. photos of QR code badges
+        fps (float) : Frames per second
+        '''
+        super().__init__(fps)
+        if cv2 is None:
+            raise RuntimeError('OpenCV is needed to read images')
+        # Decode the images once so reads cost as little as a real camera
+        images = (cv2.imread(os.path.join(directory, name)) for name in sorted(os.listdir(directory)))
+        self.images = [image for image in images if image is not None]
+        if not self.images:
+            raise ValueError(f'No images in {directory}')
+        self.cycle = itertools.cycle(self.images)
+
+    def next_frame(self):
+        return next(self.cycle)
+
+
+class MemoryCamera(Camera):
+    '''
+    Camera that plays frames from memory
+
+    Parameters:
+    frames (iterable) : Frames. Reads fail once they run out
+    fps (float) : Frames per second
+    '''
+    name = 'memory'
+
+    def __init__(self, frames = (), fps: float = 15):
+        '''
+        Camera that plays frames from memory
+
+        Parameters:
+        frames (iterable) : Frames. Reads fail once they run out
+        fps (float) : Frames per second
+        '''
+        super().__init__(fps)
+        self.source = iter(frames)
+
+    def next_frame(self):
+        return next(self.source, None)
+
+
+class MemoryModem(Modem):
+    '''
+    Modem with the Sim808 API that takes `send_time` seconds per SMS and fails some sends
+
+    Sent messages are kept in `outbox` and acknowledged by a delivery report.
+
+    Parameters:
+    port (str) : Name of the modem
+    send_time (float) : Seconds a send takes
+    failure_rate (float) : Fraction of sends that fail
+    '''
+    name = 'memory'
+
+    def __init__(self, port: str, send_time: float = 0, failure_rate: float = 0):
+        '''
+        Modem with the Sim808 API that takes `send_time` seconds per SMS and fails some sends
+
+        Parameters:
+        port (str) : Name of the modem
+        send_time (float) : Seconds a send takes
+        failure_rate (float) : Fraction of sends that fail
+        '''
+        self.port = port
+        self.send_time = send_time
+        self.failure_rate = failure_rate
+        self.random = random.Random(port)
+        self.references = itertools.count()
+        self.delivery_reports = []
+        # (number, message) of every sent SMS
+        self.outbox = []
+
+    @property
+    def sent(self):
+        return len(self.outbox)
+
+    def send_sms(self, number: str, message: str, timeout: float = 60):
+        time.sleep(self.send_time)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise SmsError('Simulated send failure')
+        reference = next(self.references) % 256
+        self.delivery_reports.append((reference, 0))
+        self.outbox.append((number, message))
+        return reference
+
+    def poll_delivery_reports(self):
+        reports, self.delivery_reports = self.delivery_reports, []
+        return reports
+
+    def poll_notifications(self):
+        return []
+
+    def read_unread_sms(self):
+        return ''
+
+    def list_sms(self, status: str = 'REC UNREAD'):
+        return []
+
+    def read_sms(self, index: int):
+        return None
+
+    def delete_sms(self, index: int):
+        pass
+
+    def delete_all_sms(self):
+        pass
+
+    def get_time(self):
+        return datetime.datetime.now()
+
+    def is_alive(self):
+        return True
+
+    def reconnect(self):
+        pass
+
+
+def open_sqlite_store(path: str):
+    '''
+    Open a sqlite database file
+
+    Parameters:
+    path (str) : Database path
+
+    Returns:
+    Store : Database
+    '''
+    return NotifierDatabase(path)
+
+
+def open_memory_store(path: str):
+    '''
+    Copy a sqlite database into memory. Nothing is written back to the file
+
+    Parameters:
+    path (str) : Database whose schema and rows are copied
+
+    Returns:
+    Store : In-memory database
+    '''
+    store = NotifierDatabase(':memory:')
+    source = sqlite3.connect(path)
+    try:
+        source.backup(store.database)
+    finally:
+        source.close()
+    return store
+
+
+INDICATORS = {indicator.name: indicator for indicator in (GpioIndicator, MemoryIndicator)}
+# MemoryCamera has no frames of its own, so it is only passed to a Notifier as `capture`
+CAMERAS = {'opencv': open_camera, FolderCamera.name: FolderCamera}
+MODEMS = {'sim808': Sim808, MemoryModem.name: MemoryModem}
+STORES = {'sqlite': open_sqlite_store, 'memory': open_memory_store}
+
+
+def _lookup(drivers: dict, kind: str, name: str):
+    if name not in drivers:
+        raise ValueError(f'Unknown {kind} driver {name}, expected one of {", ".join(drivers)}')
+    return drivers[name]
+
+
+def create_indicator(name: str, pins: tuple):
+    '''
+    Create a status LED driver by name
+
+    Parameters:
+    name (str) : `gpio` or `memory`
+    pins (tupple) : RGBY pins (R, G, B, Y), follows BCM pinout
+
+    Returns:
+    Indicator : LED driver
+    '''
+    return _lookup(INDICATORS, 'indicator', name)(pins)
+
+
+def create_camera(name: str, source = 0, settings: CameraSettings = None):
+    '''
+    Create a camera driver by name
+
+    Parameters:
+    name (str) : `opencv` or `folder`
+    source (int | str) : Camera index or video file for `opencv`, image directory for `folder`
+    settings (CameraSettings) : Capture settings. Only the FPS is used by `folder`
+
+    Returns:
+    cv2.VideoCapture | Camera : Opened camera
+    '''
+    driver = _lookup(CAMERAS, 'camera', name)
+    settings = settings or CameraSettings()
+    if name == 'opencv':
+        return driver(int(source) if str(source).isdigit() else source, settings)
+    return driver(source, settings.fps)
+
+
+def modem_factory(name: str):
+    '''
+    Get the callable that opens a modem driver on a port
+
+    Parameters:
+    name (str) : `sim808` or `memory`
+
+    Returns:
+    callable : Called as factory(port)
+    '''
+    return _lookup(MODEMS, 'modem', name)
+
+
+def open_store(name: str, path: str):
+    '''
+    Open a store driver by name
+
+    Parameters:
+    name (str) : `sqlite` or `memory`
+    path (str) : Database path. `memory` copies it into memory
+
+    Returns:
+    Store : Database
+    '''
+    return _lookup(STORES, 'store', name)(path)
@@ -0,0 +1,227 @@
+import logging
+import re
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# +CMTI: "SM",3
+CMTI_PATTERN = re.compile(r'\+CMTI:\s*"(\w+)",(\d+)')
+# +CMGL: 1,"REC UNREAD","+639171234567","","23/09/17,14:55:00+32"
+CMGL_PATTERN = re.compile(r'\+CMGL:\s*(\d+),"([^"]*)","([^"]*)",(?:"[^"]*")?,"([^"]*)"\r?\n')
+# +CMGR: "REC UNREAD","+639171234567","","23/09/17,14:55:00+32"
+CMGR_PATTERN = re.compile(r'\+CMGR:\s*"([^"]*)","([^"]*)",(?:"[^"]*")?,"([^"]*)"\r?\n')
+# +CDS: 6,123,"+639171234567",145,"23/09/17,14:55:00+32","23/09/17,14:55:05+32",0
+CDS_PATTERN = re.compile(r'\+CDS:\s*\d+,(\d+),[^\r\n]*,(\d+)\s*$', re.MULTILINE)
+
+
+class SmsMessage(NamedTuple):
+    '''
+    A stored SMS message
+    '''
+    index: int
+    status: str
+    sender: str
+    timestamp: str
+    text: str
+
+
+def parse_cmti(response: str):
+    '''
+    Get the storage indexes of new message notifications
+
+    Parameters:
+    response (str) : SIM808 response
+
+    Returns:
+    list of int : Indexes of new messages
+    '''
+    return [int(index) for _, index in CMTI_PATTERN.findall(response)]
+
+
+def parse_cds(response: str):
+    '''
+    Get the delivery reports in a response
+
+    Parameters:
+    response (str) : SIM808 response
+
+    Returns:
+    list of tupple : (message_reference, status)
+    '''
+    return [(int(reference), int(status)) for reference, status in CDS_PATTERN.findall(response)]
+
+
+def parse_cmgl(response: str):
+    '''
+    Parse the response of a `AT+CMGL` command
+
+    Parameters:
+    response (str) : SIM808 response
+
+    Returns:
+    list of SmsMessage : Listed messages
+    '''
+    matches = list(CMGL_PATTERN.finditer(response))
+    messages = []
+    for i, match in enumerate(matches):
+        # The body runs until the next header or the final result code
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(response)
+        text = _strip_result_code(response[match.end():end])
+        index, status, sender, timestamp = match.groups()
+        messages.append(SmsMessage(int(index), status, sender, timestamp, text))
+    return messages
+
+
+def parse_cmgr(index: int, response: str):
+    '''
+    Parse the response of a `AT+CMGR` command
+
+    Parameters:
+    index (int) : Storage index that was read
+    response (str) : SIM808 response
+
+    Returns:
+    SmsMessage | None : Message. None if the index is empty
+    '''
+    match = CMGR_PATTERN.search(response)
+    if not match:
+        return None
+    status, sender, timestamp = match.groups()
+    return SmsMessage(index, status, sender, timestamp, _strip_result_code(response[match.end():]))
+
+
+def _strip_result_code(text: str):
+    text = text.rstrip()
+    if text.endswith('OK'):
+        text = text[:-2]
+    return text.strip()
+
+
+def normalize_number(number: str):
+    '''
+    Normalize a Philippine phone number to its last 10 digits
+
+    Parameters:
+    number (str) : Phone number, e.g. `+639171234567` or `09171234567`
+
+    Returns:
+    str : Normalized number, e.g. `9171234567`
+    '''
+    return re.sub(r'\D', '', number)[-10:]
+
+
+class Inbox:
+    '''
+    Process incoming SMS commands
+
+    Commands are the first word of a message, e.g. `STATUS 123456789012`.
+    Handlers are called with the message and the remaining words and
+    return the reply to send, or None to send nothing.
+
+    Parameters:
+    gsm (Sim808) : SIM808 module
+    send (callable) : Called as send(number, message) to reply. Defaults to gsm.send_sms
+    '''
+
+    def __init__(self, gsm, send = None):
+        '''
+        Process incoming SMS commands
+
+        Parameters:
+        gsm (Sim808) : SIM808 module
+        send (callable) : Called as send(number, message) to reply. Defaults to gsm.send_sms
+        '''
+        self.gsm = gsm
+        self.send = send or gsm.send_sms
+        self.handlers = {}
+        # Set when a message could not be read, so unread messages are listed again
+        self.relist = False
+
+    def register(self, command: str, handler):
+        '''
+        Register a command handler
+
+        Parameters:
+        command (str) : Command word. Case insensitive
+        handler (callable) : Called as handler(message, args). Returns reply text or None
+        '''
+        self.handlers[command.upper()] = handler
+
+    def process(self):
+        '''
+        Read, dispatch and delete newly received messages
+
+        Only messages announced by `+CMTI` are read, so this is cheap to call
+        on every loop iteration. After a failed read, every unread message is
+        listed on the next call instead, so none is left behind.
+
+        Returns:
+        int : Number of messages processed
+        '''
+        messages = self.receive()
+        for message in messages:
+            self.dispatch(message)
+        return len(messages)
+
+    def receive(self):
+        '''
+        Read and delete newly received messages without dispatching them
+
+        Returns:
+        list of SmsMessage : Received messages
+        '''
+        messages = []
+        indexes = self.gsm.poll_notifications()
+        if self.relist:
+            # Unread messages stay on the SIM, so the listing also covers the notified ones
+            try:
+                listed = self.gsm.list_sms('REC UNREAD')
+            except Exception as e:
+                logger.warning('Listing SMS failed', extra={'error': str(e)})
+                return messages
+            self.relist = False
+            for message in listed:
+                messages.append(message)
+                self.__delete(message.index)
+            return messages
+        for index in indexes:
+            try:
+                message = self.gsm.read_sms(index)
+            except Exception as e:
+                logger.warning('Reading SMS failed', extra={'index': index, 'error': str(e)})
+                self.relist = True
+                continue
+            if message:
+                messages.append(message)
+            self.__delete(index)
+        return messages
+
+    def __delete(self, index: int):
+        try:
+            self.gsm.delete_sms(index)
+        except Exception as e:
+            # Left on the SIM until it is full. Read messages are not listed again
+            logger.warning('Deleting SMS failed', extra={'index': index, 'error': str(e)})
+
+    def dispatch(self, message: SmsMessage):
+        '''
+        Call the handler of a message command and send its reply
+
+        Parameters:
+        message (SmsMessage) : Received message
+        '''
+        words = message.text.split()
+        if not words:
+            return
+        handler = self.handlers.get(words[0].upper())
+        if not handler:
+            logger.info('Ignored SMS', extra={'sender': message.sender, 'command': words[0][:20]})
+            return
+        try:
+            reply = handler(message, words[1:])
+        except Exception:
+            logger.exception('SMS command failed', extra={'sender': message.sender, 'command': words[0].upper()})
+            return
+        if reply:
+            self.send(message.sender, reply)
+        logger.info('Processed SMS command', extra={'sender': message.sender, 'command': words[0].upper()})
@@ -0,0 +1,240 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Errors that saving the same attendance again would raise again, e.g. a
+# constraint violation or a malformed record. Any other error means the
+# database is still unavailable
+PERMANENT_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, ValueError, TypeError)
+
+class AttendanceJournal:
+    '''
+    Append-only file of attendances that could not be saved to the database
+
+    Every attendance is flushed to disk before `append` returns, so scans
+    survive a crash or power loss. `replay` saves journaled attendances once
+    the database is back and keeps only the ones that still fail. Attendances
+    that can never be saved are moved to a dead letter file with their error,
+    so they do not hold up the others.
+
+    Parameters:
+    path (str) : Journal file path
+    dead_letter (str) : File of attendances that can never be saved. Next to the journal if not given
+    '''
+
+    def __init__(self, path: str, dead_letter: str = None):
+        '''
+        Append-only file of attendances that could not be saved to the database
+
+        Parameters:
+        path (str) : Journal file path
+        dead_letter (str) : File of attendances that can never be saved. Next to the journal if not given
+        '''
+        self.path = path
+        root, extension = os.path.splitext(path)
+        self.dead_letter = dead_letter or f'{root}.dead{extension or ".jsonl"}'
+        self.lock = threading.Lock()
+        self.keys = set()
+        for student_id, schedule_id, date, _ in self.__read():
+            self.keys.add((student_id, schedule_id, date))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def append(self, student_id, schedule_id, date, time_in: str):
+        '''
+        Journal an attendance
+
+        Parameters:
+        student_id: Student ID
+        schedule_id : Schedule ID
+        date (datetime.date | str) : Date
+        time_in (str) : Time in
+        '''
+        record = [student_id, schedule_id, str(date), time_in]
+        with self.lock:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.keys.add((student_id, schedule_id, str(date)))
+
+    def replay(self, save):
+        '''
+        Save journaled attendances and remove the ones that succeeded
+
+        Parameters:
+        save (callable) : Called as save(student_id, schedule_id, date, time_in). Raises on failure
+
+        Returns:
+        int : Number of attendances saved
+        '''
+        with self.lock:
+            records = self.__read()
+            remaining = []
+            dead = []
+            for i, record in enumerate(records):
+                try:
+                    student_id, schedule_id, date, time_in = record
+                    save(student_id, schedule_id, datetime.date.fromisoformat(date), time_in)
+                except PERMANENT_ERRORS as e:
+                    logger.error('Journaled attendance cannot be saved', extra={'attendance': record, 'error': str(e)})
+                    dead.append({'attendance': record, 'error': f'{type(e).__name__}: {e}'})
+                except Exception:
+                    # The database is still unavailable, keep the rest for later
+                    remaining = records[i:]
+                    break
+            saved = len(records) - len(remaining) - len(dead)
+            if dead:
+                self.__append_dead_letters(dead)
+            if saved or dead:
+                self.__rewrite(remaining)
+                self.keys = {(record[0], record[1], record[2]) for record in remaining}
+                logger.info('Replayed journaled attendances', extra={'saved': saved, 'dead': len(dead), 'remaining': len(remaining)})
+            return saved
+
+    def __read(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A partial line left by a power loss
+                    logger.warning('Skipped corrupt journal line', extra={'path': self.path})
+        return records
+
+    def __append_dead_letters(self, dead):
+        with open(self.dead_letter, 'a') as file:
+            for letter in dead:
+                file.write(json.dumps(letter) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __rewrite(self, records):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            for record in records:
+                file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+
+class SmsJournal:
+    '''
+    Append-only file of SMS messages that were queued but not sent yet
+
+    Messages are flushed to disk before they are queued and marked done once
+    they are sent or given up on, so a restart or crash never loses them.
+    Messages held by the coalescer are journaled as `digest` entries, messages
+    in the outbox as `sms` entries. When opened, the file is rewritten with
+    the pending messages only, and it is emptied once none are pending.
+
+    Parameters:
+    path (str) : Journal file path
+    '''
+
+    def __init__(self, path: str):
+        '''
+        Append-only file of SMS messages that were queued but not sent yet
+
+        Parameters:
+        path (str) : Journal file path
+        '''
+        self.path = path
+        self.lock = threading.Lock()
+        # id -> {'id', 'kind', 'number', 'message'} of pending messages
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A partial line left by a power loss
+                        logger.warning('Skipped corrupt journal line', extra={'path': path})
+                        continue
+                    if 'done' in record:
+                        for entry_id in record['done']:
+                            self.entries.pop(entry_id, None)
+                    else:
+                        self.entries[record['id']] = record
+        self.next_id = max(self.entries, default=0) + 1
+        with self.lock:
+            self.__rewrite()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def pending(self, kind: str):
+        '''
+        Get the pending messages of a kind in the order they were added
+
+        Parameters:
+        kind (str) : `sms` or `digest`
+
+        Returns:
+        list of dict : Entries with id, kind, number and message
+        '''
+        with self.lock:
+            return [entry for _, entry in sorted(self.entries.items()) if entry['kind'] == kind]
+
+    def add(self, kind: str, number: str, message: str):
+        '''
+        Journal a message
+
+        Parameters:
+        kind (str) : `sms` or `digest`
+        number (str) : Number to send message to
+        message (str) : Message to send
+
+        Returns:
+        int : Id of the entry, passed to `done` once the message is sent
+        '''
+        with self.lock:
+            entry = {'id': self.next_id, 'kind': kind, 'number': number, 'message': message}
+            self.next_id += 1
+            self.__append(entry)
+            self.entries[entry['id']] = entry
+            return entry['id']
+
+    def done(self, *ids):
+        '''
+        Mark messages as sent or given up on
+
+        Parameters:
+        ids (int) : Ids returned by `add`
+        '''
+        with self.lock:
+            for entry_id in ids:
+                self.entries.pop(entry_id, None)
+            if self.entries:
+                self.__append({'done': list(ids)})
+            else:
+                self.__rewrite()
+
+    def __append(self, record):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __rewrite(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
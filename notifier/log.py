@@ -0,0 +1,164 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Attributes every LogRecord has. Anything else was passed through `extra`
+RESERVED_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Format log records as one JSON object per line
+
+    Fields passed with `extra` are added to the object, so
+    `logger.info('SMS sent', extra={'number': number})` becomes
+    `{"time": ..., "level": "INFO", "logger": ..., "message": "SMS sent", "number": ...}`
+    '''
+
+    def format(self, record: logging.LogRecord):
+        '''
+        Format a log record
+
+        Parameters:
+        record (logging.LogRecord) : Record to format
+
+        Returns:
+        str : JSON encoded record
+        '''
+        event = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRIBUTES and not key.startswith('_'):
+                event[key] = value
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Drop repeats of the same warning or error beyond `burst` per `interval` seconds
+
+    A task failing in a loop logs the same record, with a traceback, over and
+    over and fills the SD card. Records are grouped by logger, level, message
+    and exception type. The first record let through after some were dropped
+    carries their number in `suppressed`. Info and debug records always pass.
+
+    Parameters:
+    burst (int) : Records of a group let through per interval
+    interval (float) : Seconds of an interval
+    '''
+
+    def __init__(self, burst: int = 5, interval: float = 60):
+        '''
+        Drop repeats of the same warning or error beyond `burst` per `interval` seconds
+
+        Parameters:
+        burst (int) : Records of a group let through per interval
+        interval (float) : Seconds of an interval
+        '''
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # group -> [interval start, records let through, records dropped]
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg, record.exc_info[0] if record.exc_info else None)
+        now = time.monotonic()
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None or now - group[0] >= self.interval:
+                if len(self.groups) > 1000:
+                    self.groups.clear()
+                suppressed = group[2] if group else 0
+                group = self.groups[key] = [now, 0, suppressed]
+            if group[1] >= self.burst:
+                group[2] += 1
+                return False
+            group[1] += 1
+            if group[2]:
+                record.suppressed = group[2]
+                group[2] = 0
+        return True
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    '''
+    Put log records on a queue read by a listener in the same process
+
+    QueueHandler formats the record before queueing it and drops `exc_info`,
+    because a traceback cannot be pickled for another process. Here the
+    traceback is kept, so the listener's formatter writes it to `exception`.
+    '''
+
+    def prepare(self, record: logging.LogRecord):
+        '''
+        Merge the arguments into the message of a copy of a record
+
+        Parameters:
+        record (logging.LogRecord) : Record to queue
+
+        Returns:
+        logging.LogRecord : Copy of the record with its message merged and its exception kept
+        '''
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def setup_logging(filename: str, level = 'INFO', max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5, when: str = None,
+                  burst: int = 5, interval: float = 60):
+    '''
+    Log to a rotating JSON lines file from a background thread
+
+    Records are put on a queue by the calling thread and written to disk by a
+    QueueListener, so logging never blocks scanning on SD card writes.
+    Tracebacks are formatted by the listener too.
+
+    Parameters:
+    filename (str) : Log file path
+    level (str | int) : Minimum level logged
+    max_bytes (int) : Size at which the log file is rotated
+    backup_count (int) : Number of rotated log files kept
+    when (str) : Rotate by time instead of size, e.g. `midnight`. See TimedRotatingFileHandler
+    burst (int) : Repeats of the same warning or error logged per `interval`. See RateLimitFilter
+    interval (float) : Seconds over which repeated warnings and errors are limited
+
+    Returns:
+    logging.handlers.QueueListener : Running listener. Stopped automatically at exit
+    '''
+    if when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backup_count)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    queue_handler = LocalQueueHandler(log_queue)
+    # Dropped in the calling thread, before formatting the traceback
+    queue_handler.addFilter(RateLimitFilter(burst, interval))
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,354 @@
+import logging
+import threading
+import time
+
+from .sim808 import Sim808, SmsError, ModemUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Message references and storage indexes of modem `i` are reported as `i * TAG + value`
+TAG = 100000
+
+class PooledModem:
+    '''
+    A modem of a pool with its health and throughput counters
+
+    Parameters:
+    port (str) : Serial port of SIM808 module
+    gsm (Sim808 | None) : SIM808 module. None if it could not be opened yet
+    '''
+
+    def __init__(self, port: str, gsm):
+        '''
+        A modem of a pool with its health and throughput counters
+
+        Parameters:
+        port (str) : Serial port of SIM808 module
+        gsm (Sim808 | None) : SIM808 module. None if it could not be opened yet
+        '''
+        self.port = port
+        self.gsm = gsm
+        self.lock = threading.Lock()
+        self.healthy = gsm is not None
+        self.failures = 0
+        self.retry_at = 0
+        self.cooldown = 0
+        self.sending = 0
+        # Monotonic time the current send started. None when not sending
+        self.busy_since = None
+        self.sent = 0
+        self.failed = 0
+        self.send_time = 0.0
+
+
+class ModemPool:
+    '''
+    Send SMS messages through several SIM808 modules in parallel
+
+    The pool has the same API as Sim808. Every send goes to the healthy modem
+    with the fewest messages in flight. A modem that fails `max_failures` sends
+    in a row, or cannot be opened, is taken out of the pool. It is checked
+    again after `cooldown` seconds and reconnected if it does not answer,
+    doubling the wait after every failed attempt up to `max_cooldown`.
+
+    Parameters:
+    ports (list of str) : Serial ports of SIM808 modules
+    max_failures (int) : Consecutive failed sends before a modem is taken out
+    cooldown (float) : Seconds before a failed modem is checked again
+    max_cooldown (float) : Maximum seconds between reconnection attempts
+    factory (callable) : Called as factory(port) to open a SIM808 module. Sim808 if not given
+    '''
+
+    def __init__(self, ports, max_failures: int = 3, cooldown: float = 10, max_cooldown: float = 300, factory = None):
+        '''
+        Send SMS messages through several SIM808 modules in parallel
+
+        Parameters:
+        ports (list of str) : Serial ports of SIM808 modules
+        max_failures (int) : Consecutive failed sends before a modem is taken out
+        cooldown (float) : Seconds before a failed modem is checked again
+        max_cooldown (float) : Maximum seconds between reconnection attempts
+        factory (callable) : Called as factory(port) to open a SIM808 module. Sim808 if not given
+        '''
+        self.factory = factory or Sim808
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+        self.modems = []
+        for port in ports:
+            try:
+                modem = PooledModem(port, self.factory(port))
+            except Exception:
+                # Keep the port so it is connected once the module is plugged in
+                logger.exception('Modem not available', extra={'port': port})
+                modem = PooledModem(port, None)
+                self.__take_out(modem)
+            self.modems.append(modem)
+
+    def __len__(self):
+        return len(self.modems)
+
+    def send_sms(self, number: str, message: str):
+        '''
+        Send a SMS message through the least busy healthy modem
+
+        Parameters:
+        number (str) : Number to send message to. Should contain country code
+        message (str) : Message to send
+
+        Returns:
+        int : Message reference, matched by delivery reports
+
+        Raises:
+        SmsError : The modem failed or no modem is healthy
+        '''
+        i, modem = self.__acquire()
+        start = time.monotonic()
+        modem.busy_since = start
+        try:
+            reference = modem.gsm.send_sms(number, message)
+        except Exception as e:
+            modem.failed += 1
+            modem.failures += 1
+            if modem.failures >= self.max_failures:
+                self.__take_out(modem)
+            if isinstance(e, SmsError):
+                raise
+            raise SmsError(f'Sending SMS failed: {e}') from e
+        finally:
+            modem.send_time += time.monotonic() - start
+            modem.busy_since = None
+            modem.lock.release()
+            with self.lock:
+                modem.sending -= 1
+        modem.sent += 1
+        modem.failures = 0
+        return i * TAG + reference
+
+    def __acquire(self):
+        '''
+        Reserve the least busy healthy modem. Returns with the modem lock held
+        '''
+        self.check_health()
+        with self.lock:
+            candidates = [(i, modem) for i, modem in enumerate(self.modems) if modem.healthy]
+            if not candidates:
+                raise ModemUnavailable('No healthy modem available')
+            i, modem = min(candidates, key=lambda candidate: (candidate[1].sending, candidate[1].sent))
+            modem.sending += 1
+        modem.lock.acquire()
+        return i, modem
+
+    def __take_out(self, modem: PooledModem):
+        modem.healthy = False
+        modem.cooldown = self.cooldown
+        modem.retry_at = time.monotonic() + modem.cooldown
+        logger.error('Modem taken out of pool', extra={'port': modem.port, 'failures': modem.failures})
+
+    def check_health(self):
+        '''
+        Put modems that were taken out back in the pool once they answer again,
+        reconnecting them if needed
+        '''
+        now = time.monotonic()
+        for modem in self.modems:
+            if modem.healthy or modem.retry_at > now:
+                continue
+            if not modem.lock.acquire(blocking=False):
+                continue
+            try:
+                if modem.gsm and modem.gsm.is_alive():
+                    alive = True
+                else:
+                    alive = self.__reconnect(modem)
+                if alive:
+                    modem.healthy = True
+                    modem.failures = 0
+                    logger.info('Modem back in pool', extra={'port': modem.port})
+                else:
+                    modem.cooldown = min(modem.cooldown * 2, self.max_cooldown)
+                    modem.retry_at = now + modem.cooldown
+            finally:
+                modem.lock.release()
+
+    def heartbeat(self, stuck_after: float = 120):
+        '''
+        Send AT to every idle healthy modem and take out the ones that do not
+        answer, so `check_health` reconnects them
+
+        Parameters:
+        stuck_after (float) : Seconds a send may take before its modem counts as stuck
+
+        Returns:
+        list of str : Ports of modems stuck in a send, most likely blocked on a serial read
+        '''
+        stuck = []
+        now = time.monotonic()
+        for modem in self.modems:
+            if not modem.healthy or not modem.gsm:
+                continue
+            if not modem.lock.acquire(blocking=False):
+                busy_since = modem.busy_since
+                if busy_since is not None and now - busy_since > stuck_after:
+                    stuck.append(modem.port)
+                continue
+            try:
+                alive = modem.gsm.is_alive()
+            except Exception:
+                alive = False
+            finally:
+                modem.lock.release()
+            if not alive:
+                logger.warning('Modem did not answer heartbeat', extra={'port': modem.port})
+                self.__take_out(modem)
+        return stuck
+
+    def __reconnect(self, modem: PooledModem):
+        try:
+            if modem.gsm:
+                modem.gsm.reconnect()
+            else:
+                modem.gsm = self.factory(modem.port)
+            return True
+        except Exception as e:
+            logger.warning('Reconnecting modem failed', extra={'port': modem.port, 'error': str(e), 'retry_in': modem.cooldown * 2})
+            return False
+
+    def stats(self):
+        '''
+        Get the throughput of every modem
+
+        Returns:
+        list of dict : port, healthy, sent, failed and messages_per_minute of every modem
+        '''
+        return [{
+            'port': modem.port,
+            'healthy': modem.healthy,
+            'sent': modem.sent,
+            'failed': modem.failed,
+            'messages_per_minute': modem.sent * 60 / modem.send_time if modem.send_time else 0.0,
+        } for modem in self.modems]
+
+    def poll_notifications(self):
+        '''
+        Get the storage indexes of sms received since the last call
+
+        Returns:
+        list of int : Tagged storage indexes
+        '''
+        return [i * TAG + index for i, index in self.__collect('poll_notifications')]
+
+    def poll_delivery_reports(self):
+        '''
+        Get the delivery reports received since the last call
+
+        Returns:
+        list of tupple : (tagged message_reference, status)
+        '''
+        return [(i * TAG + reference, status) for i, (reference, status) in self.__collect('poll_delivery_reports')]
+
+    def list_sms(self, status: str = 'REC UNREAD'):
+        '''
+        Get stored sms of every modem
+
+        Parameters:
+        status (str) : `REC UNREAD`, `REC READ`, `STO UNSENT`, `STO SENT` or `ALL`
+
+        Returns:
+        list of SmsMessage : Stored sms with their tagged indexes
+        '''
+        messages = []
+        for i, modem in enumerate(self.modems):
+            if not modem.gsm:
+                continue
+            with modem.lock:
+                listed = modem.gsm.list_sms(status)
+            messages.extend(message._replace(index=i * TAG + message.index) for message in listed)
+        return messages
+
+    def read_sms(self, index: int):
+        '''
+        Get a stored sms
+
+        Parameters:
+        index (int) : Tagged storage index
+
+        Returns:
+        SmsMessage | None : Stored sms with its tagged index. None if the index is empty
+        '''
+        modem = self.modems[index // TAG]
+        with modem.lock:
+            message = modem.gsm.read_sms(index % TAG)
+        return message._replace(index=index) if message else None
+
+    def delete_sms(self, index: int):
+        '''
+        Delete a stored sms
+
+        Parameters:
+        index (int) : Tagged storage index
+        '''
+        modem = self.modems[index // TAG]
+        with modem.lock:
+            modem.gsm.delete_sms(index % TAG)
+
+    def read_unread_sms(self):
+        '''
+        Get unread sms of every modem
+
+        Returns:
+        sms (str): unread sms
+        '''
+        responses = []
+        for modem in self.modems:
+            if not modem.gsm:
+                continue
+            with modem.lock:
+                responses.append(modem.gsm.read_unread_sms())
+        return ''.join(responses)
+
+    def get_time(self):
+        '''
+        Get network date and time from the first healthy modem
+
+        Returns:
+        datetime (str) : Network date and time
+        '''
+        _, modem = self.__acquire()
+        try:
+            return modem.gsm.get_time()
+        finally:
+            modem.lock.release()
+            with self.lock:
+                modem.sending -= 1
+
+    def delete_all_sms(self):
+        '''
+        Delete all stored sms (inbox and sent) of every modem
+        '''
+        for modem in self.modems:
+            if not modem.gsm:
+                continue
+            with modem.lock:
+                modem.gsm.delete_all_sms()
+
+    def __collect(self, method: str):
+        '''
+        Call a polling method of every idle modem. Modems that are sending are
+        skipped, their results are kept until the next call
+        '''
+        self.check_health()
+        values = []
+        for i, modem in enumerate(self.modems):
+            if not modem.gsm or not modem.lock.acquire(blocking=False):
+                continue
+            try:
+                values.extend((i, value) for value in getattr(modem.gsm, method)())
+            except Exception:
+                # Most likely unplugged. Reconnected by check_health
+                if modem.healthy:
+                    self.__take_out(modem)
+            finally:
+                modem.lock.release()
+        return values
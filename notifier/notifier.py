@@ -1,59 +1,157 @@
-import cv2
-import numpy
 import sqlite3
 import datetime
-
-import RPi.GPIO as GPIO
-
-from pyzbar.pyzbar import decode
-from .database import NotifierDatabase
-from .sim808 import Sim808
+import time
+
+from .database import NotifierDatabase, Store
+from .drivers import Indicator, GpioIndicator
+from .modem_pool import ModemPool
+from .inbox import Inbox, normalize_number
+from .outbox import Outbox
+from .coalescer import Coalescer
+from .journal import SmsJournal
+from .camera import CameraSettings, MotionGate, open_camera, candidate_settings, autotune
+from .decoders import Decoder, create_decoder
+from .recent import RecentCache
+
+# Only needed to preview the camera
+try:
+    import cv2
+    import numpy
+except ImportError:
+    cv2 = None
+    numpy = None
 
 class Notifier:
     '''
     Initialize a notifier object
 
     Parameters:
-    database (str) : Database path
-    port (str) : Serial port of SIM808 module
+    database (str | Store) : Database path, or an opened store
+    port (str | list of str) : Serial port of SIM808 module, or ports of several modules
     rgb_pins (tuple) : RGBY pin (R, G, B, Y), follows BCM pinout
+    coalesce_window (float) : Seconds guardian messages are held to be combined. 0 to disable
+    footer (str) : Text appended to every guardian message
+    camera (int) : Camera index
+    camera_settings (CameraSettings) : Capture resolution, FPS, buffer size, format, focus and exposure
+    motion_gate (MotionGate) : Skips decoding while the scene is static
+    decoder (str | Decoder) : QR code decoder, a backend name such as `pyzbar`, `opencv` or `wechat`,
+        or comma separated names tried in order
+    batch_ttl (float) : Seconds a code returned by `scan_qrcodes` is left out of later batches
+    indicator (Indicator) : Status LED driver. A GpioIndicator on `rgby_pins` if not given
+    capture (cv2.VideoCapture | Camera) : Opened camera. Opened with `camera_factory` if not given
+    camera_factory (callable) : Called without arguments to open the camera, also when it is reopened.
+        Opens the `camera` index if not given
+    modem_factory (callable) : Called as modem_factory(port) to open a modem driver. Sim808 if not given
+    preview (bool) : Show the camera in a window with the QR codes outlined. Needs OpenCV
+    sms_journal (str) : File where queued SMS are kept until sent. Only kept in memory if not given
     '''
 
-    def __init__(self, database: str, port: str, rgby_pins: tuple):
+    def __init__(self, database: str, port, rgby_pins: tuple, coalesce_window: float = 300, footer: str = '',
+                 camera: int = 0, camera_settings: CameraSettings = None, motion_gate: MotionGate = None,
+                 decoder = 'pyzbar', batch_ttl: float = 5, indicator: Indicator = None, capture = None, camera_factory = None,
+                 modem_factory = None,
+                 preview: bool = True, sms_journal: str = None):
         '''
         Initialize a notifier object
 
         Parameters:
-        database (str) : Database path
-        port (str) : Serial port of SIM808 module
+        database (str | Store) : Database path, or an opened store
+        port (str | list of str) : Serial port of SIM808 module, or ports of several modules
+            that send messages in parallel
         rgb_pins (tuple) : RGBY pin (R, G, B, Y), follows BCM pinout
-        '''
-        self.qrcode_scanner = cv2.VideoCapture(0)
-        self.database = NotifierDatabase(database)
-        self.gsm = Sim808(port)
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
+        coalesce_window (float) : Seconds guardian messages are held to be combined. 0 to disable
+        footer (str) : Text appended to every guardian message
+        camera (int) : Camera index
+        camera_settings (CameraSettings) : Capture resolution, FPS, buffer size, format, focus and exposure
+        motion_gate (MotionGate) : Skips decoding while the scene is static
+        decoder (str | Decoder) : QR code decoder, a backend name such as `pyzbar`, `opencv` or `wechat`,
+            or comma separated names tried in order
+        batch_ttl (float) : Seconds a code returned by `scan_qrcodes` is left out of later batches
+        indicator (Indicator) : Status LED driver. A GpioIndicator on `rgby_pins` if not given
+        capture (cv2.VideoCapture | Camera) : Opened camera. Opened with `camera_factory` if not given
+        camera_factory (callable) : Called without arguments to open the camera, also when it is reopened.
+            Opens the `camera` index if not given
+        modem_factory (callable) : Called as modem_factory(port) to open a modem driver. Sim808 if not given
+        preview (bool) : Show the camera in a window with the QR codes outlined. Needs OpenCV
+        sms_journal (str) : File where queued SMS are kept until sent. Only kept in memory if not given
+        '''
+        self.camera_settings = camera_settings or CameraSettings()
+        self.camera_factory = camera_factory or (lambda: open_camera(camera, self.camera_settings))
+        self.qrcode_scanner = capture or self.camera_factory()
+        # Camera health, watched by the runtime supervisor
+        self.last_frame = None
+        self.failed_reads = 0
+        self.read_started = None
+        self.preview = preview and cv2 is not None
+        self.motion_gate = motion_gate or MotionGate()
+        self.set_decoder(decoder)
+        self.recent_codes = RecentCache(batch_ttl)
+        self.database = database if isinstance(database, Store) else NotifierDatabase(database)
+        self.gsm = ModemPool([port] if isinstance(port, str) else port, factory=modem_factory)
+        # Queued and held messages survive a restart, so reports marked as sent are never lost
+        journal = SmsJournal(sms_journal) if sms_journal else None
+        self.outbox = Outbox(self.gsm, journal=journal)
+        self.coalescer = Coalescer(self.outbox.send, window=coalesce_window, footer=footer, journal=journal)
+        self.inbox = Inbox(self.gsm, send=self.outbox.send)
+        self.inbox.register('STATUS', self.__status_command)
+        self.attendance_cache = {}
         self.rgby_pins = rgby_pins
-        for pin in rgby_pins:
-            GPIO.setup(pin, GPIO.OUT)
+        self.indicator = indicator or GpioIndicator(rgby_pins)
+
+    def set_decoder(self, decoder):
+        '''
+        Change the QR code decoder
+
+        Parameters:
+        decoder (str | Decoder) : Backend name, comma separated names tried in order, or a decoder
+        '''
+        self.decoder = decoder if isinstance(decoder, Decoder) else create_decoder(decoder)
+        self.decoder_name = decoder if isinstance(decoder, str) else decoder.name
 
     def __decodeframe(self, image):
         '''
         Returns the decoded QR Code message
         '''
-        trans_img = cv2.cvtColor(image,0)
-        qrcode = decode(trans_img)
-        for obj in qrcode:
-            points = obj.polygon
-            (x,y,w,h) = obj.rect
-            pts = numpy.array(points, numpy.int32)
-            pts = pts.reshape((-1, 1, 2))
-            thickness = 2
-            isClosed = True
-            line_color = (0, 0, 255)
-            cv2.polylines(image, [pts], isClosed, line_color, thickness)
-            data = obj.data.decode("utf-8")
-            return data
+        codes = self.__decodecodes(image)
+        return codes[0] if codes else None
+
+    def __decodecodes(self, image):
+        '''
+        Returns the messages of every QR Code in the frame
+        '''
+        codes = []
+        for code in self.decoder.decode(image):
+            if self.preview:
+                pts = numpy.array(code.polygon, numpy.int32)
+                pts = pts.reshape((-1, 1, 2))
+                thickness = 2
+                isClosed = True
+                line_color = (0, 0, 255)
+                cv2.polylines(image, [pts], isClosed, line_color, thickness)
+            if code.data not in codes:
+                codes.append(code.data)
+        return codes
+
+    def __scanframe(self):
+        '''
+        Reads a frame and returns the messages of its QR Codes. Static frames are not decoded
+        '''
+        time.sleep(self.motion_gate.delay())
+        self.read_started = time.monotonic()
+        ret, frame = self.qrcode_scanner.read()
+        self.read_started = None
+        if not ret:
+            self.failed_reads += 1
+            # A camera that stopped delivering frames fails instantly, do not spin on it
+            time.sleep(0.1)
+            return []
+        self.failed_reads = 0
+        self.last_frame = time.monotonic()
+        codes = self.__decodecodes(frame) if self.motion_gate.check(frame) else []
+        if self.preview:
+            cv2.imshow('Image', frame)
+            cv2.waitKey(1)
+        return codes
         
     def scan_qrcode(self, timeout: float = 0):
         '''
@@ -68,10 +166,8 @@ class Notifier:
         data = None
         if timeout <= 0:
             while True:
-                ret, frame = self.qrcode_scanner.read()
-                data = self.__decodeframe(frame)
-                cv2.imshow('Image', frame)
-                cv2.waitKey(1)
+                codes = self.__scanframe()
+                data = codes[0] if codes else None
                 if(data != None):
                     break
         else:
@@ -79,14 +175,90 @@ class Notifier:
             while True:
                 if datetime.datetime.now() - start >= datetime.timedelta(seconds=timeout):
                     break
-                ret, frame = self.qrcode_scanner.read()
-                data = self.__decodeframe(frame)
-                cv2.imshow('Image', frame)
-                cv2.waitKey(1)
+                codes = self.__scanframe()
+                data = codes[0] if codes else None
                 if(data != None):
                     break
-        cv2.destroyAllWindows()
+        if self.preview:
+            cv2.destroyAllWindows()
         return data
+
+    def scan_qrcodes(self, timeout: float = 0, window: float = 0.5):
+        '''
+        Scans every QR Code held up to the camera at once
+
+        Once a new code is seen, frames are read for `window` more seconds to
+        pick up codes that were not readable in the first frame. Codes returned
+        in the last `batch_ttl` seconds, or still held up since, are left out.
+
+        Parameters:
+        timeout (float) : Timeout for scanning qrcodes. Set to 0 to wait indefinitely
+        window (float) : Seconds codes are collected after the first new code
+
+        Returns:
+        list of str : New QRCode data. Empty if timeout reached
+        '''
+        codes = []
+        start = time.monotonic()
+        first = None
+        while True:
+            now = time.monotonic()
+            if first is not None and now - first >= window:
+                break
+            if first is None and timeout > 0 and now - start >= timeout:
+                break
+            for data in self.__scanframe():
+                if data not in codes and data not in self.recent_codes:
+                    codes.append(data)
+                # Keep codes that are still held up out of the next batch
+                self.recent_codes.add(data)
+            if codes and first is None:
+                first = time.monotonic()
+        if self.preview:
+            cv2.destroyAllWindows()
+        return codes
+
+    def reopen_camera(self):
+        '''
+        Release the camera and open it again with `camera_factory`
+        '''
+        try:
+            self.qrcode_scanner.release()
+        except Exception:
+            pass
+        self.qrcode_scanner = self.camera_factory()
+        self.failed_reads = 0
+
+    def autotune_camera(self, path: str = None, expected=None, frames: int = 30, min_success: float = 0.9):
+        '''
+        Benchmark capture settings against a test QR code held in front of the
+        camera and keep the fastest reliable ones
+
+        Parameters:
+        path (str) : File the chosen settings are saved to. Not saved if not given
+        expected (set of str) : Data of the test QR codes. Any data is accepted if not given
+        frames (int) : Frames measured per candidate
+        min_success (float) : Fraction of frames that must decode for settings to be reliable
+
+        Returns:
+        CameraSettings | None : Chosen settings. None if no candidate was reliable
+        '''
+        settings = autotune(
+            self.qrcode_scanner,
+            self.__decodeframe,
+            candidates=candidate_settings(self.camera_settings),
+            frames=frames,
+            min_success=min_success,
+            expected=expected)
+        if settings is None:
+            # Keep using the current settings
+            self.camera_settings.apply(self.qrcode_scanner)
+            return None
+        settings.apply(self.qrcode_scanner)
+        self.camera_settings = settings
+        if path:
+            settings.save(path)
+        return settings
     
     def send_sms(self, number: str, message: str):
         '''
@@ -97,7 +269,56 @@ class Notifier:
         message (str) : Message to send
         '''
         return self.gsm.send_sms(number, message)
+
+    def queue_sms(self, number: str, message: str):
+        '''
+        Queue a SMS message. Queued messages are sent by `process_outbox`,
+        and retried if sending or delivery fails
+
+        Parameters:
+        number (str) : Number to send message to. Should contain country code
+        message (str) : Message to send
+
+        Returns:
+        OutgoingSms : Queued message
+        '''
+        return self.outbox.send(number, message)
+
+    def notify_guardian(self, number: str, message: str, urgent: bool = False):
+        '''
+        Queue a message to a guardian. Messages to the same number within the
+        coalesce window are combined into one SMS
+
+        Parameters:
+        number (str) : Guardian phone number
+        message (str) : Message to send, without footer
+        urgent (bool) : Queue immediately instead of waiting for other messages
+        '''
+        self.coalescer.add(number, message, urgent)
+
+    def process_outbox(self, flush: bool = False):
+        '''
+        Queue combined guardian messages whose window has closed, handle delivery
+        reports and send the next due queued message
+
+        Parameters:
+        flush (bool) : Queue all combined guardian messages regardless of their window
+
+        Returns:
+        bool : True if a message was sent
+        '''
+        self.coalescer.flush(force=flush)
+        return self.outbox.process()
     
+    def modem_stats(self):
+        '''
+        Get the throughput of every SIM808 module
+
+        Returns:
+        list of dict : port, healthy, sent, failed and messages_per_minute of every module
+        '''
+        return self.gsm.stats()
+
     def read_unread_sms(self):
         '''
         Get unread sms
@@ -107,6 +328,35 @@ class Notifier:
         '''
         return self.gsm.read_unread_sms()
     
+    def process_inbox(self):
+        '''
+        Answer SMS commands received since the last call
+
+        Returns:
+        int : Number of messages processed
+        '''
+        return self.inbox.process()
+
+    def __status_command(self, message, args):
+        '''
+        Reply to `STATUS <LRN>` with the subjects attended today.
+        Only the guardian of the student gets a reply
+        '''
+        if len(args) != 1:
+            return 'Usage: STATUS <LRN>'
+        student = self.get_student_by_lrn(args[0])
+        if not student or normalize_number(student.guardian_phone_number) != normalize_number(message.sender):
+            return None
+        today = datetime.date.today()
+        attended = self.get_student_attendance(student.id, today)
+        reply = f'{student.name} ({student.lrn}) - {today.strftime("%B %d, %Y")}\n'
+        if attended:
+            for subject, time_in in attended:
+                reply += f'{subject} - {time_in}\n'
+        else:
+            reply += 'No attendance recorded today.'
+        return reply
+
     def get_time(self):
         '''
         Get network date and time
@@ -129,24 +379,13 @@ class Notifier:
         Parameters:
         color (str) : Color. Can be `red`, `blue`, `green` or `yellow`. Else turn of all LED.
         '''
-        self.turn_off_led()
-        if color == 'red':
-            GPIO.output(self.rgby_pins[0], GPIO.HIGH)
-        elif color == 'green':
-            GPIO.output(self.rgby_pins[1], GPIO.HIGH)
-        elif color == 'blue':
-            GPIO.output(self.rgby_pins[2], GPIO.HIGH)
-        elif color == 'yellow':
-            GPIO.output(self.rgby_pins[3], GPIO.HIGH)
+        self.indicator.show(color)
 
     def turn_off_led(self):
         '''
         Turn off RGB LED
         '''
-        GPIO.output(self.rgby_pins[0], GPIO.LOW)
-        GPIO.output(self.rgby_pins[1], GPIO.LOW)
-        GPIO.output(self.rgby_pins[2], GPIO.LOW)
-        GPIO.output(self.rgby_pins[3], GPIO.LOW)
+        self.indicator.off()
     
     
     #####################################
@@ -172,7 +411,7 @@ class Notifier:
         Get schedule based on current date and time
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        list of Schedule : (id, subject, start, end, teacher_id)
         '''
         return self.database.get_all_schedules()
     
@@ -181,7 +420,7 @@ class Notifier:
         Get schedule based on current date and time
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         return self.database.get_current_schedule()
     
@@ -190,7 +429,7 @@ class Notifier:
         Get previous schedule based on current date and time
 
         Returns:
-        tupple : (id, id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         return self.database.get_current_previous_schedule()
     
@@ -203,7 +442,7 @@ class Notifier:
         time (datetime.time) : Time to check
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         return self.database.get_schedule(day, time)
     
@@ -216,10 +455,88 @@ class Notifier:
         time (datetime.time) : Time to check
 
         Returns:
-        tupple : (id, subject, start, end, teacher_id)
+        Schedule : (id, subject, start, end, teacher_id)
         '''
         return self.database.get_previous_schedule(day, time)
     
+    def get_schedule_by_id(self, schedule_id):
+        '''
+        Get a schedule by primary key
+
+        Returns:
+        Schedule : (id, subject, start, end, teacher_id)
+        '''
+        return self.database.get_schedule_by_id(schedule_id)
+
+    def get_schedules_on(self, day: int):
+        '''
+        Get the schedules of a day of the week
+
+        Parameters:
+        day (int) : Day of the week (1 = Monday, 7 = Sunday)
+
+        Returns:
+        list of Schedule : (id, subject, start, end, teacher_id)
+        '''
+        return self.database.get_schedules_on(day)
+
+    def report_exists(self, schedule_id, date: datetime.date):
+        '''
+        Check if the end of class report of a class was sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class started
+
+        Returns:
+        bool : Exists
+        '''
+        return self.database.report_exists(schedule_id, date)
+
+    def add_report(self, schedule_id, date: datetime.date):
+        '''
+        Mark the end of class report of a class as sent
+
+        Parameters:
+        schedule_id : Schedule ID
+        date (datetime.date) : Date the class started
+
+        Returns:
+        bool : False if it was already marked
+        '''
+        return self.database.add_report(schedule_id, date)
+
+    def get_next_schedule(self, day: int, time: datetime.time):
+        '''
+        Get the next schedule starting after the given day and time on the same day
+
+        Parameters:
+        day (int) : Day of the week (1 = Monday, 7 = Sunday)
+        time (datetime.time) : Time to check
+
+        Returns:
+        Schedule : (id, subject, start, end, teacher_id)
+        '''
+        return self.database.get_next_schedule(day, time)
+
+    def data_version(self):
+        '''
+        Get the sqlite data version. It changes whenever another connection commits
+
+        Returns:
+        int : Data version
+        '''
+        return self.database.data_version()
+
+    def get_entity_versions(self):
+        '''
+        Get the version of every entity. A version is bumped whenever the entity changes
+
+        Returns:
+        dict : entity (`student`, `schedule` or `teacher`) -> version
+        '''
+        return self.database.get_entity_versions()
+
     def get_attendance(self, date: datetime.date, schedule_id):
         '''
         Get list of students who attend a subject on specific date
@@ -229,7 +546,7 @@ class Notifier:
         schedule_id : Schedule ID
 
         Returns:
-        tupple : (student_name, lrn, guardian_phone_number, time_in)
+        list of Attendee : (name, lrn, guardian_phone_number, time_in, status)
         '''
         return self.database.get_attendance(date, schedule_id)
 
@@ -242,7 +559,7 @@ class Notifier:
         schedule_id : Schedule ID
 
         Returns:
-        tupple : (student_name, lrn, guardian_phone_number)
+        list of Absentee : (name, lrn, guardian_phone_number)
         '''
         return self.database.get_absents(date, schedule_id)
     
@@ -259,6 +576,18 @@ class Notifier:
         bool : Exists
         '''
         return self.database.attendance_exists(student_id, schedule_id, date)
+
+    def attendance_exists_many(self, keys):
+        '''
+        Check which of several attendances exist, in one query
+
+        Parameters:
+        keys (iterable of tupple) : (student_id, schedule_id, date)
+
+        Returns:
+        set of tupple : The given keys that exist
+        '''
+        return self.database.attendance_exists_many(keys)
     
     def add_attendance(self, student_id, schedule_id, date: datetime.date, time_in: datetime.time):
         '''
@@ -272,32 +601,87 @@ class Notifier:
         Returns:
         bool : Success
         '''
+        self.attendance_cache.pop((student_id, date), None)
         return self.database.add_attendance(student_id, schedule_id, date, time_in)
+
+    def add_attendances(self, attendances):
+        '''
+        Add several attendances in one transaction. Attendances that already exist are skipped
+
+        Parameters:
+        attendances (list of tupple) : (student_id, schedule_id, date, time_in)
+
+        Returns:
+        int : Number of attendances added
+        '''
+        for student_id, _, date, _ in attendances:
+            self.attendance_cache.pop((student_id, date), None)
+        return self.database.add_attendances(attendances)
     
+    def get_student_attendance(self, student_id, date: datetime.date):
+        '''
+        Get the subjects a student attended on specific date. Results are cached
+        until the student gets a new attendance
+
+        Parameters:
+        student_id: Student ID
+        date (datetime.date) : Date
+
+        Returns:
+        list of StudentAttendance : (subject, time_in)
+        '''
+        key = (student_id, date)
+        if key not in self.attendance_cache:
+            if len(self.attendance_cache) > 5000:
+                self.attendance_cache.clear()
+            self.attendance_cache[key] = self.database.get_student_attendance(student_id, date)
+        return self.attendance_cache[key]
+
     def get_student(self, student_id):
         '''
         Get a student by primary key
 
         Returns:
-        tupple : (id, first_name, last_name, guardian_phone_number, LRN)
+        Student : (id, first_name, last_name, guardian_phone_number, LRN)
         '''
         return self.database.get_student(student_id)
 
+    def get_all_students(self):
+        '''
+        Get all students
+
+        Returns:
+        list of Student : (id, first_name, last_name, guardian_phone_number, LRN)
+        '''
+        return self.database.get_all_students()
+
     def get_student_by_lrn(self, lrn: str):
         '''
         Get a student by lrn
 
         Returns:
-        tupple : (id, first_name, last_name, guardian_phone_number, LRN)
+        Student : (id, first_name, last_name, guardian_phone_number, LRN)
         '''
         return self.database.get_student_by_lrn(lrn)
 
+    def get_students_by_lrns(self, lrns):
+        '''
+        Get several students by lrn, in one query
+
+        Parameters:
+        lrns (iterable of str) : LRNs
+
+        Returns:
+        dict : LRN -> Student, only for the LRNs that exist
+        '''
+        return self.database.get_students_by_lrns(lrns)
+
     def get_teacher(self, teacher_id):
         '''
         Get a teacher by primary key
 
         Returns:
-        tupple : (id, first_name, last_name, phone_number)
+        Teacher : (id, first_name, last_name, phone_number)
         '''
         return self.database.get_teacher(teacher_id)
 
@@ -306,9 +690,39 @@ class Notifier:
         Return all attendances in attendance table
         '''
         return self.database.get_all_attendance()
+
+    def iter_attendance(self, start: datetime.date = None, end: datetime.date = None, schedule_id = None, batch_size: int = 500):
+        '''
+        Iterate over attendances without loading the whole table in memory
+
+        Parameters:
+        start (datetime.date) : First date to include. None for no lower bound
+        end (datetime.date) : Last date to include. None for no upper bound
+        schedule_id : Schedule ID. None for all schedules
+        batch_size (int) : Number of rows fetched from sqlite at a time
+
+        Returns:
+        generator of tupple : (date, time_in, lrn, student_name, subject, schedule_id)
+        '''
+        return self.database.iter_attendance(start, end, schedule_id, batch_size)
     
     def truncate_attendances(self):
         '''
         Delete all records on attendance table
         '''
-        return self.database.truncate_attendances()
\ No newline at end of file
+        return self.database.truncate_attendances()
+
+    def archive_attendances(self, cutoff: datetime.date, archive_dir: str, chunk_size: int = 500, max_id: int = None):
+        '''
+        Move one chunk of attendances older than cutoff to per-term archive databases
+
+        Parameters:
+        cutoff (datetime.date) : Attendances before this date are archived
+        archive_dir (str) : Directory where archive databases are stored
+        chunk_size (int) : Maximum number of attendances moved
+        max_id (int) : Only attendances up to this ID are archived, e.g. the ones the central server has
+
+        Returns:
+        int : Number of attendances moved. 0 when nothing is left to archive
+        '''
+        return self.database.archive_attendances(cutoff, archive_dir, chunk_size, max_id=max_id)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .sim808 import SmsError, ModemUnavailable
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+
+@dataclass
+class OutgoingSms:
+    '''
+    A queued SMS message and its delivery state
+    '''
+    number: str
+    message: str
+    attempts: int = 0
+    status: str = PENDING
+    reference: int = None
+    created: float = field(default_factory=time.monotonic)
+    # Entry of the message in the SMS journal
+    journal_id: int = None
+
+
+class Outbox:
+    '''
+    Send queued SMS messages with retries and per-recipient rate limiting
+
+    Every `process` call sends at most one message, so a failing message never
+    blocks the caller. With a modem pool, `process` can be called from one
+    thread per modem to send in parallel. Failed sends and failed delivery reports are retried
+    with exponential backoff until `max_attempts` is reached.
+
+    With a journal, queued messages are kept on disk until they are sent or
+    given up on, and the ones a previous run did not send are queued again.
+
+    Parameters:
+    gsm (Sim808) : SIM808 module
+    max_attempts (int) : Number of times a message is tried before giving up
+    backoff (float) : Seconds before the first retry. Doubles on every retry
+    max_backoff (float) : Maximum seconds between retries
+    min_interval (float) : Minimum seconds between two messages to the same number
+    journal (SmsJournal) : Journal of queued messages. Messages are only kept in memory if not given
+    '''
+
+    def __init__(self, gsm, max_attempts: int = 5, backoff: float = 30, max_backoff: float = 1800, min_interval: float = 5,
+                 journal = None):
+        '''
+        Send queued SMS messages with retries and per-recipient rate limiting
+
+        Parameters:
+        gsm (Sim808) : SIM808 module
+        max_attempts (int) : Number of times a message is tried before giving up
+        backoff (float) : Seconds before the first retry. Doubles on every retry
+        max_backoff (float) : Maximum seconds between retries
+        min_interval (float) : Minimum seconds between two messages to the same number
+        journal (SmsJournal) : Journal of queued messages. Messages are only kept in memory if not given
+        '''
+        self.gsm = gsm
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.min_interval = min_interval
+        # Heap of (due, sequence, sms). The sequence keeps equal due times in FIFO order
+        self.queue = []
+        self.sequence = itertools.count()
+        self.last_sent = {}
+        # Message references wrap around at 255, so this never grows past 256 entries per modem
+        self.awaiting_report = {}
+        # Messages can be queued from other threads while one is being sent, and
+        # every sender of a modem pool handles delivery reports. Guards the queue,
+        # last_sent and awaiting_report
+        self.lock = threading.Lock()
+        self.journal = journal
+        if journal is not None:
+            restored = journal.pending('sms')
+            for entry in restored:
+                self.__schedule(OutgoingSms(entry['number'], entry['message'], journal_id=entry['id']), time.monotonic())
+            if restored:
+                logger.info('Restored queued SMS', extra={'messages': len(restored)})
+
+    def send(self, number: str, message: str):
+        '''
+        Queue a SMS message
+
+        Parameters:
+        number (str) : Number to send message to. Should contain country code
+        message (str) : Message to send
+
+        Returns:
+        OutgoingSms : Queued message
+        '''
+        sms = OutgoingSms(number, message)
+        if self.journal is not None:
+            sms.journal_id = self.journal.add('sms', number, message)
+        with self.lock:
+            self.__schedule(sms, time.monotonic())
+        return sms
+
+    def pending(self):
+        '''
+        Get the number of messages waiting to be sent
+
+        Returns:
+        int : Number of queued messages
+        '''
+        with self.lock:
+            return len(self.queue)
+
+    def process(self):
+        '''
+        Handle delivery reports and send the next due message, if any
+
+        Returns:
+        bool : True if a message was sent
+        '''
+        self.__handle_delivery_reports()
+        sms = self.__next_due()
+        if not sms:
+            return False
+        return self.__send(sms)
+
+    def __next_due(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.queue and self.queue[0][0] <= now:
+                _, _, sms = heapq.heappop(self.queue)
+                ready = self.last_sent.get(sms.number, float('-inf')) + self.min_interval
+                if ready > now:
+                    self.__schedule(sms, ready)
+                    continue
+                # Taken under the lock, so another sender cannot pick a message
+                # to the same number while this one is being sent
+                self.last_sent[sms.number] = now
+                return sms
+        return None
+
+    def __send(self, sms: OutgoingSms):
+        sms.attempts += 1
+        try:
+            sms.reference = self.gsm.send_sms(sms.number, sms.message)
+        except ModemUnavailable:
+            # Keep the message until a modem is back without using up its attempts
+            sms.attempts -= 1
+            with self.lock:
+                self.__schedule(sms, time.monotonic() + self.backoff)
+            return False
+        except SmsError as e:
+            logger.warning('Sending SMS failed', extra={'number': sms.number, 'attempt': sms.attempts, 'error': str(e)})
+            self.__retry(sms)
+            return False
+        sms.status = SENT
+        # Handed to the network. A failed delivery report is only retried while running
+        self.__finish(sms)
+        if sms.reference is not None:
+            with self.lock:
+                self.awaiting_report[sms.reference] = sms
+        logger.info('SMS sent', extra={'number': sms.number, 'reference': sms.reference, 'attempt': sms.attempts, 'length': len(sms.message)})
+        return True
+
+    def __retry(self, sms: OutgoingSms):
+        if sms.attempts >= self.max_attempts:
+            sms.status = FAILED
+            logger.error('Giving up on SMS', extra={'number': sms.number, 'attempts': sms.attempts})
+            self.__finish(sms)
+            return
+        sms.status = PENDING
+        delay = min(self.backoff * 2 ** (sms.attempts - 1), self.max_backoff)
+        with self.lock:
+            self.__schedule(sms, time.monotonic() + delay)
+
+    def __finish(self, sms: OutgoingSms):
+        if self.journal is not None and sms.journal_id is not None:
+            self.journal.done(sms.journal_id)
+            sms.journal_id = None
+
+    def __schedule(self, sms: OutgoingSms, due: float):
+        heapq.heappush(self.queue, (due, next(self.sequence), sms))
+
+    def __handle_delivery_reports(self):
+        # Polled outside the lock so queuing never waits on the modem
+        reports = self.gsm.poll_delivery_reports()
+        failed = []
+        with self.lock:
+            for reference, status in reports:
+                sms = self.awaiting_report.get(reference)
+                if not sms:
+                    continue
+                if status < 32:
+                    sms.status = DELIVERED
+                    del self.awaiting_report[reference]
+                    logger.info('SMS delivered', extra={'number': sms.number, 'reference': reference})
+                elif status >= 64:
+                    del self.awaiting_report[reference]
+                    logger.warning('SMS delivery failed', extra={'number': sms.number, 'reference': reference, 'status': status})
+                    failed.append(sms)
+        # Retrying takes the lock again
+        for sms in failed:
+            self.__retry(sms)
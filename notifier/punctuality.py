@@ -0,0 +1,55 @@
+import datetime
+
+# Shared with the Django project, so this module only uses the standard library
+
+# Attendance statuses, also the names of the core_punctuality counters
+ON_TIME = 'on_time'
+LATE = 'late'
+VERY_LATE = 'very_late'
+STATUSES = (ON_TIME, LATE, VERY_LATE)
+
+LABELS = {
+    ON_TIME: 'On time',
+    LATE: 'Late',
+    VERY_LATE: 'Very late',
+}
+
+
+def classify(start: datetime.time, time_in: datetime.time, late_after: int, very_late_after: int, end: datetime.time = None):
+    '''
+    Classify a time in as on time, late or very late
+
+    Parameters:
+    start (datetime.time) : Start of the class
+    time_in (datetime.time) : Time in of the student
+    late_after (int) : Minutes after the start a student is late
+    very_late_after (int) : Minutes after the start a student is very late
+    end (datetime.time) : End of the class. A class that does not end after it starts, e.g.
+        22:00 - 01:00, ends on the next day, and times in up to its end are on that day
+
+    Returns:
+    str : ON_TIME, LATE or VERY_LATE
+    '''
+    minutes = (datetime.datetime.combine(datetime.date.min, time_in) - datetime.datetime.combine(datetime.date.min, start)).total_seconds() / 60
+    if end is not None and end <= start and time_in <= end:
+        # After midnight
+        minutes += 24 * 60
+    if minutes > very_late_after:
+        return VERY_LATE
+    if minutes > late_after:
+        return LATE
+    return ON_TIME
+
+
+def school_year(date: datetime.date):
+    '''
+    Get the school year of a date. School years start in June
+
+    Parameters:
+    date (datetime.date) : Date
+
+    Returns:
+    str : School year, e.g. SY2023-2024
+    '''
+    start = date.year if date.month >= 6 else date.year - 1
+    return f'SY{start}-{start + 1}'
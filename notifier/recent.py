@@ -0,0 +1,86 @@
+import time
+
+
+class RecentCache:
+    '''
+    Keys remembered for `ttl` seconds after they were last added
+
+    Keys are kept in the order they were added, so expired keys are always at
+    the front and pruning stops at the first key that is still fresh.
+
+    Parameters:
+    ttl (float) : Seconds a key is remembered
+    '''
+
+    def __init__(self, ttl: float):
+        '''
+        Keys remembered for `ttl` seconds after they were last added
+
+        Parameters:
+        ttl (float) : Seconds a key is remembered
+        '''
+        self.ttl = ttl
+        # key -> (expiry, value)
+        self.items = {}
+
+    def __len__(self):
+        self.prune()
+        return len(self.items)
+
+    def __contains__(self, key):
+        item = self.items.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def add(self, key, value=True):
+        '''
+        Remember a key, restarting its time to live
+
+        Parameters:
+        key : Key
+        value : Value returned by `get`
+        '''
+        self.items.pop(key, None)
+        self.items[key] = (time.monotonic() + self.ttl, value)
+        self.prune()
+
+    def get(self, key, default=None):
+        '''
+        Get the value of a key that has not expired
+
+        Parameters:
+        key : Key
+        default : Returned if the key is unknown or expired
+
+        Returns:
+        Value of the key
+        '''
+        item = self.items.get(key)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def discard(self, key):
+        '''
+        Forget a key
+
+        Parameters:
+        key : Key
+        '''
+        self.items.pop(key, None)
+
+    def clear(self):
+        '''
+        Forget all keys
+        '''
+        self.items.clear()
+
+    def prune(self):
+        '''
+        Forget expired keys
+        '''
+        now = time.monotonic()
+        while self.items:
+            key = next(iter(self.items))
+            if self.items[key][0] > now:
+                break
+            del self.items[key]
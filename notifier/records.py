@@ -0,0 +1,93 @@
+import datetime
+from typing import NamedTuple
+
+# NamedTuples have empty __slots__, so records are as small as plain tuples and
+# still unpack and index like the tuples the database used to return. Times are
+# parsed once when the row is read instead of on every use.
+
+
+def parse_time(value):
+    '''
+    Parse a time stored by Django, e.g. `08:30:00` or `08:30:00.000000`
+
+    Parameters:
+    value (str | None) : Stored time
+
+    Returns:
+    datetime.time | None : Parsed time
+    '''
+    return datetime.time.fromisoformat(value) if value else None
+
+
+class Schedule(NamedTuple):
+    id: int
+    subject: str
+    start: datetime.time
+    end: datetime.time
+    teacher_id: int
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        id, subject, start, end, teacher_id = row
+        return cls(id, subject, parse_time(start), parse_time(end), teacher_id)
+
+
+class Student(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    guardian_phone_number: str
+    lrn: str
+
+    @property
+    def name(self):
+        return f'{self.first_name} {self.last_name}'
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+
+class Teacher(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    phone_number: str
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+
+class Attendee(NamedTuple):
+    name: str
+    lrn: str
+    guardian_phone_number: str
+    time_in: datetime.time
+    # on_time, late or very_late. None for attendances recorded before classification
+    status: str = None
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        name, lrn, guardian_phone_number, time_in, status = row
+        return cls(name, lrn, guardian_phone_number, parse_time(time_in), status)
+
+
+class Absentee(NamedTuple):
+    name: str
+    lrn: str
+    guardian_phone_number: str
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+
+class StudentAttendance(NamedTuple):
+    subject: str
+    time_in: datetime.time
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        subject, time_in = row
+        return cls(subject, parse_time(time_in))
@@ -0,0 +1,61 @@
+import datetime
+
+from .punctuality import ON_TIME, STATUSES, LABELS
+
+
+def teacher_report(schedule, date: datetime.date, attended, absents, footer: str = ''):
+    '''
+    Build the end of class report sent to the teacher
+
+    Parameters:
+    schedule (Schedule) : Schedule of the class
+    date (datetime.date) : Date of the class
+    attended (list of Attendee) : Students who attended
+    absents (list of Absentee) : Students who are absent
+    footer (str) : Text appended to the report
+
+    Returns:
+    str : Report message
+    '''
+    message = f'Attendance - {date.strftime("%B %d, %Y")}\n{schedule.subject} ({schedule.start} - {schedule.end})\n\n'
+
+    if attended:
+        for student in attended:
+            message += f'{student.name} ({student.lrn}) - {student.guardian_phone_number}'
+            if student.status and student.status != ON_TIME:
+                message += f' [{LABELS[student.status]}]'
+            message += '\n'
+        counts = [sum(student.status == status for student in attended) for status in STATUSES]
+        if any(counts):
+            message += ', '.join(f'{LABELS[status]}: {count}' for status, count in zip(STATUSES, counts)) + '\n'
+    else:
+        message += 'No student has attended the class!'
+
+    if absents:
+        message += '\nAbsent Students:\n'
+        for student in absents:
+            message += f'{student.name} ({student.lrn})\n'
+    else:
+        message += 'No student is absent in class!'
+
+    return message + footer
+
+
+def guardian_message(student, subject: str, attended: bool):
+    '''
+    Build the message sent to the guardian of a student
+
+    Parameters:
+    student (Attendee | Absentee) : Student
+    subject (str) : Subject of the class
+    attended (bool) : Whether the student attended the class
+
+    Returns:
+    str : Message, without footer
+    '''
+    if attended:
+        message = f'{student.name} ({student.lrn}) attended the {subject} subject'
+        if getattr(student, 'status', None) and student.status != ON_TIME:
+            message += f' ({LABELS[student.status].lower()})'
+        return message
+    return f'{student.name} ({student.lrn}) missed the {subject} subject'
@@ -0,0 +1,605 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import datetime
+import logging
+import signal
+import sqlite3
+import time
+
+from .journal import AttendanceJournal
+from .recent import RecentCache
+from .reports import teacher_report, guardian_message
+from .timetable import classes_between
+from .watchdog import Supervisor, sd_notify
+
+logger = logging.getLogger(__name__)
+
+# Results of a scanned LRN, remembered for repeated scans of the same badge
+UNKNOWN = 'unknown'
+RECORDED = 'recorded'
+ACCEPTED = 'accepted'
+
+
+@dataclasses.dataclass
+class PreparedReport:
+    '''
+    End of class report computed ahead of the end of the class, with what it was computed from
+    '''
+    schedule: object
+    date: datetime.date
+    attended: list
+    absents: list
+    teacher: object
+    message: str
+    # Attendances written and sqlite data version when the report was computed
+    writes: int
+    data_version: int
+
+
+class NotifierRuntime:
+    '''
+    Run a notifier with asyncio so scanning, sending and timekeeping never block each other
+
+    Every device gets its own worker thread: the camera decodes frames, the
+    database runs sqlite queries and every SIM808 of the modem pool sends
+    messages. Only one call at a time reaches each device, so none of them
+    need to be thread-safe.
+
+    When the database is unavailable, scans are checked against a cached
+    roster and journaled to a file, then replayed once the database is back.
+
+    Changes made in the admin are picked up without a restart: the sqlite data
+    version is checked every `watch_interval` seconds, and only the entities
+    whose version changed are reloaded.
+
+    A Supervisor restarts the camera and database when they fail and pings
+    the systemd watchdog while everything is healthy.
+
+    End of class reports are sent by a timer set to the end of every class, so
+    slow scans or sends never delay them, and classes past midnight end on the
+    next day. The report is computed `prepare_ahead` seconds before the end and
+    only computed again if attendances changed since. Sent reports are marked in
+    the database, and classes that ended in the last `catch_up` seconds without
+    a report, e.g. while the unit was off, are reported to their teacher on
+    startup. A report is marked once its messages are queued, so the notifier
+    should keep queued messages in an SMS journal to survive a restart. Guardians only get messages for classes that ended while the
+    runtime was running, since students could not scan while the unit was off.
+
+    Parameters:
+    machine (Notifier) : Notifier to run
+    scan_timeout (float) : Seconds scanned per camera call
+    accept_delay (float) : Seconds the LED stays green after a recorded attendance
+    reject_delay (float) : Seconds the LED stays red after a rejected scan
+    schedule_interval (float) : Maximum seconds between checks for a starting schedule
+    outbox_interval (float) : Seconds between checks for received and queued SMS
+    journal (str) : File where attendances are kept while the database is unavailable
+    replay_interval (float) : Seconds between attempts to save journaled attendances
+    watch_interval (float) : Seconds between checks for roster and schedule changes
+    batch (bool) : Record every QR code held up at once with one acknowledgement
+    batch_window (float) : Seconds codes are collected after the first code of a batch
+    debounce (float) : Seconds a scanned LRN is answered from memory instead of the database
+    repeat_delay (float) : Seconds the LED shows the remembered result of a repeated scan
+    reload (callable) : Called without arguments on SIGHUP, e.g. to reload the configuration
+    prepare_ahead (float) : Seconds before the end of a class its report is computed
+    catch_up (float) : Seconds back missed reports are sent on startup
+    '''
+
+    def __init__(self, machine, scan_timeout: float = 1, accept_delay: float = 3, reject_delay: float = 1,
+                 schedule_interval: float = 60, outbox_interval: float = 0.5,
+                 journal: str = 'attendance-journal.jsonl', replay_interval: float = 30, watch_interval: float = 1,
+                 batch: bool = False, batch_window: float = 0.5, debounce: float = 10, repeat_delay: float = 0.3,
+                 reload = None, prepare_ahead: float = 30, catch_up: float = 12 * 3600):
+        '''
+        Run a notifier with asyncio so scanning, sending and timekeeping never block each other
+
+        Parameters:
+        machine (Notifier) : Notifier to run
+        scan_timeout (float) : Seconds scanned per camera call
+        accept_delay (float) : Seconds the LED stays green after a recorded attendance
+        reject_delay (float) : Seconds the LED stays red after a rejected scan
+        schedule_interval (float) : Maximum seconds between checks for a starting schedule
+        outbox_interval (float) : Seconds between checks for received and queued SMS
+        journal (str) : File where attendances are kept while the database is unavailable
+        replay_interval (float) : Seconds between attempts to save journaled attendances
+        watch_interval (float) : Seconds between checks for roster and schedule changes
+        batch (bool) : Record every QR code held up at once with one acknowledgement
+        batch_window (float) : Seconds codes are collected after the first code of a batch
+        debounce (float) : Seconds a scanned LRN is answered from memory instead of the database
+        repeat_delay (float) : Seconds the LED shows the remembered result of a repeated scan
+        reload (callable) : Called without arguments on SIGHUP, e.g. to reload the configuration
+        prepare_ahead (float) : Seconds before the end of a class its report is computed
+        catch_up (float) : Seconds back missed reports are sent on startup
+        '''
+        self.machine = machine
+        self.scan_timeout = scan_timeout
+        self.accept_delay = accept_delay
+        self.reject_delay = reject_delay
+        self.schedule_interval = schedule_interval
+        self.outbox_interval = outbox_interval
+        self.journal = AttendanceJournal(journal)
+        self.replay_interval = replay_interval
+        self.watch_interval = watch_interval
+        self.batch = batch
+        self.batch_window = batch_window
+        self.repeat_delay = repeat_delay
+        self.reload = reload
+        self.prepare_ahead = prepare_ahead
+        self.catch_up = catch_up
+        # (lrn, schedule_id, date) -> UNKNOWN, RECORDED or ACCEPTED
+        self.recent_scans = RecentCache(debounce)
+        self.data_version = None
+        self.entity_versions = None
+        self.schedule_changed = None
+        self.reports_changed = None
+        # (schedule_id, date) -> PreparedReport of classes about to end
+        self.prepared = {}
+        # (schedule_id, date) of reports queued but not yet marked as sent
+        self.reported = set()
+        # Counts attendances written, so a prepared report knows if it is outdated
+        self.attendance_writes = 0
+        # LRN -> student, used when the database is unavailable
+        self.roster = {}
+        self.camera = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='camera')
+        self.modem = concurrent.futures.ThreadPoolExecutor(len(machine.gsm) + 1, thread_name_prefix='modem')
+        self.db = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='database')
+        self.current_schedule = None
+        self.current_date = None
+        self.busy = False
+        self.led_override = None
+        # Attendances queued for the writer but not yet committed
+        self.pending_attendances = set()
+        self.writes = None
+        self.stopping = None
+        self.supervisor = Supervisor(self)
+        # Why the runtime gave up. Worker threads may be hung
+        self.failed = None
+
+    async def run(self):
+        '''
+        Run until `stop` is called or SIGINT/SIGTERM is received. SIGHUP calls `reload`
+        '''
+        loop = asyncio.get_running_loop()
+        self.writes = asyncio.Queue()
+        self.stopping = asyncio.Event()
+        self.schedule_changed = asyncio.Event()
+        self.reports_changed = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        if self.reload:
+            loop.add_signal_handler(signal.SIGHUP, self.__reload)
+
+        tasks = [
+            asyncio.create_task(self.__schedule_loop(), name='schedule'),
+            asyncio.create_task(self.__report_loop(), name='report'),
+            asyncio.create_task(self.__scan_loop(), name='scan'),
+            asyncio.create_task(self.__write_loop(), name='database'),
+            asyncio.create_task(self.__inbox_loop(), name='inbox'),
+            asyncio.create_task(self.__led_loop(), name='led'),
+            asyncio.create_task(self.__replay_loop(), name='replay'),
+            asyncio.create_task(self.__watch_loop(), name='watch'),
+            asyncio.create_task(self.supervisor.run(), name='supervisor'),
+        ]
+        # One sender per modem so the pool sends in parallel
+        tasks += [asyncio.create_task(self.__send_loop(), name=f'send-{i}') for i in range(len(self.machine.gsm))]
+        await self.__run_in(self.db, self.__load_roster)
+        logger.info('Runtime started', extra={'journaled': len(self.journal)})
+        await self.stopping.wait()
+
+        logger.info('Runtime stopping')
+        sd_notify('STOPPING=1')
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Never drop scanned attendances on shutdown
+        while not self.writes.empty():
+            attendances = self.writes.get_nowait()
+            if self.failed:
+                # The database thread may be hung
+                for attendance in attendances:
+                    self.journal.append(*attendance)
+            else:
+                await self.__write(attendances)
+        for executor in (self.camera, self.modem, self.db):
+            executor.shutdown(wait=not self.failed, cancel_futures=True)
+        self.machine.turn_off_led()
+        # Guardian messages still held for their window are queued, so they are
+        # counted, and sent after a restart when the outbox is journaled
+        self.machine.coalescer.flush(force=True)
+        logger.info('Runtime stopped', extra={'unsent_sms': self.machine.outbox.pending()})
+
+    def stop(self):
+        '''
+        Stop the runtime
+        '''
+        if self.stopping:
+            self.stopping.set()
+
+    def fail(self, reason: str):
+        '''
+        Stop the runtime without waiting for its worker threads
+
+        Parameters:
+        reason (str) : Why the runtime gave up
+        '''
+        self.failed = reason
+        self.stop()
+
+    def __reload(self):
+        # Runs on the event loop, so settings never change in the middle of a step
+        try:
+            self.reload()
+        except Exception:
+            logger.exception('Reload failed')
+
+    def flash(self, color: str, seconds: float):
+        '''
+        Show a LED color for some time before returning to the status color
+
+        Parameters:
+        color (str) : Color. Can be `red`, `blue`, `green` or `yellow`
+        seconds (float) : Seconds the color is shown
+        '''
+        self.led_override = (color, time.monotonic() + seconds)
+
+    async def __run_in(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def __wait_for(self, event: asyncio.Event, timeout: float):
+        '''
+        Sleep until the timeout or until the event is set. Returns True if it was set
+        '''
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def __schedule_loop(self):
+        while True:
+            try:
+                self.schedule_changed.clear()
+                now = datetime.datetime.now()
+                until = now + datetime.timedelta(seconds=self.schedule_interval)
+                classes = await self.__run_in(self.db, classes_between, self.machine.get_schedules_on, now, until)
+                current = next((item for item in classes if item[0] <= now < item[1]), None)
+                if current:
+                    start, end, schedule, date = current
+                    if not self.current_schedule or (self.current_schedule.id, self.current_date) != (schedule.id, date):
+                        logger.info('Schedule started', extra={'schedule': schedule.id})
+                    self.current_date = date
+                    self.current_schedule = schedule
+                    # Sleep until the class ends instead of checking on every scan
+                    delay = (end - now).total_seconds()
+                else:
+                    self.current_schedule = None
+                    # Sleep until the next class starts instead of polling
+                    starts = [(item[0] - now).total_seconds() for item in classes if item[0] > now]
+                    delay = min(starts, default=self.schedule_interval)
+                # Clock changes are picked up at least every schedule_interval
+                await self.__wait_for(self.schedule_changed, min(max(delay, 0), self.schedule_interval))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Schedule task failed')
+                self.flash('red', self.reject_delay)
+                await asyncio.sleep(self.schedule_interval)
+
+    async def __report_loop(self):
+        # Classes that ended while the unit was off are reported on startup
+        started = datetime.datetime.now()
+        reported_until = started - datetime.timedelta(seconds=self.catch_up)
+        while True:
+            try:
+                self.reports_changed.clear()
+                now = datetime.datetime.now()
+                since = max(reported_until, now - datetime.timedelta(seconds=self.catch_up))
+                until = now + datetime.timedelta(seconds=self.schedule_interval + self.prepare_ahead)
+                classes = await self.__run_in(self.db, classes_between, self.machine.get_schedules_on, since, until)
+
+                failed = []
+                for start, end, schedule, date in classes:
+                    if since < end <= now:
+                        try:
+                            await self.__dispatch_report(schedule, date, (now - end).total_seconds(), end >= started)
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception:
+                            logger.exception('Report failed', extra={'schedule': schedule.id, 'date': str(date)})
+                            self.flash('red', self.reject_delay)
+                            failed.append(end)
+                # Failed reports are tried again until they are older than catch_up
+                reported_until = min(failed) - datetime.timedelta(microseconds=1) if failed else now
+                if failed:
+                    await asyncio.sleep(self.schedule_interval)
+                    continue
+
+                upcoming = [item for item in classes if item[1] > now]
+                keys = {(schedule.id, date) for _, _, schedule, date in upcoming}
+                # Reports of classes that were moved or deleted are dropped
+                self.prepared = {key: report for key, report in self.prepared.items() if key in keys}
+                delay = self.schedule_interval
+                for start, end, schedule, date in upcoming:
+                    remaining = (end - now).total_seconds()
+                    if (schedule.id, date) not in self.prepared:
+                        if remaining <= self.prepare_ahead:
+                            try:
+                                self.prepared[(schedule.id, date)] = await self.__prepare_report(schedule, date)
+                            except asyncio.CancelledError:
+                                raise
+                            except Exception:
+                                # Computed again at the end of the class
+                                logger.warning('Preparing report failed', exc_info=True, extra={'schedule': schedule.id})
+                                self.prepared[(schedule.id, date)] = None
+                            remaining = (end - datetime.datetime.now()).total_seconds()
+                        else:
+                            remaining -= self.prepare_ahead
+                    delay = min(delay, remaining)
+                await self.__wait_for(self.reports_changed, max(delay, 0))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Report task failed')
+                self.flash('red', self.reject_delay)
+                await asyncio.sleep(self.schedule_interval)
+
+    async def __flush_attendances(self):
+        '''
+        Make sure every scanned attendance is in the database
+        '''
+        await self.writes.join()
+        if len(self.journal):
+            self.attendance_writes += await self.__run_in(self.db, self.journal.replay, self.machine.add_attendance)
+        if len(self.journal):
+            raise sqlite3.OperationalError('Journaled attendances could not be saved')
+
+    async def __prepare_report(self, schedule, date: datetime.date):
+        await self.__flush_attendances()
+        writes = self.attendance_writes
+        data_version, attended, absents, teacher = await self.__run_in(self.db, self.__query_report, schedule, date)
+        message = teacher_report(schedule, date, attended, absents, self.machine.coalescer.footer)
+        return PreparedReport(schedule, date, attended, absents, teacher, message, writes, data_version)
+
+    def __query_report(self, schedule, date: datetime.date):
+        '''
+        Returns the data version, attendees, absentees and teacher of a class. Runs in the database thread
+        '''
+        # Read first, so changes committed while querying make the report outdated
+        data_version = self.machine.data_version()
+        attended = self.machine.get_attendance(date, schedule.id)
+        absents = self.machine.get_absents(date, schedule.id)
+        teacher = self.machine.get_teacher(schedule.teacher_id)
+        return data_version, attended, absents, teacher
+
+    async def __dispatch_report(self, schedule, date: datetime.date, delay: float, guardians: bool = True):
+        key = (schedule.id, date)
+        prepared = self.prepared.pop(key, None)
+        if key not in self.reported:
+            if await self.__run_in(self.db, self.machine.report_exists, schedule.id, date):
+                return
+            self.busy = True
+            try:
+                await self.__flush_attendances()
+                # Attendances recorded or edited after the report was prepared make it outdated
+                if prepared is None or prepared.writes != self.attendance_writes \
+                        or prepared.data_version != await self.__run_in(self.db, self.machine.data_version):
+                    prepared = await self.__prepare_report(schedule, date)
+                self.__send_report(prepared, delay, guardians)
+                self.reported.add(key)
+            finally:
+                self.busy = False
+        # A report that was queued is never queued again, even if marking it fails
+        await self.__run_in(self.db, self.machine.add_report, schedule.id, date)
+        self.reported.discard(key)
+
+    def __send_report(self, report: PreparedReport, delay: float, guardians: bool = True):
+        schedule = report.schedule
+        logger.info('Schedule ended', extra={'schedule': schedule.id, 'date': str(report.date), 'delay': round(delay, 3),
+                                             'attended': len(report.attended), 'absent': len(report.absents)})
+        self.machine.queue_sms(report.teacher.phone_number, report.message)
+        logger.info('Queued report to teacher', extra={'number': report.teacher.phone_number, 'length': len(report.message)})
+        if not guardians:
+            logger.info('Guardians not notified of a class that ended while stopped', extra={'schedule': schedule.id})
+            return
+
+        # Attended messages to the same parent are combined, absences are sent right away
+        for student in report.attended:
+            self.machine.notify_guardian(student.guardian_phone_number, guardian_message(student, schedule.subject, True))
+        for student in report.absents:
+            self.machine.notify_guardian(student.guardian_phone_number, guardian_message(student, schedule.subject, False), urgent=True)
+
+    async def __scan_loop(self):
+        while True:
+            try:
+                schedule = self.current_schedule
+                date = self.current_date
+                if not schedule or self.busy:
+                    await asyncio.sleep(0.5)
+                    continue
+                if self.batch:
+                    lrns = await self.__run_in(self.camera, self.machine.scan_qrcodes, self.scan_timeout, self.batch_window)
+                else:
+                    lrn = await self.__run_in(self.camera, self.machine.scan_qrcode, self.scan_timeout)
+                    lrns = [lrn] if lrn else []
+                if not lrns:
+                    continue
+                now = datetime.datetime.now()
+                # A badge held in front of the camera is scanned again and again.
+                # Answer repeats from memory without touching the database
+                repeats = [self.recent_scans.get((lrn, schedule.id, date)) for lrn in lrns]
+                lrns = [lrn for lrn, repeat in zip(lrns, repeats) if repeat is None]
+                if not lrns:
+                    # The same color as the first scan of the badge
+                    self.flash('green' if ACCEPTED in repeats else 'red', self.repeat_delay)
+                    await asyncio.sleep(self.repeat_delay)
+                    continue
+                students = await self.__run_in(self.db, self.__lookup_many, lrns, schedule.id, date)
+                attendances = []
+                for lrn, student in zip(lrns, students):
+                    self.recent_scans.add((lrn, schedule.id, date),
+                                          UNKNOWN if student is None else ACCEPTED if student else RECORDED)
+                    if student is None:
+                        logger.warning('LRN mismatched', extra={'lrn': lrn})
+                    elif student:
+                        attendances.append((student.id, schedule.id, date, now.time().strftime('%H:%M:%S')))
+                        logger.info('LRN matched', extra={'lrn': lrn})
+                if attendances:
+                    # One write and one acknowledgement for everyone in the batch
+                    self.pending_attendances.update(attendance[:3] for attendance in attendances)
+                    self.writes.put_nowait(attendances)
+                    self.flash('green', self.accept_delay)
+                    await asyncio.sleep(self.accept_delay)
+                else:
+                    self.flash('red', self.reject_delay)
+                    await asyncio.sleep(self.reject_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Scan task failed')
+                self.flash('red', self.reject_delay)
+                await asyncio.sleep(self.reject_delay)
+
+    def __lookup_many(self, lrns, schedule_id, date: datetime.date):
+        '''
+        Returns the student of every scanned LRN of a batch, False if the student
+        already has an attendance or None if the LRN does not exist. Students and
+        attendances are each looked up with one query. Runs in the database thread
+        '''
+        try:
+            students = self.machine.get_students_by_lrns(lrns)
+        except sqlite3.Error:
+            logger.warning('Database unavailable, using cached roster', exc_info=True)
+            students = self.roster
+        results = [students.get(lrn) for lrn in lrns]
+        keys = {(student.id, schedule_id, date) for student in results if student}
+        try:
+            existing = self.machine.attendance_exists_many(keys)
+        except sqlite3.Error:
+            existing = set()
+        for index, student in enumerate(results):
+            if not student:
+                continue
+            key = (student.id, schedule_id, date)
+            if key in existing or key in self.pending_attendances or (student.id, schedule_id, str(date)) in self.journal:
+                results[index] = False
+        return results
+
+    def __load_roster(self):
+        '''
+        Cache all students for scans while the database is unavailable. Runs in the database thread
+        '''
+        try:
+            self.roster = {student.lrn: student for student in self.machine.get_all_students()}
+        except sqlite3.Error:
+            logger.warning('Database unavailable, keeping cached roster', extra={'students': len(self.roster)})
+
+    async def __write_loop(self):
+        while True:
+            attendances = await self.writes.get()
+            try:
+                await self.__write(attendances)
+            finally:
+                self.writes.task_done()
+
+    async def __write(self, attendances):
+        try:
+            await self.__run_in(self.db, self.machine.add_attendances, attendances)
+        except Exception:
+            logger.warning('Saving attendances failed, journaling them', exc_info=True, extra={'attendances': len(attendances)})
+            for attendance in attendances:
+                self.journal.append(*attendance)
+        finally:
+            self.attendance_writes += 1
+            for attendance in attendances:
+                self.pending_attendances.discard(attendance[:3])
+
+    async def __watch_loop(self):
+        while True:
+            try:
+                changed, schedule = await self.__run_in(self.db, self.__check_versions)
+                if 'schedule' in changed:
+                    if self.current_schedule and not self.busy:
+                        if not schedule:
+                            logger.info('Current schedule deleted', extra={'schedule': self.current_schedule.id})
+                        self.current_schedule = schedule
+                    self.schedule_changed.set()
+                    self.reports_changed.set()
+                if 'student' in changed:
+                    # A remembered unknown LRN may have just been added
+                    self.recent_scans.clear()
+                if changed:
+                    logger.info('Reloaded changed data', extra={'entities': sorted(changed)})
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Watch task failed')
+            await asyncio.sleep(self.watch_interval)
+
+    def __check_versions(self):
+        '''
+        Reload entities changed by other connections. Returns the changed entities
+        and the reloaded current schedule. Runs in the database thread
+        '''
+        data_version = self.machine.data_version()
+        if data_version == self.data_version:
+            return set(), None
+        self.data_version = data_version
+        versions = self.machine.get_entity_versions()
+        if self.entity_versions is None:
+            self.entity_versions = versions
+            return set(), None
+        changed = {entity for entity, version in versions.items() if self.entity_versions.get(entity) != version}
+        self.entity_versions = versions
+        if 'student' in changed:
+            self.__load_roster()
+        schedule = None
+        if 'schedule' in changed and self.current_schedule:
+            schedule = self.machine.get_schedule_by_id(self.current_schedule.id)
+        return changed, schedule
+
+    async def __replay_loop(self):
+        while True:
+            if len(self.journal):
+                try:
+                    self.attendance_writes += await self.__run_in(self.db, self.journal.replay, self.machine.add_attendance)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception('Replaying journal failed')
+            await asyncio.sleep(self.replay_interval)
+
+    async def __inbox_loop(self):
+        while True:
+            try:
+                for message in await self.__run_in(self.modem, self.machine.inbox.receive):
+                    await self.__run_in(self.db, self.machine.inbox.dispatch, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Inbox task failed')
+            await asyncio.sleep(self.outbox_interval)
+
+    async def __send_loop(self):
+        while True:
+            try:
+                if await self.__run_in(self.modem, self.machine.process_outbox):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('SMS task failed')
+            await asyncio.sleep(self.outbox_interval)
+
+    async def __led_loop(self):
+        color = None
+        while True:
+            if self.led_override and self.led_override[1] > time.monotonic():
+                wanted = self.led_override[0]
+            elif self.busy or not self.current_schedule:
+                wanted = 'yellow'
+            else:
+                wanted = 'blue'
+            if wanted != color:
+                self.machine.change_led_color(wanted)
+                color = wanted
+            await asyncio.sleep(0.1)
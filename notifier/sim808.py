@@ -1,15 +1,153 @@
-import serial
 import time
 import datetime
 import re
+import collections
+from abc import ABC, abstractmethod
 
-class Sim808:
+from .inbox import parse_cmti, parse_cmgl, parse_cmgr, parse_cds
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+CMGS_PATTERN = re.compile(r'\+CMGS:\s*(\d+)')
+ERROR_PATTERN = re.compile(r'\+CMS ERROR:\s*\d+|\bERROR\b')
+
+class SmsError(Exception):
+    '''
+    Raised when the SIM808 module fails to send a SMS message
+    '''
+
+class ModemUnavailable(SmsError):
+    '''
+    Raised when no SIM808 module is connected. The message itself was never tried
+    '''
+
+class Modem(ABC):
+    '''
+    Base class of modem drivers
+
+    Subclasses set `name` and are opened with the port of the module.
+    '''
+    name = None
+
+    @abstractmethod
+    def send_sms(self, number: str, message: str, timeout: float = 60):
+        '''
+        Send a SMS message
+
+        Parameters:
+        number (str) : Number to send message to. Should contain country code
+        message (str) : Message to send
+        timeout (float) : Seconds to wait for the network to accept the message
+
+        Returns:
+        int : Message reference, matched by delivery reports
+
+        Raises:
+        SmsError : The message could not be sent
+        '''
+
+    @abstractmethod
+    def poll_delivery_reports(self):
+        '''
+        Get the delivery reports received since the last call
+
+        Returns:
+        list of tupple : (message_reference, status). Status 0 to 31 is delivered,
+        32 to 63 is still being tried and 64 and above is failed
+        '''
+
+    @abstractmethod
+    def poll_notifications(self):
+        '''
+        Get the storage indexes of sms received since the last call
+
+        Returns:
+        list of int : Storage indexes
+        '''
+
+    @abstractmethod
+    def read_unread_sms(self):
+        '''
+        Get unread sms
+
+        Returns:
+        str : Unread sms as listed by the module
+        '''
+
+    @abstractmethod
+    def list_sms(self, status: str = 'REC UNREAD'):
+        '''
+        Get stored sms
+
+        Parameters:
+        status (str) : `REC UNREAD`, `REC READ`, `STO UNSENT`, `STO SENT` or `ALL`
+
+        Returns:
+        list of SmsMessage : Stored sms
+        '''
+
+    @abstractmethod
+    def read_sms(self, index: int):
+        '''
+        Get a stored sms
+
+        Parameters:
+        index (int) : Storage index
+
+        Returns:
+        SmsMessage | None : Stored sms. None if the index is empty
+        '''
+
+    @abstractmethod
+    def delete_sms(self, index: int):
+        '''
+        Delete a stored sms
+
+        Parameters:
+        index (int) : Storage index
+        '''
+
+    @abstractmethod
+    def delete_all_sms(self):
+        '''
+        Delete all stored sms (inbox and sent)
+        '''
+
+    @abstractmethod
+    def get_time(self):
+        '''
+        Get network date and time
+
+        Returns:
+        datetime.datetime : Network date and time
+        '''
+
+    @abstractmethod
+    def is_alive(self):
+        '''
+        Check if the module answers commands
+
+        Returns:
+        bool : Alive
+        '''
+
+    @abstractmethod
+    def reconnect(self):
+        '''
+        Reopen the connection to the module
+        '''
+
+class Sim808(Modem):
     '''
     Initialize a Sim808 object for communicating with a SIM808 module
 
     Parameters:
     port (str) : Serial port of SIM808 module 
     '''
+    name = 'sim808'
 
     def __init__(self, port):
         '''
@@ -18,7 +156,14 @@ class Sim808:
         Parameters:
         port (str) : Serial port of SIM808 module 
         '''
+        if serial is None:
+            raise RuntimeError('pyserial is needed to talk to a SIM808 module')
+        self.port = port
         self.sim808 = serial.Serial(port, 115200, timeout=1)
+        self.notifications = collections.deque()
+        self.delivery_reports = collections.deque()
+        # Unfinished last line of a read, completed by the next one
+        self.partial = ''
         self.initialize()
 
     def initialize(self):
@@ -31,6 +176,37 @@ class Sim808:
             raise Exception('Error starting sim808')
         self.send_command('AT+CMGF=1\r\n')
         self.read_response()
+        # Request delivery reports for sent messages
+        self.send_command('AT+CSMP=49,167,0,0\r\n')
+        self.read_response()
+        # Report new messages with unsolicited `+CMTI: "SM",<index>` lines
+        # and delivery reports with `+CDS: ...` lines
+        self.send_command('AT+CNMI=2,1,0,1,0\r\n')
+        self.read_response()
+ 
+    def reconnect(self):
+        '''
+        Reopen the serial port and initialize the SIM808 module again
+        '''
+        try:
+            self.sim808.close()
+        except (serial.SerialException, OSError):
+            pass
+        self.sim808 = serial.Serial(self.port, 115200, timeout=1)
+        self.initialize()
+
+    def is_alive(self):
+        '''
+        Check if SIM808 answers commands
+
+        Returns:
+        bool : Alive
+        '''
+        try:
+            self.send_command('AT\r\n', timeout=0.2)
+            return 'OK' in self.read_response()
+        except (serial.SerialException, OSError):
+            return False
  
     def read_response(self):
         '''
@@ -43,7 +219,28 @@ class Sim808:
         while(self.sim808.inWaiting()):
             bit = self.sim808.read()
             response = response + bit.decode()
+        self.parse_notifications(response)
         return response
+
+    def parse_notifications(self, response: str):
+        '''
+        Queue the new message notifications and delivery reports of a response
+
+        Unsolicited notifications can arrive in the middle of any response and
+        a read can stop in the middle of one, so only complete lines are parsed
+        and the rest is kept for the next read.
+
+        Parameters:
+        response (str) : SIM808 response
+        '''
+        complete, _, self.partial = (self.partial + response).rpartition('\n')
+        # Only an unfinished notification is worth keeping
+        if not self.partial.lstrip().startswith('+'):
+            self.partial = ''
+        if '+CMTI' in complete:
+            self.notifications.extend(parse_cmti(complete))
+        if '+CDS' in complete:
+            self.delivery_reports.extend(parse_cds(complete))
  
     def send_command(self, command: str, timeout: float = 1):
         '''
@@ -56,24 +253,51 @@ class Sim808:
         self.sim808.write(command.encode())
         time.sleep(timeout)
  
-    def send_sms(self, number: str, message: str):
+    def send_sms(self, number: str, message: str, timeout: float = 60):
         '''
         Send a SMS message
 
         Parameters:
         number (str) : Number to send message to. Should contain country code
         message (str) : Message to send
+        timeout (float) : Seconds to wait for the network to accept the message
+
+        Returns:
+        int : Message reference, matched by delivery reports
+
+        Raises:
+        SmsError : The module returned an error or did not answer in time
         '''
         self.send_command('AT+CMGS="' + number + '"\r')
         time.sleep(0.1)
-        self.send_command(message + '\x1A\n')
-        print(f'Sleeping for {0.1*(len(message)/5)}s')
-        time.sleep(0.1*(len(message)/5))
-        response = self.read_response()
-        while 'OK' not in response:
+        self.send_command(message + '\x1A\n', timeout=0.1)
+        deadline = time.monotonic() + timeout
+        response = ''
+        while time.monotonic() < deadline:
+            response += self.read_response()
+            match = CMGS_PATTERN.search(response)
+            if match and 'OK' in response[match.end():]:
+                return int(match.group(1))
+            if ERROR_PATTERN.search(response):
+                raise SmsError(f'Sending SMS failed: {response.strip()}')
             time.sleep(0.1)
-            response = self.read_response()
-        print(response)
+        # Cancel the pending prompt so the next command is not sent as message text
+        self.sim808.write(b'\x1B')
+        raise SmsError('Sending SMS timed out')
+
+    def poll_delivery_reports(self):
+        '''
+        Get the delivery reports received since the last call
+
+        Returns:
+        list of tupple : (message_reference, status). Status 0 to 31 is delivered,
+        32 to 63 is still being tried and 64 and above is failed
+        '''
+        if self.sim808.inWaiting():
+            self.read_response()
+        reports = list(self.delivery_reports)
+        self.delivery_reports.clear()
+        return reports
 
     def read_unread_sms(self):
         '''
@@ -87,6 +311,55 @@ class Sim808:
         response = self.read_response()
         return response
 
+    def list_sms(self, status: str = 'REC UNREAD'):
+        '''
+        Get stored sms
+
+        Parameters:
+        status (str) : `REC UNREAD`, `REC READ`, `STO UNSENT`, `STO SENT` or `ALL`
+
+        Returns:
+        list of SmsMessage : Stored sms
+        '''
+        self.send_command(f'AT+CMGL="{status}"\r\n')
+        return parse_cmgl(self.read_response())
+
+    def read_sms(self, index: int):
+        '''
+        Get a stored sms
+
+        Parameters:
+        index (int) : Storage index
+
+        Returns:
+        SmsMessage | None : Stored sms. None if the index is empty
+        '''
+        self.send_command(f'AT+CMGR={index}\r\n', timeout=0.3)
+        return parse_cmgr(index, self.read_response())
+
+    def delete_sms(self, index: int):
+        '''
+        Delete a stored sms
+
+        Parameters:
+        index (int) : Storage index
+        '''
+        self.send_command(f'AT+CMGD={index}\r\n', timeout=0.3)
+        self.read_response()
+
+    def poll_notifications(self):
+        '''
+        Get the storage indexes of sms received since the last call
+
+        Returns:
+        list of int : Storage indexes
+        '''
+        if self.sim808.inWaiting():
+            self.read_response()
+        indexes = list(self.notifications)
+        self.notifications.clear()
+        return indexes
+
     def get_time(self):
         '''
         Get network date and time
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .database import NotifierDatabase
+from .decoders import Decoder, DecodedCode
+from .drivers import Camera, MemoryIndicator, MemoryModem
+from .notifier import Notifier
+from .runtime import NotifierRuntime
+
+logger = logging.getLogger(__name__)
+
+MANAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'attendance_notifier', 'manage.py')
+
+
+class Door:
+    '''
+    Students queueing in front of the scanner
+
+    Shared by the simulated camera, which shows the students at the front of
+    the queue, and the simulated decoder, which takes scanned students out.
+    A student who waits longer than `patience` seconds walks in unrecorded.
+
+    Parameters:
+    patience (float) : Seconds a student waits to be scanned
+    group (int) : Students in front of the camera at once
+    '''
+
+    def __init__(self, patience: float = 30, group: int = 1):
+        '''
+        Students queueing in front of the scanner
+
+        Parameters:
+        patience (float) : Seconds a student waits to be scanned
+        group (int) : Students in front of the camera at once
+        '''
+        self.patience = patience
+        self.group = group
+        self.lock = threading.Lock()
+        # (monotonic arrival time, lrn), in arrival order
+        self.arrivals = collections.deque()
+        self.waiting = collections.deque()
+        self.arrived = 0
+        self.gave_up = 0
+        self.latencies = []
+
+    def add_arrivals(self, arrivals):
+        '''
+        Add students that will arrive
+
+        Parameters:
+        arrivals (list of tupple) : (monotonic arrival time, lrn)
+        '''
+        with self.lock:
+            self.arrivals = collections.deque(sorted(itertools.chain(self.arrivals, arrivals)))
+
+    def in_front(self):
+        '''
+        Get the students in front of the camera
+
+        Returns:
+        tupple of str : LRNs
+        '''
+        now = time.monotonic()
+        with self.lock:
+            while self.arrivals and self.arrivals[0][0] <= now:
+                self.waiting.append(self.arrivals.popleft())
+                self.arrived += 1
+            while self.waiting and now - self.waiting[0][0] > self.patience:
+                self.waiting.popleft()
+                self.gave_up += 1
+            return tuple(lrn for _, lrn in itertools.islice(self.waiting, self.group))
+
+    def scanned(self, lrn: str):
+        '''
+        Take a scanned student out of the queue
+
+        Parameters:
+        lrn (str) : LRN of the student
+        '''
+        now = time.monotonic()
+        with self.lock:
+            for item in self.waiting:
+                if item[1] == lrn:
+                    self.waiting.remove(item)
+                    self.latencies.append(now - item[0])
+                    return
+
+
+class SimulatedCamera(Camera):
+    '''
+    Camera whose frames are the LRNs of the students in front of it
+
+    Parameters:
+    door (Door) : Students queueing in front of the camera
+    fps (float) : Frames per second
+    '''
+
+    def __init__(self, door: Door, fps: float = 15):
+        '''
+        Camera whose frames are the LRNs of the students in front of it
+
+        Parameters:
+        door (Door) : Students queueing in front of the camera
+        fps (float) : Frames per second
+        '''
+        super().__init__(fps)
+        self.door = door
+
+    def next_frame(self):
+        return self.door.in_front()
+
+
+class SimulatedDecoder(Decoder):
+    '''
+    Decoder of simulated frames that takes `decode_time` seconds per frame
+
+    Parameters:
+    door (Door) : Students queueing in front of the camera
+    decode_time (float) : Seconds a decode takes
+    '''
+    name = 'simulated'
+
+    def __init__(self, door: Door, decode_time: float = 0.02):
+        '''
+        Decoder of simulated frames that takes `decode_time` seconds per frame
+
+        Parameters:
+        door (Door) : Students queueing in front of the camera
+        decode_time (float) : Seconds a decode takes
+        '''
+        self.door = door
+        self.decode_time = decode_time
+
+    def decode(self, frame):
+        time.sleep(self.decode_time)
+        for lrn in frame:
+            self.door.scanned(lrn)
+        return [DecodedCode(lrn, []) for lrn in frame]
+
+
+class SceneGate:
+    '''
+    Motion gate for simulated frames. Frames without students are not decoded
+    '''
+
+    def __init__(self):
+        self.decoded = 0
+        self.skipped = 0
+
+    def delay(self):
+        return 0
+
+    def check(self, frame):
+        if frame:
+            self.decoded += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+def create_database(path: str):
+    '''
+    Create a scratch database with the schema of the Django project
+
+    Parameters:
+    path (str) : Database path
+    '''
+    env = dict(os.environ, ATTENDANCE_DATABASE=path)
+    subprocess.run([sys.executable, MANAGE, 'migrate', '--verbosity', '0'], env=env, check=True)
+
+
+def generate_roster(students: int, periods: int, period: float, gap: float, start: datetime.datetime):
+    '''
+    Generate teachers, students and a timetable of back to back periods
+
+    Parameters:
+    students (int) : Number of students
+    periods (int) : Number of periods
+    period (float) : Seconds a period lasts
+    gap (float) : Seconds between periods
+    start (datetime.datetime) : Start of the first period
+
+    Returns:
+    tupple : (teachers, students, schedules) rows for NotifierDatabase.update_roster
+    '''
+    teachers = [(i, 'Teacher', str(i), f'+6390{i:08d}') for i in range(1, periods + 1)]
+    roster = [(i, f'SIM{i:08d}', 'Student', str(i), f'+6391{i % 100000:08d}') for i in range(1, students + 1)]
+    schedules = []
+    for i in range(periods):
+        begin = start + datetime.timedelta(seconds=i * (period + gap))
+        end = begin + datetime.timedelta(seconds=period)
+        if end.date() != start.date():
+            raise ValueError('The simulated day must end before midnight')
+        # Lateness thresholds in minutes are meaningless in a compressed day
+        schedules.append((i + 1, f'Period {i + 1}', begin.isoweekday(), begin.strftime('%H:%M:%S'),
+                          end.strftime('%H:%M:%S'), i + 1, 15, 30))
+    return teachers, roster, schedules
+
+
+def generate_arrivals(roster, schedules, absent_rate: float, rate: float, rng: random.Random):
+    '''
+    Generate the arrival of the students at the door as a Poisson process
+
+    Every student is expected in every schedule, like in get_absents, so the
+    whole roster less the absentees arrives for each period.
+
+    Parameters:
+    roster (list) : Student rows
+    schedules (list) : Schedule rows
+    absent_rate (float) : Fraction of the students that never arrives
+    rate (float) : Students arriving per second
+    rng (random.Random) : Random number generator
+
+    Returns:
+    list of tupple : (monotonic arrival time, lrn)
+    '''
+    now = time.monotonic()
+    today = datetime.date.today()
+    arrivals = []
+    for schedule in schedules:
+        begin = datetime.datetime.combine(today, datetime.time.fromisoformat(schedule[3]))
+        moment = now + (begin - datetime.datetime.now()).total_seconds()
+        students = rng.sample(roster, len(roster))
+        for student in students[:round(len(students) * (1 - absent_rate))]:
+            moment += rng.expovariate(rate)
+            arrivals.append((moment, student[1]))
+    return arrivals
+
+
+def database_size(path: str):
+    '''
+    Get the bytes of the pages a database uses
+
+    The WAL is checkpointed first so every page is counted once. Free pages,
+    e.g. the ones the migrations leave behind, are not counted, since new rows
+    reuse them without the file growing.
+
+    Parameters:
+    path (str) : Database path
+
+    Returns:
+    int : Bytes
+    '''
+    database = sqlite3.connect(path)
+    try:
+        database.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        page_size = database.execute('PRAGMA page_size').fetchone()[0]
+        pages = database.execute('PRAGMA page_count').fetchone()[0]
+        free = database.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        database.close()
+    return (pages - free) * page_size
+
+
+def percentile(values, percent: int):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def simulate(students: int = 40, periods: int = 8, period: float = 60, gap: float = 3, absent_rate: float = 0.1,
+             rate: float = 2, patience: float = 30, group: int = 1, batch: bool = False,
+             fps: float = 15, decode_time: float = 0.02, modems: int = 1, send_time: float = 0.5,
+             failure_rate: float = 0, accept_delay: float = 3, reject_delay: float = 1, coalesce_window: float = 5,
+             drain: float = 30, directory: str = None, seed: int = 0):
+    '''
+    Run a compressed school day through the notifier with simulated hardware
+
+    Parameters:
+    students (int) : Students in the roster, all expected in every period
+    periods (int) : Periods in the day
+    period (float) : Seconds a period lasts
+    gap (float) : Seconds between periods
+    absent_rate (float) : Fraction of the students that never arrives
+    rate (float) : Students arriving at the door per second
+    patience (float) : Seconds a student waits to be scanned
+    group (int) : Students in front of the camera at once
+    batch (bool) : Scan in batch mode
+    fps (float) : Camera frames per second
+    decode_time (float) : Seconds a frame decode takes
+    modems (int) : Simulated SIM808 modules
+    send_time (float) : Seconds a SMS send takes
+    failure_rate (float) : Fraction of SMS sends that fail
+    accept_delay (float) : Seconds the LED stays green after a recorded attendance
+    reject_delay (float) : Seconds the LED stays red after a rejected scan
+    coalesce_window (float) : Seconds guardian messages are held to be combined
+    drain (float) : Maximum seconds to keep sending SMS after the last period
+    directory (str) : Directory for the database and journal. A temporary one if not given
+    seed (int) : Random seed
+
+    Returns:
+    dict : Scan, SMS and database statistics
+    '''
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = directory or scratch
+        path = os.path.join(directory, 'simulation.sqlite3')
+        if os.path.exists(path):
+            os.remove(path)
+        create_database(path)
+
+        start = (datetime.datetime.now() + datetime.timedelta(seconds=5)).replace(microsecond=0)
+        teachers, roster, schedules = generate_roster(students, periods, period, gap, start)
+        database = NotifierDatabase(path)
+        database.update_roster(teachers, roster, schedules)
+        database.close()
+        initial_size = database_size(path)
+
+        door = Door(patience=patience, group=group)
+        door.add_arrivals(generate_arrivals(roster, schedules, absent_rate, rate, rng))
+        camera = SimulatedCamera(door, fps)
+        gate = SceneGate()
+        indicator = MemoryIndicator()
+        machine = Notifier(
+            database=path,
+            port=[f'sim{i}' for i in range(modems)],
+            rgby_pins=(18, 23, 24, 17),
+            coalesce_window=coalesce_window,
+            motion_gate=gate,
+            decoder=SimulatedDecoder(door, decode_time),
+            indicator=indicator,
+            capture=camera,
+            modem_factory=lambda port: MemoryModem(port, send_time, failure_rate),
+            preview=False)
+        runtime = NotifierRuntime(
+            machine,
+            accept_delay=accept_delay,
+            reject_delay=reject_delay,
+            schedule_interval=1,
+            journal=os.path.join(directory, 'simulation-journal.jsonl'),
+            batch=batch)
+
+        end = start + datetime.timedelta(seconds=periods * (period + gap))
+        backlog = []
+
+        async def monitor():
+            while datetime.datetime.now() < end or machine.outbox.pending() or machine.coalescer.pending:
+                if (datetime.datetime.now() - end).total_seconds() > drain:
+                    break
+                backlog.append(machine.outbox.pending())
+                await asyncio.sleep(1)
+            runtime.stop()
+
+        async def run():
+            task = asyncio.create_task(monitor())
+            await runtime.run()
+            task.cancel()
+
+        started = time.monotonic()
+        asyncio.run(run())
+        elapsed = time.monotonic() - started
+
+        database = NotifierDatabase(path)
+        recorded = database.cursor.execute('SELECT COUNT(*) FROM core_attendance').fetchone()[0]
+        database.close()
+        latencies = door.latencies
+        return {
+            'elapsed': elapsed,
+            'arrived': door.arrived,
+            'scanned': len(latencies),
+            'recorded': recorded,
+            'gave_up': door.gave_up + len(door.waiting),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_max': max(latencies, default=0),
+            'frames': camera.frames,
+            'frames_decoded': gate.decoded,
+            'sms_sent': sum(modem.sent for modem in machine.gsm.modems),
+            'sms_unsent': machine.outbox.pending(),
+            'sms_backlog_max': max(backlog, default=0),
+            'led_changes': indicator.changes,
+            'database_growth': database_size(path) - initial_size,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the notifier with a compressed school day on simulated hardware')
+    parser.add_argument('--students', type=int, default=40, help='Students expected in every period')
+    parser.add_argument('--periods', type=int, default=8)
+    parser.add_argument('--period', type=float, default=60, help='Seconds a period lasts')
+    parser.add_argument('--gap', type=float, default=3, help='Seconds between periods')
+    parser.add_argument('--absent-rate', type=float, default=0.1)
+    parser.add_argument('--rate', type=float, default=2, help='Students arriving per second')
+    parser.add_argument('--patience', type=float, default=30, help='Seconds a student waits to be scanned')
+    parser.add_argument('--group', type=int, default=1, help='Students in front of the camera at once')
+    parser.add_argument('--batch', action='store_true', help='Scan in batch mode')
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--decode-time', type=float, default=0.02)
+    parser.add_argument('--modems', type=int, default=1)
+    parser.add_argument('--send-time', type=float, default=0.5, help='Seconds a SMS send takes')
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--accept-delay', type=float, default=3)
+    parser.add_argument('--reject-delay', type=float, default=1)
+    parser.add_argument('--coalesce-window', type=float, default=5)
+    parser.add_argument('--drain', type=float, default=30, help='Maximum seconds to keep sending after the last period')
+    parser.add_argument('--directory', help='Keep the database and journal in this directory')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='WARNING')
+    args = vars(parser.parse_args(argv))
+    logging.basicConfig(level=args.pop('log_level'))
+
+    result = simulate(**args)
+    print(f'Simulated {args["periods"]} periods of {args["period"]:g}s in {result["elapsed"]:.0f}s')
+    print(f'Students  arrived {result["arrived"]}, scanned {result["scanned"]}, recorded {result["recorded"]}, '
+          f'gave up {result["gave_up"]}')
+    print(f'Latency   p50 {result["latency_p50"]:.2f}s, p95 {result["latency_p95"]:.2f}s, max {result["latency_max"]:.2f}s')
+    print(f'Camera    {result["frames"]} frames, {result["frames_decoded"]} decoded')
+    print(f'SMS       sent {result["sms_sent"]}, unsent {result["sms_unsent"]}, max backlog {result["sms_backlog_max"]}')
+    print(f'Database  grew {result["database_growth"] / 1024:.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import gzip
+import http.server
+import json
+import logging
+import threading
+import urllib.parse
+import urllib.request
+
+from .database import NotifierDatabase
+
+logger = logging.getLogger(__name__)
+
+# Attendances are pushed as rows of these columns. `id` is the id on the unit
+ATTENDANCE_COLUMNS = ('id', 'lrn', 'schedule_id', 'date', 'time_in')
+
+class UnitSync(threading.Thread):
+    '''
+    Background thread that syncs a classroom unit with the central server
+
+    Every sync pulls the roster and the high water mark of this unit, which is
+    the last attendance id the server has. Attendances after it are then pushed
+    in gzip compressed batches. The server keeps the high water mark, so a
+    failed push is simply sent again. The unit only remembers the last mark it
+    saw, so the archiver never moves attendances the server does not have yet.
+
+    Roster rows are only deleted when the server lists them as removed, and a
+    roster without students or schedules is never applied, so an empty or new
+    server cannot wipe the roster of a unit.
+
+    Parameters:
+    database (str) : Database path
+    url (str) : Base URL of the central server, e.g. `https://school.example/`
+    token (str) : Token of this unit on the central server
+    interval (float) : Seconds between syncs
+    batch_size (int) : Attendances pushed per request
+    '''
+
+    def __init__(self, database: str, url: str, token: str, interval: float = 300, batch_size: int = 500):
+        '''
+        Background thread that syncs a classroom unit with the central server
+
+        Parameters:
+        database (str) : Database path
+        url (str) : Base URL of the central server, e.g. `https://school.example/`
+        token (str) : Token of this unit on the central server
+        interval (float) : Seconds between syncs
+        batch_size (int) : Attendances pushed per request
+        '''
+        super().__init__(name='unit-sync', daemon=True)
+        self.database_path = database
+        self.url = url.rstrip('/') + '/'
+        self.token = token
+        self.interval = interval
+        self.batch_size = batch_size
+        self.version = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        '''
+        Sync until the thread is stopped
+        '''
+        while not self.stopped.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning('Sync failed', extra={'error': str(e)})
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        '''
+        Stop syncing after the current sync
+        '''
+        self.stopped.set()
+
+    def sync(self):
+        '''
+        Pull the roster and push new attendances
+
+        Returns:
+        int : Number of attendances pushed
+        '''
+        # sqlite connections cannot be shared between threads
+        database = NotifierDatabase(self.database_path)
+        try:
+            high_water = self.pull(database)
+            database.set_sync_high_water(high_water)
+            return self.push(database, high_water)
+        finally:
+            database.close()
+
+    def pull(self, database: NotifierDatabase):
+        '''
+        Apply roster changes of the central server
+
+        Parameters:
+        database (NotifierDatabase) : Database
+
+        Returns:
+        int : ID of the last attendance the server has
+        '''
+        query = urllib.parse.urlencode({'version': self.version or ''})
+        response = self.__request('GET', f'sync/pull/?{query}')
+        roster = response.get('roster')
+        if roster is not None:
+            if not roster['students'] or not roster['schedules']:
+                # Tried again on the next sync, until the server has a roster
+                logger.warning('Ignored empty roster from server', extra={
+                    'students': len(roster['students']), 'schedules': len(roster['schedules'])})
+                return response['high_water']
+            database.update_roster(roster['teachers'], roster['students'], roster['schedules'], response.get('removed'))
+            logger.info('Roster updated', extra={'version': response['version'], 'students': len(roster['students'])})
+        self.version = response['version']
+        return response['high_water']
+
+    def push(self, database: NotifierDatabase, high_water: int):
+        '''
+        Push attendances after the high water mark in batches
+
+        Parameters:
+        database (NotifierDatabase) : Database
+        high_water (int) : ID of the last attendance the server has
+
+        Returns:
+        int : Number of attendances pushed
+        '''
+        pushed = 0
+        while True:
+            rows = database.get_attendance_since(high_water, self.batch_size)
+            if not rows:
+                break
+            response = self.__request('POST', 'sync/push/', {'columns': ATTENDANCE_COLUMNS, 'rows': rows})
+            if response['high_water'] <= high_water:
+                raise Exception('Server did not accept attendances')
+            high_water = response['high_water']
+            database.set_sync_high_water(high_water)
+            pushed += len(rows)
+            if response['rejected']:
+                logger.warning('Attendances rejected by server', extra={'rejected': response['rejected']})
+        if pushed:
+            logger.info('Attendances pushed', extra={'pushed': pushed, 'high_water': high_water})
+        return pushed
+
+    def __request(self, method: str, path: str, body: dict = None):
+        headers = {'Authorization': f'Token {self.token}', 'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = gzip.compress(json.dumps(body, separators=(',', ':')).encode())
+            headers['Content-Type'] = 'application/json'
+            headers['Content-Encoding'] = 'gzip'
+        request = urllib.request.Request(self.url + path, data=data, headers=headers, method=method)
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+
+class LocalSyncServer:
+    '''
+    In-memory stand-in for the central server, for tests and development
+
+    Implements the pull and push endpoints of the central server on a random
+    local port. Pushed attendances are kept in `attendances` by unit id, and
+    the ones of an unknown LRN or schedule in `rejected`.
+
+    Parameters:
+    roster (dict) : teachers, students and schedules served to units
+    token (str) : Token units must send
+    removed (dict) : teachers, students and schedules -> ids deleted on the server
+    '''
+
+    def __init__(self, roster: dict = None, token: str = 'test', removed: dict = None):
+        '''
+        In-memory stand-in for the central server, for tests and development
+
+        Parameters:
+        roster (dict) : teachers, students and schedules served to units
+        token (str) : Token units must send
+        removed (dict) : teachers, students and schedules -> ids deleted on the server
+        '''
+        self.roster = roster or {'teachers': [], 'students': [], 'schedules': []}
+        self.token = token
+        self.removed = removed or {'teachers': [], 'students': [], 'schedules': []}
+        self.attendances = {}
+        self.rejected = {}
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self.__handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def high_water(self):
+        return max(list(self.attendances) + list(self.rejected), default=0)
+
+    def __handler(self):
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if not self.__authorized():
+                    return
+                url = urllib.parse.urlparse(self.path)
+                if url.path != '/sync/pull/':
+                    return self.__reply(404, {'error': 'Not found'})
+                version = str(hash(json.dumps([stand_in.roster, stand_in.removed], sort_keys=True)))
+                response = {'high_water': stand_in.high_water, 'version': version}
+                if urllib.parse.parse_qs(url.query).get('version', [''])[0] != version:
+                    response['roster'] = stand_in.roster
+                    response['removed'] = stand_in.removed
+                self.__reply(200, response)
+
+            def do_POST(self):
+                if not self.__authorized():
+                    return
+                if self.path != '/sync/push/':
+                    return self.__reply(404, {'error': 'Not found'})
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                rows = json.loads(body)['rows']
+                lrns = {student[1] for student in stand_in.roster['students']}
+                schedule_ids = {schedule[0] for schedule in stand_in.roster['schedules']}
+                rejected = 0
+                for row in rows:
+                    if row[1] in lrns and row[2] in schedule_ids:
+                        stand_in.attendances[row[0]] = row
+                    else:
+                        stand_in.rejected[row[0]] = row
+                        rejected += 1
+                self.__reply(200, {'accepted': len(rows) - rejected, 'rejected': rejected, 'high_water': stand_in.high_water})
+
+            def __authorized(self):
+                if self.headers.get('Authorization') != f'Token {stand_in.token}':
+                    self.__reply(401, {'error': 'Invalid unit token'})
+                    return False
+                return True
+
+            def __reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
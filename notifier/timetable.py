@@ -0,0 +1,49 @@
+import datetime
+
+
+def class_times(schedule, date: datetime.date):
+    '''
+    Get when a class starts and ends. A class that does not end after it
+    starts, e.g. 22:00 - 01:00, ends on the next day
+
+    Parameters:
+    schedule (Schedule) : Schedule of the class
+    date (datetime.date) : Date the class starts
+
+    Returns:
+    tupple : (start, end) datetime.datetime
+    '''
+    start = datetime.datetime.combine(date, schedule.start)
+    end = datetime.datetime.combine(date, schedule.end)
+    if end <= start:
+        end += datetime.timedelta(days=1)
+    return start, end
+
+
+def classes_between(get_schedules_on, since: datetime.datetime, until: datetime.datetime):
+    '''
+    Get the classes that take place at some point from `since` to `until`
+
+    Parameters:
+    get_schedules_on (callable) : Returns the schedules of a day of the week (1 = Monday, 7 = Sunday)
+    since (datetime.datetime) : Start of the period
+    until (datetime.datetime) : End of the period
+
+    Returns:
+    list of tupple : (start, end, schedule, date) ordered by end, where date is the date the class starts
+    '''
+    schedules = {}
+    classes = []
+    # A class of the day before may still be running after midnight
+    date = since.date() - datetime.timedelta(days=1)
+    while date <= until.date():
+        day = date.isoweekday()
+        if day not in schedules:
+            schedules[day] = get_schedules_on(day)
+        for schedule in schedules[day]:
+            start, end = class_times(schedule, date)
+            if start <= until and end >= since:
+                classes.append((start, end, schedule, date))
+        date += datetime.timedelta(days=1)
+    classes.sort(key=lambda item: (item[1], item[2].id))
+    return classes
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def sd_notify(state: str):
+    '''
+    Send a state to systemd, e.g. `READY=1` or `WATCHDOG=1`
+
+    Parameters:
+    state (str) : Newline separated assignments
+
+    Returns:
+    bool : Whether it was sent. False when not run by a systemd unit with Type=notify
+    '''
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # Abstract socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode())
+        return True
+    except OSError as e:
+        logger.warning('Notifying systemd failed', extra={'error': str(e)})
+        return False
+
+
+def watchdog_interval():
+    '''
+    Get the seconds between the watchdog pings systemd expects, half of WatchdogSec
+
+    Returns:
+    float | None : Seconds. None when the unit has no watchdog
+    '''
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
+
+
+def is_locked(error: Exception):
+    '''
+    Check if a database error means another connection holds the lock
+
+    Parameters:
+    error (Exception) : Database error
+
+    Returns:
+    bool : Locked or busy
+    '''
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class Supervisor:
+    '''
+    Watch the camera, modems and database of a runtime and restart the ones that fail
+
+    Every `interval` seconds the supervisor checks that the camera delivers
+    frames while scanning, and from time to time sends AT to the modems and
+    takes the database write lock. A camera that only fails reads is reopened
+    and a database that cannot be written to is reconnected. Modems that do
+    not answer are taken out of the pool, which reconnects them. A database
+    that is only locked by another connection, e.g. the sync or the admin, is
+    reported as degraded without a restart, since scans go to the journal
+    until it is free again.
+
+    A probe that does not return within `probe_timeout` means its worker thread
+    is hung, e.g. on a serial read, which cannot be fixed from inside the
+    process. The same goes for a subsystem that keeps failing after
+    `max_restarts` restarts. The supervisor then stops pinging the systemd
+    watchdog so systemd restarts the process. Without a watchdog the runtime
+    is stopped as failed. The watchdog is pinged from its own task, so a probe
+    that is slow but within `probe_timeout` does not hold up the pings.
+
+    Parameters:
+    runtime (NotifierRuntime) : Runtime to watch
+    interval (float) : Seconds between checks
+    failed_reads (int) : Consecutive failed camera reads before the camera is reopened
+    modem_interval (float) : Seconds between modem heartbeats
+    database_interval (float) : Seconds between database write checks
+    probe_timeout (float) : Seconds a probe or a camera read may take before its thread counts as hung
+    max_restarts (int) : Restarts of a subsystem without recovering before the process is restarted
+    '''
+
+    def __init__(self, runtime, interval: float = 5, failed_reads: int = 30, modem_interval: float = 60,
+                 database_interval: float = 30, probe_timeout: float = 120, max_restarts: int = 3):
+        '''
+        Watch the camera, modems and database of a runtime and restart the ones that fail
+
+        Parameters:
+        runtime (NotifierRuntime) : Runtime to watch
+        interval (float) : Seconds between checks
+        failed_reads (int) : Consecutive failed camera reads before the camera is reopened
+        modem_interval (float) : Seconds between modem heartbeats
+        database_interval (float) : Seconds between database write checks
+        probe_timeout (float) : Seconds a probe or a camera read may take before its thread counts as hung
+        max_restarts (int) : Restarts of a subsystem without recovering before the process is restarted
+        '''
+        self.runtime = runtime
+        self.interval = interval
+        self.failed_reads = failed_reads
+        self.modem_interval = modem_interval
+        self.database_interval = database_interval
+        self.probe_timeout = probe_timeout
+        self.max_restarts = max_restarts
+        self.restarts = {'camera': 0, 'modem': 0, 'database': 0}
+        self.next_probe = {'modem': 0, 'database': 0}
+        self.camera_restarted = 0
+        # Why the process has to be restarted. None while healthy
+        self.failure = None
+        # Why a subsystem works only partly, by subsystem
+        self.degraded = {}
+        self.watchdog = watchdog_interval()
+
+    async def run(self):
+        '''
+        Check the subsystems until cancelled. Pings the systemd watchdog while healthy
+        '''
+        sd_notify('READY=1')
+        pinger = asyncio.create_task(self.ping()) if self.watchdog else None
+        try:
+            while True:
+                try:
+                    await self.check()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception('Supervisor check failed')
+                await asyncio.sleep(self.interval)
+        finally:
+            if pinger:
+                pinger.cancel()
+
+    async def ping(self):
+        '''
+        Ping the systemd watchdog until the process fails
+        '''
+        while self.failure is None:
+            sd_notify('WATCHDOG=1')
+            await asyncio.sleep(self.watchdog)
+
+    async def check(self):
+        '''
+        Run the probes that are due
+        '''
+        if self.failure is not None:
+            return
+        now = time.monotonic()
+        await self.__check_camera(now)
+        if now >= self.next_probe['modem']:
+            self.next_probe['modem'] = now + self.modem_interval
+            await self.__check_modems()
+        if now >= self.next_probe['database']:
+            self.next_probe['database'] = now + self.database_interval
+            await self.__check_database()
+
+    async def __probe(self, executor, func, *args):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), self.probe_timeout)
+
+    async def __check_camera(self, now: float):
+        machine = self.runtime.machine
+        read_started = machine.read_started
+        if read_started is not None and now - read_started > self.probe_timeout:
+            self.fail('camera', 'Camera read is hung')
+            return
+        if machine.last_frame is not None and machine.last_frame > self.camera_restarted:
+            # Frames came in since the last restart
+            self.restarts['camera'] = 0
+        if machine.failed_reads < self.failed_reads:
+            return
+        if not self.__restart('camera', {'failed_reads': machine.failed_reads}):
+            return
+        self.camera_restarted = now
+        try:
+            await self.__probe(self.runtime.camera, machine.reopen_camera)
+        except asyncio.TimeoutError:
+            self.fail('camera', 'Reopening camera is hung')
+        except Exception:
+            logger.exception('Reopening camera failed')
+
+    async def __check_modems(self):
+        pool = self.runtime.machine.gsm
+        try:
+            stuck = await self.__probe(self.runtime.modem, pool.heartbeat, self.probe_timeout)
+        except asyncio.TimeoutError:
+            self.fail('modem', 'Modem heartbeat is hung')
+            return
+        if stuck:
+            self.fail('modem', f'Modem stuck sending: {", ".join(stuck)}')
+
+    async def __check_database(self):
+        database = self.runtime.machine.database
+        try:
+            await self.__probe(self.runtime.db, database.check_writable)
+            self.restarts['database'] = 0
+            self.recover('database')
+            return
+        except asyncio.TimeoutError:
+            self.fail('database', 'Database check is hung')
+            return
+        except Exception as e:
+            if is_locked(e):
+                # Reconnecting does not free a lock held by another connection
+                self.degrade('database', 'Database is locked, attendances are journaled')
+                return
+            logger.error('Database is not writable', extra={'error': str(e)})
+        if not self.__restart('database', {}):
+            return
+        try:
+            await self.__probe(self.runtime.db, database.reconnect)
+        except asyncio.TimeoutError:
+            self.fail('database', 'Reconnecting database is hung')
+        except Exception:
+            logger.exception('Reconnecting database failed')
+
+    def __restart(self, subsystem: str, extra: dict):
+        '''
+        Count a restart. Returns False and fails when there were too many
+        '''
+        self.restarts[subsystem] += 1
+        if self.restarts[subsystem] > self.max_restarts:
+            self.fail(subsystem, f'{subsystem.capitalize()} did not recover after {self.max_restarts} restarts')
+            return False
+        logger.warning('Restarting subsystem', extra=dict(extra, subsystem=subsystem, restart=self.restarts[subsystem]))
+        return True
+
+    def degrade(self, subsystem: str, reason: str):
+        '''
+        Report a subsystem that works only partly without restarting anything
+
+        Parameters:
+        subsystem (str) : `camera`, `modem` or `database`
+        reason (str) : What is not working
+        '''
+        if self.degraded.get(subsystem) == reason:
+            return
+        self.degraded[subsystem] = reason
+        logger.warning('Subsystem degraded', extra={'subsystem': subsystem, 'reason': reason})
+        if self.failure is None:
+            sd_notify(f'STATUS={reason}')
+
+    def recover(self, subsystem: str):
+        '''
+        Clear the degraded status of a subsystem
+
+        Parameters:
+        subsystem (str) : `camera`, `modem` or `database`
+        '''
+        if self.degraded.pop(subsystem, None) is None:
+            return
+        logger.info('Subsystem recovered', extra={'subsystem': subsystem})
+        if self.failure is None:
+            sd_notify('STATUS=' + ('; '.join(self.degraded.values()) or 'Running'))
+
+    def fail(self, subsystem: str, reason: str):
+        '''
+        Give up on the process so it gets restarted
+
+        Parameters:
+        subsystem (str) : `camera`, `modem` or `database`
+        reason (str) : What went wrong
+        '''
+        if self.failure is not None:
+            return
+        self.failure = reason
+        logger.critical('Process needs a restart', extra={'subsystem': subsystem, 'reason': reason})
+        sd_notify(f'STATUS={reason}')
+        if not self.watchdog:
+            self.runtime.fail(reason)
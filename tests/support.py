@@ -0,0 +1,106 @@
+import asyncio
+import atexit
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from notifier import Notifier
+from notifier.decoders import DecodedCode, Decoder
+from notifier.drivers import MemoryCamera, MemoryIndicator, MemoryModem
+from notifier.simulation import SceneGate, create_database
+
+_template = None
+
+
+def create_test_database(directory: str):
+    '''
+    Create a database with the schema of the Django project. Migrations run
+    once per test run and the result is copied for every test
+
+    Parameters:
+    directory (str) : Directory of the database
+
+    Returns:
+    str : Database path
+    '''
+    global _template
+    if _template is None:
+        scratch = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, scratch, True)
+        _template = os.path.join(scratch, 'template.sqlite3')
+        create_database(_template)
+    path = os.path.join(directory, 'db.sqlite3')
+    shutil.copy(_template, path)
+    return path
+
+
+def add_class(path: str, start: datetime.datetime, end: datetime.datetime, students: int = 2):
+    '''
+    Add a teacher, students and a class from start to end to a test database
+
+    Returns:
+    list of str : LRNs of the students
+    '''
+    database = sqlite3.connect(path)
+    with database:
+        database.execute("INSERT INTO core_teacher (id, first_name, last_name, phone_number) VALUES (1, 'Ana', 'Cruz', '+639170000001')")
+        lrns = []
+        for i in range(1, students + 1):
+            lrns.append(f'LRN{i}')
+            database.execute('INSERT INTO core_student (id, lrn, first_name, last_name, guardian_phone_number) VALUES (?, ?, ?, ?, ?)',
+                             (i, f'LRN{i}', 'Student', str(i), f'+63917000010{i}'))
+        database.execute('''
+            INSERT INTO core_schedule (id, subject, day, start, end, teacher_id, late_after, very_late_after)
+            VALUES (1, 'Math', ?, ?, ?, 1, 15, 30)
+        ''', (start.isoweekday(), start.strftime('%H:%M:%S'), end.strftime('%H:%M:%S')))
+    database.close()
+    return lrns
+
+
+class FrameDecoder(Decoder):
+    '''
+    Decoder of test frames, which are tupples of the LRNs in front of the camera
+    '''
+    name = 'frames'
+
+    def decode(self, frame):
+        return [DecodedCode(lrn, []) for lrn in frame]
+
+
+def create_machine(database, frames = (), coalesce_window: float = 0, sms_journal: str = None):
+    '''
+    Create a notifier on the memory LED, camera and modem
+
+    Parameters:
+    database (str | Store) : Database path or store
+    frames (iterable) : Camera frames, tupples of LRNs
+    coalesce_window (float) : Seconds guardian messages are held to be combined
+    sms_journal (str) : File where queued SMS are kept until sent
+
+    Returns:
+    Notifier : Notifier. Its memory modem is `machine.gsm.modems[0].gsm`
+    '''
+    return Notifier(
+        database=database,
+        port='memory',
+        rgby_pins=(18, 23, 24, 17),
+        coalesce_window=coalesce_window,
+        motion_gate=SceneGate(),
+        decoder=FrameDecoder(),
+        indicator=MemoryIndicator(),
+        capture=MemoryCamera(frames, fps=100),
+        modem_factory=MemoryModem,
+        preview=False,
+        sms_journal=sms_journal)
+
+
+def run_for(runtime, seconds: float):
+    '''
+    Run a runtime for some seconds
+    '''
+    async def run():
+        asyncio.get_running_loop().call_later(seconds, runtime.stop)
+        await runtime.run()
+    asyncio.run(run())
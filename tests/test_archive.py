@@ -0,0 +1,109 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from notifier.archive import AttendanceArchiver
+from notifier.database import NotifierDatabase
+
+from .support import add_class, create_test_database
+
+
+class ArchiveAttendancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        self.archive_dir = os.path.join(self.directory.name, 'archive')
+        os.makedirs(self.archive_dir)
+        start = datetime.datetime(2025, 3, 3, 22)
+        add_class(self.path, start, start + datetime.timedelta(hours=3))
+        self.database = NotifierDatabase(self.path)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_archived_rows_keep_their_status(self):
+        self.database.add_attendances([
+            (1, 1, datetime.date(2025, 3, 3), '22:05:00'),
+            (2, 1, datetime.date(2025, 3, 3), '00:30:00'),
+        ])
+        self.assertEqual(self.database.archive_attendances(datetime.date(2025, 4, 1), self.archive_dir), 2)
+        archive = sqlite3.connect(os.path.join(self.archive_dir, 'attendance-SY2024-2025.sqlite3'))
+        try:
+            rows = archive.execute('SELECT student_id, status FROM core_attendance ORDER BY student_id').fetchall()
+        finally:
+            archive.close()
+        self.assertEqual(rows, [(1, 'on_time'), (2, 'very_late')])
+
+    def test_attendances_after_the_sync_high_water_are_kept(self):
+        self.database.add_attendances([
+            (1, 1, datetime.date(2025, 3, 3), '22:05:00'),
+            (2, 1, datetime.date(2025, 3, 3), '22:10:00'),
+        ])
+        high_water = min(row[0] for row in self.database.cursor.execute('SELECT id FROM core_attendance'))
+        self.assertEqual(self.database.archive_attendances(datetime.date(2025, 4, 1), self.archive_dir, max_id=high_water), 1)
+        remaining = self.database.cursor.execute('SELECT id FROM core_attendance').fetchall()
+        self.assertEqual(len(remaining), 1)
+        self.assertGreater(remaining[0][0], high_water)
+
+
+class AttendanceArchiverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        self.archive_dir = os.path.join(self.directory.name, 'archive')
+        start = datetime.datetime(2025, 3, 3, 8)
+        add_class(self.path, start, start + datetime.timedelta(hours=1))
+        self.database = NotifierDatabase(self.path)
+        self.database.add_attendances([
+            (1, 1, datetime.date(2025, 3, 3), '08:05:00'),
+            (2, 1, datetime.date(2025, 3, 3), '08:10:00'),
+        ])
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def count(self):
+        return self.database.cursor.execute('SELECT COUNT(*) FROM core_attendance').fetchone()[0]
+
+    def test_nothing_is_archived_before_the_first_sync(self):
+        archiver = AttendanceArchiver(self.path, self.archive_dir, keep_days=0, pause=0, synced=True)
+        self.assertEqual(archiver.archive(), 0)
+        self.assertEqual(self.count(), 2)
+
+    def test_only_synced_attendances_are_archived(self):
+        high_water = min(row[0] for row in self.database.cursor.execute('SELECT id FROM core_attendance'))
+        self.database.set_sync_high_water(high_water)
+        archiver = AttendanceArchiver(self.path, self.archive_dir, keep_days=0, pause=0, synced=True)
+        self.assertEqual(archiver.archive(), 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_archives_again_after_the_interval(self):
+        archiver = AttendanceArchiver(self.path, self.archive_dir, keep_days=0, pause=0, interval=0.05)
+        archiver.start()
+        try:
+            deadline = time.monotonic() + 5
+            while self.count() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(self.count(), 0)
+            # Attendances added later are picked up by a later run
+            self.database.add_attendances([(1, 1, datetime.date(2025, 3, 10), '08:05:00')])
+            deadline = time.monotonic() + 5
+            while self.count() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(self.count(), 0)
+            self.assertTrue(archiver.is_alive())
+        finally:
+            archiver.stop()
+            archiver.join(5)
+        self.assertFalse(archiver.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import dataclasses
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from notifier.camera import CameraSettings, MotionGate, autotune, candidate_settings, cv2
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeCapture:
+    '''
+    Camera that accepts every property except unsupported resolutions. A
+    frame is the width it was captured at
+    '''
+
+    def __init__(self, unsupported = ()):
+        self.unsupported = set(unsupported)
+        self.properties = {}
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH and value in self.unsupported:
+            return False
+        self.properties[prop] = value
+        return True
+
+    def get(self, prop):
+        return self.properties.get(prop, 0)
+
+    def read(self):
+        return True, self.properties[cv2.CAP_PROP_FRAME_WIDTH]
+
+
+class CameraSettingsTest(unittest.TestCase):
+
+    def test_saved_settings_are_loaded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'camera.json')
+            self.assertEqual(CameraSettings.load(path), CameraSettings())
+            settings = CameraSettings(width=320, height=240, fourcc='YUYV', focus=10)
+            settings.save(path)
+            self.assertEqual(CameraSettings.load(path), settings)
+
+    def test_unknown_keys_are_ignored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'camera.json')
+            with open(path, 'w') as file:
+                file.write('{"width": 800, "height": 600, "gain": 4}')
+            self.assertEqual(CameraSettings.load(path), CameraSettings(width=800, height=600))
+
+    def test_candidates_keep_focus_and_exposure(self):
+        candidates = candidate_settings(CameraSettings(focus=10, exposure=-6))
+        self.assertEqual((candidates[0].width, candidates[0].height), (320, 240))
+        self.assertEqual({(settings.focus, settings.exposure) for settings in candidates}, {(10, -6)})
+        self.assertEqual(len(set(map(dataclasses.astuple, candidates))), len(candidates))
+
+
+@unittest.skipIf(cv2 is None, 'OpenCV is not installed')
+class AutotuneTest(unittest.TestCase):
+
+    def test_apply_reports_unsupported_resolutions(self):
+        capture = FakeCapture(unsupported={1280})
+        self.assertTrue(CameraSettings(width=640, height=480, focus=12).apply(capture))
+        self.assertEqual(capture.get(cv2.CAP_PROP_AUTOFOCUS), 0)
+        self.assertEqual(capture.get(cv2.CAP_PROP_FOCUS), 12)
+        self.assertEqual(capture.get(cv2.CAP_PROP_BUFFERSIZE), 1)
+        self.assertFalse(CameraSettings(width=1280, height=720).apply(capture))
+
+    def test_fastest_reliable_settings_win(self):
+        # Codes are too small to read at 320 pixels, and the camera has no 800x600 mode
+        capture = FakeCapture(unsupported={800})
+
+        def decode(width):
+            # Larger frames take longer to decode
+            time.sleep(width / 100000)
+            return 'LRN1' if width >= 640 else None
+
+        candidates = [CameraSettings(width=width, height=height) for width, height in ((320, 240), (640, 480), (800, 600), (1280, 720))]
+        best = autotune(capture, decode, candidates, frames=3, expected={'LRN1'})
+        self.assertEqual((best.width, best.height), (640, 480))
+
+    def test_nothing_reliable(self):
+        best = autotune(FakeCapture(), lambda width: None, [CameraSettings()], frames=3)
+        self.assertIsNone(best)
+
+
+
+@unittest.skipIf(cv2 is None or numpy is None, 'OpenCV is not installed')
+class MotionGateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('notifier.camera.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gate = MotionGate(threshold=4, hold=2, idle_after=10, idle_fps=2, recheck=5)
+
+    def frame(self, value: int):
+        return numpy.full((480, 640, 3), value, dtype=numpy.uint8)
+
+    def check(self, value: int, seconds: float = 0.1):
+        self.now += seconds
+        return self.gate.check(self.frame(value))
+
+    def test_static_scene_is_skipped_after_the_hold(self):
+        self.assertTrue(self.check(0))
+        self.assertTrue(self.check(0, 1))
+        self.assertFalse(self.check(0, 1.5))
+        self.assertFalse(self.check(0))
+        self.assertEqual((self.gate.decoded, self.gate.skipped), (2, 2))
+
+    def test_motion_is_decoded(self):
+        self.check(0)
+        self.check(0, 3)
+        self.assertTrue(self.check(100))
+        # And for the hold after it, when the badge stops moving
+        self.assertTrue(self.check(100, 1))
+        self.assertFalse(self.check(100, 1.5))
+
+    def test_slow_movement_adds_up(self):
+        self.check(0)
+        self.check(0, 3)
+        self.assertEqual([self.check(value) for value in (1, 2, 3, 4)], [False, False, False, True])
+
+    def test_static_scene_is_rechecked(self):
+        self.check(0)
+        self.assertFalse(self.check(0, 3))
+        self.assertFalse(self.check(0, 1))
+        self.assertTrue(self.check(0, 1.5))
+
+    def test_idle_scene_is_read_slowly(self):
+        self.check(0)
+        self.assertEqual(self.gate.delay(), 0)
+        self.check(0, 11)
+        self.assertEqual(self.gate.delay(), 0.5)
+        self.check(100)
+        self.assertEqual(self.gate.delay(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from notifier.coalescer import Coalescer
+from notifier.journal import SmsJournal
+
+
+class CoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.now = 1000.0
+        patcher = mock.patch('notifier.coalescer.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, number, message):
+        self.sent.append((number, message))
+
+    def test_messages_in_the_window_are_sent_together(self):
+        coalescer = Coalescer(self.send, window=60, footer='\n-School')
+        coalescer.add('+639170000101', 'Math: present')
+        self.now += 30
+        # The same guardian written another way
+        coalescer.add('09170000101', 'Science: late')
+        self.assertEqual(coalescer.flush(), 0)
+        self.now += 30
+        self.assertEqual(coalescer.flush(), 1)
+        self.assertEqual(self.sent, [('+639170000101', 'Math: present\n\nScience: late\n-School')])
+        self.assertEqual(coalescer.pending, {})
+
+    def test_window_opens_per_number(self):
+        coalescer = Coalescer(self.send, window=60)
+        coalescer.add('+639170000101', 'first')
+        self.now += 45
+        coalescer.add('+639170000102', 'second')
+        self.now += 15
+        coalescer.flush()
+        self.assertEqual(self.sent, [('+639170000101', 'first')])
+        self.now += 45
+        coalescer.flush()
+        self.assertEqual(self.sent[1], ('+639170000102', 'second'))
+
+    def test_urgent_messages_bypass_the_window(self):
+        coalescer = Coalescer(self.send, window=60, footer='!')
+        coalescer.add('+639170000101', 'held')
+        coalescer.add('+639170000101', 'now', urgent=True)
+        self.assertEqual(self.sent, [('+639170000101', 'now!')])
+        self.assertEqual(len(coalescer.pending), 1)
+
+    def test_no_window_sends_right_away(self):
+        coalescer = Coalescer(self.send, window=0)
+        coalescer.add('+639170000101', 'now')
+        self.assertEqual(self.sent, [('+639170000101', 'now')])
+
+    def test_force_sends_open_windows(self):
+        coalescer = Coalescer(self.send, window=60)
+        coalescer.add('+639170000101', 'held')
+        self.assertEqual(coalescer.flush(force=True), 1)
+        self.assertEqual(self.sent, [('+639170000101', 'held')])
+
+    def test_held_messages_survive_a_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/sms.jsonl'
+            Coalescer(self.send, window=60, journal=SmsJournal(path)).add('+639170000101', 'held')
+            coalescer = Coalescer(self.send, window=60, journal=SmsJournal(path))
+            self.now += 60
+            coalescer.flush()
+            self.assertEqual(self.sent, [('+639170000101', 'held')])
+            self.assertEqual(SmsJournal(path).pending('digest'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import datetime
+import tempfile
+import threading
+import unittest
+
+from notifier.database import NotifierDatabase
+from notifier.records import Absentee, Attendee, Schedule, Student, Teacher, parse_time
+
+from .support import add_class, create_test_database
+
+
+class IterAttendanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        add_class(self.path, datetime.datetime(2026, 10, 19, 8), datetime.datetime(2026, 10, 19, 9), students=3)
+        self.database = NotifierDatabase(self.path)
+        self.database.add_attendances([
+            (2, 1, datetime.date(2026, 10, 20), '08:10:00'),
+            (1, 1, datetime.date(2026, 10, 19), '08:05:00'),
+            (3, 1, datetime.date(2026, 10, 21), '08:20:00'),
+        ])
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_rows_are_paged_in_order(self):
+        rows = list(self.database.iter_attendance(batch_size=1))
+        self.assertEqual([row[2] for row in rows], ['LRN1', 'LRN2', 'LRN3'])
+        self.assertEqual(rows[0], ('2026-10-19', '08:05:00', 'LRN1', 'Student 1', 'Math', 1))
+
+    def test_date_range(self):
+        rows = self.database.iter_attendance(start=datetime.date(2026, 10, 20), end=datetime.date(2026, 10, 20))
+        self.assertEqual([row[2] for row in rows], ['LRN2'])
+
+    def test_other_queries_run_while_iterating(self):
+        rows = self.database.iter_attendance(batch_size=1)
+        next(rows)
+        self.assertEqual(len(self.database.get_all_students()), 3)
+        self.assertEqual(len(list(rows)), 2)
+
+
+class RecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        add_class(self.path, datetime.datetime(2026, 10, 19, 8), datetime.datetime(2026, 10, 19, 9))
+        self.database = NotifierDatabase(self.path)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('08:30:00'), datetime.time(8, 30))
+        self.assertEqual(parse_time('08:30:00.000000'), datetime.time(8, 30))
+        self.assertIsNone(parse_time(None))
+
+    def test_schedules_have_parsed_times(self):
+        schedule = self.database.get_schedule_by_id(1)
+        self.assertIsInstance(schedule, Schedule)
+        self.assertEqual((schedule.subject, schedule.start, schedule.end), ('Math', datetime.time(8), datetime.time(9)))
+        # Still unpacks like the tuples the database used to return
+        id, subject, start, end, teacher_id = schedule
+        self.assertEqual((id, teacher_id), (1, 1))
+        self.assertEqual(self.database.get_schedules_on(1), [schedule])
+
+    def test_people(self):
+        student = self.database.get_student_by_lrn('LRN1')
+        self.assertEqual(student, Student(1, 'Student', '1', '+639170000101', 'LRN1'))
+        self.assertEqual(student.name, 'Student 1')
+        self.assertEqual(self.database.get_teacher(1), Teacher(1, 'Ana', 'Cruz', '+639170000001'))
+
+    def test_attendees_and_absentees(self):
+        date = datetime.date(2026, 10, 19)
+        self.database.add_attendances([(1, 1, date, '08:20:00')])
+        self.assertEqual(self.database.get_attendance(date, 1), [Attendee('Student 1', 'LRN1', '+639170000101', datetime.time(8, 20), 'late')])
+        [absentee] = self.database.get_absents(date, 1)
+        self.assertIsInstance(absentee, Absentee)
+        self.assertEqual(absentee.lrn, 'LRN2')
+
+
+
+class BatchQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        add_class(self.path, datetime.datetime(2026, 10, 19, 8), datetime.datetime(2026, 10, 19, 9), students=3)
+        self.database = NotifierDatabase(self.path)
+        self.date = datetime.date(2026, 10, 19)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_students_by_lrns(self):
+        students = self.database.get_students_by_lrns(['LRN3', 'UNKNOWN', 'LRN1'])
+        self.assertEqual(sorted(students), ['LRN1', 'LRN3'])
+        self.assertEqual(students['LRN3'].id, 3)
+        self.assertEqual(self.database.get_students_by_lrns([]), {})
+
+    def test_attendance_exists_many(self):
+        self.database.add_attendances([(1, 1, self.date, '08:05:00')])
+        keys = [(1, 1, self.date), (2, 1, self.date), (1, 1, datetime.date(2026, 10, 20))]
+        self.assertEqual(self.database.attendance_exists_many(keys), {(1, 1, self.date)})
+        self.assertEqual(self.database.attendance_exists_many([]), set())
+
+    def test_add_attendances_skips_existing_ones(self):
+        self.assertEqual(self.database.add_attendances([(1, 1, self.date, '08:05:00'), (2, 1, self.date, '08:20:00')]), 2)
+        # Scanned again in a later batch, and twice in the same batch
+        self.assertEqual(self.database.add_attendances([(1, 1, self.date, '08:25:00'), (3, 1, self.date, '08:40:00'),
+                                                        (3, 1, self.date, '08:41:00')]), 1)
+        rows = self.database.cursor.execute('SELECT student_id, time_in, status FROM core_attendance ORDER BY student_id').fetchall()
+        self.assertEqual(rows, [(1, '08:05:00', 'on_time'), (2, '08:20:00', 'late'), (3, '08:40:00', 'very_late')])
+        counters = self.database.cursor.execute('SELECT on_time, late, very_late FROM core_punctuality ORDER BY student_id').fetchall()
+        self.assertEqual(counters, [(1, 0, 0), (0, 1, 0), (0, 0, 1)])
+
+    def test_every_thread_gets_its_own_connection(self):
+        connections = [self.database.database]
+        thread = threading.Thread(target=lambda: connections.append(self.database.database))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], connections[1])
+        self.assertIs(self.database.database, connections[0])
+        self.assertEqual(len(self.database.connections), 2)
+
+    def test_memory_database_is_shared_between_threads(self):
+        database = NotifierDatabase(':memory:')
+        database.cursor.execute('CREATE TABLE scratch (value INTEGER)')
+        database.database.commit()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(database.cursor.execute('SELECT COUNT(*) FROM scratch').fetchone()))
+        thread.start()
+        thread.join()
+        database.close()
+        self.assertEqual(results, [(0,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+from notifier.decoders import DECODERS, CascadeDecoder, DecodedCode, Decoder, available_decoders, create_decoder
+
+
+class FakeDecoder(Decoder):
+    '''
+    Decoder that reads the codes listed for a frame, counting its calls
+    '''
+    name = 'fake'
+    installed = True
+
+    def __init__(self, codes = None):
+        self.codes = codes or {}
+        self.calls = 0
+
+    @classmethod
+    def available(cls):
+        return cls.installed
+
+    def decode(self, frame):
+        self.calls += 1
+        return [DecodedCode(data, []) for data in self.codes.get(frame, [])]
+
+
+class MissingDecoder(FakeDecoder):
+    name = 'missing'
+    installed = False
+
+
+class CascadeDecoderTest(unittest.TestCase):
+
+    def test_first_decoder_that_finds_codes_wins(self):
+        fast = FakeDecoder({'clean': ['LRN1']})
+        robust = FakeDecoder({'clean': ['LRN1'], 'blurry': ['LRN2']})
+        cascade = CascadeDecoder([fast, robust])
+        self.assertEqual(cascade.decode('clean'), [DecodedCode('LRN1', [])])
+        # The slower decoder only runs on frames the fast one could not read
+        self.assertEqual(robust.calls, 0)
+        self.assertEqual(cascade.decode('blurry'), [DecodedCode('LRN2', [])])
+        self.assertEqual(cascade.decode('empty'), [])
+        self.assertEqual((fast.calls, robust.calls), (3, 2))
+
+
+@mock.patch.dict(DECODERS, {'fake': FakeDecoder, 'missing': MissingDecoder}, clear=True)
+class CreateDecoderTest(unittest.TestCase):
+
+    def test_single_decoder(self):
+        self.assertIsInstance(create_decoder('fake'), FakeDecoder)
+
+    def test_cascade_leaves_out_missing_backends(self):
+        decoder = create_decoder('missing, fake,fake')
+        self.assertIsInstance(decoder, CascadeDecoder)
+        self.assertEqual([type(part) for part in decoder.decoders], [FakeDecoder, FakeDecoder])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            create_decoder('fake,unknown')
+        with self.assertRaises(RuntimeError):
+            create_decoder('missing')
+        with self.assertRaises(RuntimeError):
+            create_decoder('missing,missing')
+
+    def test_available_decoders(self):
+        self.assertEqual(available_decoders(), ['fake'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import datetime
+import tempfile
+import unittest
+
+from notifier.inbox import Inbox, SmsMessage, normalize_number, parse_cds, parse_cmgl, parse_cmgr, parse_cmti
+from notifier.modem_pool import TAG, ModemPool
+from notifier.sim808 import Sim808
+
+from .support import add_class, create_machine, create_test_database
+
+CMGL = (
+    '+CMGL: 1,"REC UNREAD","+639171234567","","23/09/17,14:55:00+32"\r\n'
+    'STATUS LRN1\r\n'
+    '+CMGL: 2,"REC UNREAD","+639171234568",,"23/09/17,14:56:00+32"\r\n'
+    'Hello\r\nworld\r\n'
+    '\r\nOK\r\n'
+)
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_cmti(self):
+        self.assertEqual(parse_cmti('\r\n+CMTI: "SM",3\r\n\r\n+CMTI: "SM",12\r\n'), [3, 12])
+
+    def test_cds(self):
+        response = '+CDS: 6,123,"+639171234567",145,"23/09/17,14:55:00+32","23/09/17,14:55:05+32",0\r\n'
+        self.assertEqual(parse_cds(response), [(123, 0)])
+
+    def test_cmgl(self):
+        self.assertEqual(parse_cmgl(CMGL), [
+            SmsMessage(1, 'REC UNREAD', '+639171234567', '23/09/17,14:55:00+32', 'STATUS LRN1'),
+            SmsMessage(2, 'REC UNREAD', '+639171234568', '23/09/17,14:56:00+32', 'Hello\r\nworld'),
+        ])
+
+    def test_cmgr(self):
+        response = '+CMGR: "REC UNREAD","+639171234567","","23/09/17,14:55:00+32"\r\nSTATUS LRN1\r\n\r\nOK\r\n'
+        self.assertEqual(parse_cmgr(4, response), SmsMessage(4, 'REC UNREAD', '+639171234567', '23/09/17,14:55:00+32', 'STATUS LRN1'))
+        self.assertIsNone(parse_cmgr(4, '\r\nOK\r\n'))
+
+    def test_normalize_number(self):
+        self.assertEqual(normalize_number('+639171234567'), normalize_number('09171234567'))
+
+
+class PartialNotificationTest(unittest.TestCase):
+
+    def setUp(self):
+        # Only the parsing of responses is tested, so no serial port is opened
+        self.modem = Sim808.__new__(Sim808)
+        self.modem.notifications = []
+        self.modem.delivery_reports = []
+        self.modem.partial = ''
+
+    def test_notification_split_across_reads(self):
+        self.modem.parse_notifications('OK\r\n+CMTI: "SM",1')
+        self.assertEqual(self.modem.notifications, [])
+        self.modem.parse_notifications('2\r\n')
+        self.assertEqual(self.modem.notifications, [12])
+
+    def test_delivery_report_split_across_reads(self):
+        self.modem.parse_notifications('+CDS: 6,123,"+639171234567",145,"23/09/17,14:55:00+32"')
+        self.modem.parse_notifications(',"23/09/17,14:55:05+32",0\r\n')
+        self.assertEqual(self.modem.delivery_reports, [(123, 0)])
+
+    def test_other_unfinished_text_is_dropped(self):
+        self.modem.parse_notifications('\r\n> ')
+        self.assertEqual(self.modem.partial, '')
+
+
+class FlakyModem:
+    '''
+    Modem with stored messages whose first read fails
+    '''
+
+    def __init__(self, messages):
+        self.messages = {message.index: message for message in messages}
+        self.notifications = list(self.messages)
+        self.failures = 1
+        self.deleted = []
+
+    def poll_notifications(self):
+        indexes, self.notifications = self.notifications, []
+        return indexes
+
+    def read_sms(self, index):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('read failed')
+        return self.messages.get(index)
+
+    def list_sms(self, status = 'REC UNREAD'):
+        return [message for index, message in sorted(self.messages.items()) if index not in self.deleted]
+
+    def delete_sms(self, index):
+        self.deleted.append(index)
+
+
+class InboxTest(unittest.TestCase):
+
+    def test_failed_read_is_listed_again(self):
+        first = SmsMessage(1, 'REC UNREAD', '+639171234567', '', 'STATUS LRN1')
+        second = SmsMessage(2, 'REC UNREAD', '+639171234568', '', 'STATUS LRN2')
+        modem = FlakyModem([first, second])
+        inbox = Inbox(modem, send=lambda number, message: None)
+        self.assertEqual(inbox.receive(), [second])
+        self.assertTrue(inbox.relist)
+        # No new notification comes for the message that failed
+        self.assertEqual(inbox.receive(), [first])
+        self.assertFalse(inbox.relist)
+        self.assertEqual(sorted(modem.deleted), [1, 2])
+
+    def test_failed_read_is_listed_again_through_a_pool(self):
+        first = SmsMessage(1, 'REC UNREAD', '+639171234567', '', 'STATUS LRN1')
+        second = SmsMessage(1, 'REC UNREAD', '+639171234568', '', 'STATUS LRN2')
+        modems = {'a': FlakyModem([first]), 'b': FlakyModem([second])}
+        modems['b'].failures = 0
+        pool = ModemPool(['a', 'b'], factory=modems.get)
+        inbox = Inbox(pool, send=lambda number, message: None)
+        self.assertEqual(inbox.receive(), [second._replace(index=TAG + 1)])
+        self.assertEqual(inbox.receive(), [first])
+        self.assertEqual((modems['a'].deleted, modems['b'].deleted), ([1], [1]))
+
+    def test_unknown_commands_are_ignored(self):
+        replies = []
+        inbox = Inbox(FlakyModem([]), send=lambda number, message: replies.append(message))
+        inbox.register('status', lambda message, args: 'reply')
+        inbox.dispatch(SmsMessage(1, 'REC UNREAD', '+639171234567', '', 'HELLO'))
+        inbox.dispatch(SmsMessage(2, 'REC UNREAD', '+639171234567', '', 'status x'))
+        self.assertEqual(replies, ['reply'])
+
+
+class StatusCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        now = datetime.datetime.now()
+        add_class(self.path, now, now + datetime.timedelta(hours=1))
+        self.machine = create_machine(self.path)
+        self.machine.add_attendance(1, 1, datetime.date.today(), datetime.time(8, 5))
+
+    def tearDown(self):
+        self.machine.database.close()
+        self.directory.cleanup()
+
+    def replies(self):
+        return [(sms.number, sms.message) for _, _, sms in self.machine.outbox.queue]
+
+    def test_guardian_gets_the_attendance(self):
+        self.machine.inbox.dispatch(SmsMessage(1, 'REC UNREAD', '09170000101', '', 'status LRN1'))
+        [(number, reply)] = self.replies()
+        self.assertEqual(number, '09170000101')
+        self.assertIn('(LRN1)', reply)
+        self.assertIn('Math', reply)
+
+    def test_other_numbers_get_no_reply(self):
+        self.machine.inbox.dispatch(SmsMessage(1, 'REC UNREAD', '+639170000102', '', 'STATUS LRN1'))
+        self.machine.inbox.dispatch(SmsMessage(2, 'REC UNREAD', '+639179999999', '', 'STATUS LRN1'))
+        self.assertEqual(self.replies(), [])
+
+    def test_usage(self):
+        self.machine.inbox.dispatch(SmsMessage(1, 'REC UNREAD', '+639170000101', '', 'STATUS'))
+        self.assertEqual(self.replies(), [('+639170000101', 'Usage: STATUS <LRN>')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from notifier.journal import AttendanceJournal, SmsJournal
+
+
+class AttendanceJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.jsonl')
+        self.journal = AttendanceJournal(self.path)
+        self.saved = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def save(self, student_id, schedule_id, date, time_in):
+        if student_id == 2:
+            raise sqlite3.IntegrityError('NOT NULL constraint failed')
+        if student_id == 3:
+            raise sqlite3.OperationalError('database is locked')
+        self.saved.append(student_id)
+
+    def test_replay_saves_and_removes_attendances(self):
+        self.journal.append(1, 1, '2026-10-19', '08:00:00')
+        self.assertIn((1, 1, '2026-10-19'), self.journal)
+        self.assertEqual(self.journal.replay(self.save), 1)
+        self.assertEqual(len(self.journal), 0)
+        self.assertEqual(len(AttendanceJournal(self.path)), 0)
+
+    def test_permanent_errors_are_moved_to_the_dead_letter_file(self):
+        self.journal.append(2, 1, '2026-10-19', '08:00:00')
+        self.journal.append(1, 1, '2026-10-19', '08:01:00')
+        with open(self.path, 'a') as file:
+            file.write(json.dumps([4, 1, 'not a date', None]) + '\n')
+        with self.assertLogs('notifier.journal', 'ERROR'):
+            self.assertEqual(self.journal.replay(self.save), 1)
+        self.assertEqual(self.saved, [1])
+        self.assertEqual(len(self.journal), 0)
+        with open(self.journal.dead_letter) as file:
+            dead = [json.loads(line) for line in file]
+        self.assertEqual([letter['attendance'][0] for letter in dead], [2, 4])
+        self.assertTrue(dead[0]['error'].startswith('IntegrityError'))
+
+    def test_unavailable_database_keeps_the_rest(self):
+        self.journal.append(1, 1, '2026-10-19', '08:00:00')
+        self.journal.append(3, 1, '2026-10-19', '08:01:00')
+        self.journal.append(1, 2, '2026-10-19', '09:00:00')
+        self.assertEqual(self.journal.replay(self.save), 1)
+        self.assertEqual(len(self.journal), 2)
+        self.assertFalse(os.path.exists(self.journal.dead_letter))
+
+
+class SmsJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sms.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pending_messages_survive_reopening(self):
+        journal = SmsJournal(self.path)
+        first = journal.add('sms', '+639170000001', 'Report')
+        journal.add('digest', '+639170000101', 'Arrived')
+        journal.add('sms', '+639170000102', 'Absent')
+        journal.done(first)
+
+        journal = SmsJournal(self.path)
+        self.assertEqual([entry['message'] for entry in journal.pending('sms')], ['Absent'])
+        self.assertEqual([entry['message'] for entry in journal.pending('digest')], ['Arrived'])
+        # Ids are never reused
+        self.assertGreater(journal.add('sms', '+639170000001', 'Next'), first + 2)
+
+    def test_file_is_emptied_once_nothing_is_pending(self):
+        journal = SmsJournal(self.path)
+        journal.done(journal.add('sms', '+639170000001', 'Report'))
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertEqual(len(SmsJournal(self.path)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
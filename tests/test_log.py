@@ -0,0 +1,49 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from notifier.log import setup_logging
+
+
+class SetupLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'notifier.log')
+        root = logging.getLogger()
+        self.handlers = root.handlers[:]
+        self.level = root.level
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in self.handlers:
+            root.addHandler(handler)
+        root.setLevel(self.level)
+        self.directory.cleanup()
+
+    def test_exceptions_are_written_by_the_listener(self):
+        listener = setup_logging(self.path)
+        logger = logging.getLogger('notifier.test')
+        try:
+            raise ValueError('bad frame')
+        except ValueError:
+            logger.exception('Scan failed for %s', 'camera', extra={'attempt': 2})
+        listener.stop()
+        atexit.unregister(listener.stop)
+        for handler in listener.handlers:
+            handler.close()
+        with open(self.path) as file:
+            event = json.loads(file.readline())
+        self.assertEqual(event['message'], 'Scan failed for camera')
+        self.assertEqual(event['attempt'], 2)
+        self.assertIn('Traceback', event['exception'])
+        self.assertIn('ValueError: bad frame', event['exception'])
+
+
+if __name__ == '__main__':
+    unittest.main()
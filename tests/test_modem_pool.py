@@ -0,0 +1,114 @@
+import unittest
+from unittest import mock
+
+from notifier.drivers import MemoryModem
+from notifier.modem_pool import TAG, ModemPool
+from notifier.sim808 import ModemUnavailable, SmsError
+
+
+class BrokenModem(MemoryModem):
+    '''
+    Memory modem whose sends fail while `broken`
+    '''
+
+    def __init__(self, port: str):
+        super().__init__(port)
+        self.broken = False
+        self.alive = True
+        self.reconnected = 0
+
+    def send_sms(self, number: str, message: str, timeout: float = 60):
+        if self.broken:
+            raise SmsError('Simulated send failure')
+        return super().send_sms(number, message, timeout)
+
+    def is_alive(self):
+        return self.alive
+
+    def reconnect(self):
+        self.reconnected += 1
+
+
+class ModemPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('notifier.modem_pool.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.modems = {port: BrokenModem(port) for port in ('a', 'b')}
+        self.pool = ModemPool(['a', 'b'], max_failures=2, cooldown=10, max_cooldown=40, factory=self.modems.get)
+
+    def test_sends_are_spread_over_the_modems(self):
+        for i in range(4):
+            self.pool.send_sms(f'+63917000010{i}', 'hello')
+        self.assertEqual([modem.sent for modem in self.modems.values()], [2, 2])
+
+    def test_references_are_tagged_with_the_modem(self):
+        references = [self.pool.send_sms('+639170000101', 'hello') for _ in range(2)]
+        self.assertEqual(references, [0, TAG])
+        # Delivery reports come back with the same tagged references
+        self.assertEqual(sorted(self.pool.poll_delivery_reports()), [(0, 0), (TAG, 0)])
+
+    def test_failing_modem_is_taken_out_and_sends_fail_over(self):
+        self.modems['a'].broken = True
+        failures = 0
+        for _ in range(6):
+            try:
+                self.pool.send_sms('+639170000101', 'hello')
+            except SmsError:
+                failures += 1
+        self.assertEqual(failures, 2)
+        self.assertFalse(self.pool.modems[0].healthy)
+        self.assertEqual(self.modems['b'].sent, 4)
+
+    def test_modem_is_back_after_the_cooldown(self):
+        self.modems['a'].broken = True
+        self.modems['a'].alive = False
+        for _ in range(4):
+            try:
+                self.pool.send_sms('+639170000101', 'hello')
+            except SmsError:
+                pass
+        self.assertFalse(self.pool.modems[0].healthy)
+        self.now += 10
+        self.pool.check_health()
+        # A modem that does not answer is reconnected
+        self.assertEqual(self.modems['a'].reconnected, 1)
+        self.assertTrue(self.pool.modems[0].healthy)
+
+    def test_cooldown_doubles_while_reconnecting_fails(self):
+        self.pool.modems[0].healthy = False
+        self.pool.modems[0].cooldown = 10
+        self.pool.modems[0].retry_at = self.now
+        self.modems['a'].alive = False
+        self.modems['a'].reconnect = mock.Mock(side_effect=OSError('unplugged'))
+        self.pool.check_health()
+        self.assertEqual(self.pool.modems[0].cooldown, 20)
+        self.now += 20
+        self.pool.check_health()
+        self.now += 40
+        self.pool.check_health()
+        self.assertEqual(self.pool.modems[0].cooldown, 40)
+        self.assertFalse(self.pool.modems[0].healthy)
+
+    def test_no_healthy_modem(self):
+        for modem in self.pool.modems:
+            modem.healthy = False
+            modem.retry_at = float('inf')
+        with self.assertRaises(ModemUnavailable):
+            self.pool.send_sms('+639170000101', 'hello')
+
+    def test_modem_that_cannot_be_opened_is_connected_later(self):
+        modems = {'a': BrokenModem('a')}
+        pool = ModemPool(['a', 'b'], cooldown=10, factory=lambda port: modems[port])
+        self.assertFalse(pool.modems[1].healthy)
+        modems['b'] = BrokenModem('b')
+        self.now += 10
+        pool.check_health()
+        self.assertTrue(pool.modems[1].healthy)
+        self.assertIs(pool.modems[1].gsm, modems['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
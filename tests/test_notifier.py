@@ -0,0 +1,165 @@
+import datetime
+import itertools
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from notifier import NotifierRuntime
+from notifier.database import NotifierDatabase, Store
+from notifier.decoders import Decoder
+from notifier.drivers import Camera, Indicator, MemoryModem, create_camera, open_store
+from notifier.sim808 import Modem, Sim808
+
+from .support import add_class, create_machine, create_test_database, run_for
+
+
+class DriverBaseTest(unittest.TestCase):
+
+    def test_drivers_must_implement_the_abstract_methods(self):
+        for base in (Indicator, Camera, Decoder, Modem, Store):
+            with self.subTest(base=base.__name__):
+                with self.assertRaises(TypeError):
+                    type('Incomplete', (base,), {})()
+
+    def test_drivers_implement_the_interfaces(self):
+        self.assertTrue(issubclass(Sim808, Modem))
+        self.assertTrue(issubclass(MemoryModem, Modem))
+        self.assertTrue(issubclass(NotifierDatabase, Store))
+
+    def test_memory_camera_cannot_be_configured(self):
+        # Without frames every read would fail until the supervisor gives up
+        with self.assertRaises(ValueError):
+            create_camera('memory')
+
+
+class MemoryDriversTest(unittest.TestCase):
+    '''
+    Run the notifier on the memory LED, camera, modem and store
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        now = datetime.datetime.now().replace(microsecond=0)
+        if (now + datetime.timedelta(seconds=5)).date() != now.date():
+            self.skipTest('The class must end today')
+        # Ends while the runtime test runs, so its report is sent
+        self.lrns = add_class(self.path, now - datetime.timedelta(minutes=5), now + datetime.timedelta(seconds=3))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def file_attendances(self):
+        database = sqlite3.connect(self.path)
+        try:
+            return database.execute('SELECT COUNT(*) FROM core_attendance').fetchone()[0]
+        finally:
+            database.close()
+
+    def test_notifier(self):
+        frames = [(), ('LRN1',), ('LRN1', 'LRN2'), ()]
+        machine = create_machine(open_store('memory', self.path), frames)
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0.05), ['LRN1', 'LRN2'])
+
+        machine.change_led_color('green')
+        self.assertEqual(machine.indicator.color, 'green')
+        machine.turn_off_led()
+        self.assertIsNone(machine.indicator.color)
+
+        student = machine.get_student_by_lrn('LRN1')
+        schedule = machine.get_current_schedule()
+        machine.add_attendance(student.id, schedule.id, datetime.date.today(), datetime.datetime.now().time())
+        self.assertTrue(machine.attendance_exists(student.id, schedule.id, datetime.date.today()))
+        # The memory store never writes to the file it was copied from
+        self.assertEqual(self.file_attendances(), 0)
+
+        machine.notify_guardian(student.guardian_phone_number, 'Arrived', urgent=True)
+        machine.process_outbox(flush=True)
+        sent = machine.gsm.modems[0].gsm.outbox
+        self.assertEqual([number for number, _ in sent], [student.guardian_phone_number])
+        machine.database.close()
+
+    def test_queued_messages_survive_a_restart(self):
+        journal = os.path.join(self.directory.name, 'sms.jsonl')
+        machine = create_machine(open_store('memory', self.path), coalesce_window=300, sms_journal=journal)
+        machine.queue_sms('+639170000001', 'Report')
+        machine.notify_guardian('+639170000101', 'Arrived')
+        machine.database.close()
+
+        # Stopped before anything was sent
+        machine = create_machine(open_store('memory', self.path), coalesce_window=300, sms_journal=journal)
+        self.assertEqual(machine.outbox.pending(), 1)
+        while machine.process_outbox(flush=True):
+            pass
+        sent = machine.gsm.modems[0].gsm.outbox
+        self.assertEqual(sorted(number for number, _ in sent), ['+639170000001', '+639170000101'])
+        machine.database.close()
+
+        # Nothing is sent twice
+        machine = create_machine(open_store('memory', self.path), coalesce_window=300, sms_journal=journal)
+        machine.process_outbox(flush=True)
+        self.assertEqual(machine.gsm.modems[0].gsm.outbox, [])
+        machine.database.close()
+
+    def test_runtime(self):
+        # Only the first student shows up
+        frames = itertools.chain([()] * 5, [('LRN1',)] * 10, itertools.repeat(()))
+        machine = create_machine(open_store('memory', self.path), frames)
+        runtime = NotifierRuntime(machine, accept_delay=0.1, schedule_interval=0.5, outbox_interval=0.05,
+                                  journal=os.path.join(self.directory.name, 'journal.jsonl'), batch=True, batch_window=0.05)
+        run_for(runtime, 5)
+
+        students = machine.get_students_by_lrns(self.lrns)
+        self.assertTrue(machine.attendance_exists(students['LRN1'].id, 1, datetime.date.today()))
+        self.assertFalse(machine.attendance_exists(students['LRN2'].id, 1, datetime.date.today()))
+        # The end of class report went to the teacher and both guardians
+        sent = {number: message for number, message in machine.gsm.modems[0].gsm.outbox}
+        self.assertEqual(set(sent), {'+639170000001', students['LRN1'].guardian_phone_number, students['LRN2'].guardian_phone_number})
+        self.assertNotEqual(sent[students['LRN1'].guardian_phone_number], sent[students['LRN2'].guardian_phone_number])
+        self.assertGreater(machine.indicator.changes, 0)
+        self.assertEqual(self.file_attendances(), 0)
+        machine.database.close()
+
+
+class BatchScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scan(self, frames):
+        machine = create_machine(open_store('memory', self.path), frames)
+        self.addCleanup(machine.database.close)
+        return machine
+
+    def test_codes_read_in_the_window_are_one_batch(self):
+        # The third badge is only readable once the first one is lowered
+        machine = self.scan(itertools.chain([(), ('LRN1',), ('LRN1', 'LRN2'), ('LRN2', 'LRN3')], itertools.repeat(())))
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0.1), ['LRN1', 'LRN2', 'LRN3'])
+
+    def test_codes_still_held_up_are_left_out_of_the_next_batch(self):
+        machine = self.scan(itertools.chain([('LRN1',)] * 10, itertools.repeat(('LRN1', 'LRN2'))))
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0), ['LRN1'])
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0), ['LRN2'])
+        self.assertEqual(machine.scan_qrcodes(timeout=0.1, window=0), [])
+
+    def test_codes_are_scanned_again_after_the_ttl(self):
+        machine = self.scan(itertools.repeat(('LRN1',)))
+        machine.recent_codes.ttl = 0.05
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0), ['LRN1'])
+        # Lowered and held up again later
+        time.sleep(0.1)
+        self.assertEqual(machine.scan_qrcodes(timeout=1, window=0), ['LRN1'])
+
+    def test_timeout_without_codes(self):
+        machine = self.scan(itertools.repeat(()))
+        self.assertEqual(machine.scan_qrcodes(timeout=0.1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
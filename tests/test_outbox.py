@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from notifier.drivers import MemoryModem
+from notifier.outbox import DELIVERED, FAILED, Outbox
+
+
+class OutboxTest(unittest.TestCase):
+
+    def test_message_is_claimed_before_it_is_sent(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem, min_interval=5)
+        outbox.send('+639170000001', 'first')
+        outbox.send('+639170000001', 'second')
+        # What the sender of another modem sees while the first message is being sent
+        self.assertEqual(outbox._Outbox__next_due().message, 'first')
+        self.assertIsNone(outbox._Outbox__next_due())
+        self.assertEqual(outbox.pending(), 1)
+
+    def test_parallel_senders_respect_the_interval_per_number(self):
+        modem = MemoryModem('memory', send_time=0.2)
+        outbox = Outbox(modem, min_interval=5)
+        outbox.send('+639170000001', 'first')
+        outbox.send('+639170000001', 'second')
+        results = []
+        start = threading.Barrier(2)
+
+        def sender():
+            start.wait()
+            results.append(outbox.process())
+
+        threads = [threading.Thread(target=sender) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(modem.outbox, [('+639170000001', 'first')])
+
+    def test_different_numbers_are_sent_in_parallel(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem, min_interval=5)
+        outbox.send('+639170000001', 'first')
+        outbox.send('+639170000002', 'second')
+        self.assertTrue(outbox.process())
+        self.assertTrue(outbox.process())
+        self.assertEqual(outbox.pending(), 0)
+
+
+class DeliveryReportTest(unittest.TestCase):
+
+    def test_delivered_report_marks_the_message(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem)
+        sms = outbox.send('+639170000001', 'hello')
+        self.assertTrue(outbox.process())
+        self.assertIn(sms.reference, outbox.awaiting_report)
+        outbox.process()
+        self.assertEqual(sms.status, DELIVERED)
+        self.assertEqual(outbox.awaiting_report, {})
+
+    def test_failed_report_is_sent_again(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem, backoff=0, min_interval=0)
+        sms = outbox.send('+639170000001', 'hello')
+        outbox.process()
+        modem.delivery_reports = [(sms.reference, 70)]
+        self.assertTrue(outbox.process())
+        self.assertEqual(sms.attempts, 2)
+        self.assertEqual(modem.outbox, [('+639170000001', 'hello')] * 2)
+
+    def test_failed_report_gives_up_after_max_attempts(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem, max_attempts=1, backoff=0, min_interval=0)
+        sms = outbox.send('+639170000001', 'hello')
+        outbox.process()
+        modem.delivery_reports = [(sms.reference, 70)]
+        self.assertFalse(outbox.process())
+        self.assertEqual(sms.status, FAILED)
+        self.assertEqual(outbox.pending(), 0)
+
+    def test_unknown_and_pending_reports_are_ignored(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem)
+        sms = outbox.send('+639170000001', 'hello')
+        outbox.process()
+        modem.delivery_reports = [(sms.reference, 40), (200, 0)]
+        outbox.process()
+        self.assertNotEqual(sms.status, DELIVERED)
+        self.assertIn(sms.reference, outbox.awaiting_report)
+
+    def test_senders_of_a_pool_share_the_reports(self):
+        modem = MemoryModem('memory')
+        outbox = Outbox(modem, min_interval=0)
+        messages = [outbox.send(f'+6391700001{i:02}', 'hello') for i in range(50)]
+
+        deadline = time.monotonic() + 10
+
+        def sender():
+            while (outbox.pending() or outbox.awaiting_report) and time.monotonic() < deadline:
+                outbox.process()
+
+        threads = [threading.Thread(target=sender) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual({sms.status for sms in messages}, {DELIVERED})
+        self.assertEqual(len(modem.outbox), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import datetime
+import unittest
+
+from notifier.punctuality import LATE, ON_TIME, VERY_LATE, classify, school_year
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_thresholds(self):
+        start = datetime.time(8)
+        self.assertEqual(classify(start, datetime.time(7, 50), 15, 30), ON_TIME)
+        self.assertEqual(classify(start, datetime.time(8, 15), 15, 30), ON_TIME)
+        self.assertEqual(classify(start, datetime.time(8, 16), 15, 30), LATE)
+        self.assertEqual(classify(start, datetime.time(8, 31), 15, 30), VERY_LATE)
+
+    def test_class_past_midnight(self):
+        start, end = datetime.time(22), datetime.time(1)
+        self.assertEqual(classify(start, datetime.time(21, 55), 15, 30, end), ON_TIME)
+        self.assertEqual(classify(start, datetime.time(22, 20), 15, 30, end), LATE)
+        self.assertEqual(classify(start, datetime.time(0, 30), 15, 30, end), VERY_LATE)
+        self.assertEqual(classify(start, datetime.time(0, 30), 15, 180, end), LATE)
+
+    def test_school_year_starts_in_june(self):
+        self.assertEqual(school_year(datetime.date(2026, 5, 31)), 'SY2025-2026')
+        self.assertEqual(school_year(datetime.date(2026, 6, 1)), 'SY2026-2027')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import datetime
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from notifier import NotifierRuntime
+from notifier.drivers import MemoryIndicator, open_store
+
+from .support import add_class, create_machine, create_test_database, run_for
+
+
+class ReportCatchUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        self.journal = os.path.join(self.directory.name, 'journal.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_runtime(self, seconds: float = 1.5):
+        machine = create_machine(open_store('sqlite', self.path))
+        runtime = NotifierRuntime(machine, schedule_interval=0.5, outbox_interval=0.05, journal=self.journal)
+        run_for(runtime, seconds)
+        machine.database.close()
+        return machine.gsm.modems[0].gsm.outbox
+
+    def test_class_that_ended_while_stopped_is_reported_to_the_teacher_only(self):
+        now = datetime.datetime.now().replace(microsecond=0)
+        if now.hour < 2:
+            self.skipTest('The class must start and end today')
+        add_class(self.path, now - datetime.timedelta(hours=1, minutes=30), now - datetime.timedelta(hours=1))
+        sent = self.run_runtime()
+        self.assertEqual([number for number, _ in sent], ['+639170000001'])
+        self.assertTrue(sent[0][1].startswith('Attendance'))
+
+        # Marked as reported, so the next start sends nothing
+        self.assertEqual(self.run_runtime(), [])
+
+
+class SchoolDayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_scanned_class_is_reported_when_it_ends(self):
+        now = datetime.datetime.now().replace(microsecond=0)
+        end = now + datetime.timedelta(seconds=3)
+        if end.date() != now.date():
+            self.skipTest('The class must end today')
+        add_class(self.path, now - datetime.timedelta(minutes=1), end)
+        frames = itertools.chain([()] * 5, [('LRN1',)] * 5, itertools.repeat(()))
+        machine = create_machine(open_store('sqlite', self.path), frames)
+        runtime = NotifierRuntime(machine, accept_delay=0.1, reject_delay=0.1, schedule_interval=1, outbox_interval=0.05,
+                                  prepare_ahead=1, journal=os.path.join(self.directory.name, 'journal.jsonl'))
+        run_for(runtime, 5)
+        machine.database.close()
+
+        database = sqlite3.connect(self.path)
+        attendances = database.execute('SELECT student_id, schedule_id, date FROM core_attendance').fetchall()
+        reports = database.execute('SELECT schedule_id, date FROM core_schedulereport').fetchall()
+        database.close()
+        self.assertEqual(attendances, [(1, 1, now.date().isoformat())])
+        self.assertEqual(reports, [(1, now.date().isoformat())])
+        sent = dict(machine.gsm.modems[0].gsm.outbox)
+        self.assertEqual(set(sent), {'+639170000001', '+639170000101', '+639170000102'})
+        self.assertIn('Student 1 (LRN1) attended the Math subject', sent['+639170000101'])
+        self.assertIn('Student 2 (LRN2) missed the Math subject', sent['+639170000102'])
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        now = datetime.datetime.now().replace(microsecond=0)
+        if (now + datetime.timedelta(minutes=5)).date() != now.date():
+            self.skipTest('The class must end today')
+        add_class(self.path, now - datetime.timedelta(minutes=5), now + datetime.timedelta(minutes=5))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_student(self):
+        # What the admin does: add the student and bump its version
+        database = sqlite3.connect(self.path)
+        with database:
+            database.execute("INSERT INTO core_student (id, lrn, first_name, last_name, guardian_phone_number) "
+                             "VALUES (9, 'LRN9', 'New', 'Student', '+639170000109')")
+            database.execute("INSERT INTO core_dataversion (entity, version) VALUES ('student', 1) "
+                             "ON CONFLICT(entity) DO UPDATE SET version = version + 1")
+        database.close()
+
+    def test_student_added_while_running_can_scan(self):
+        machine = create_machine(open_store('sqlite', self.path), itertools.repeat(('LRN9',)))
+        runtime = NotifierRuntime(machine, accept_delay=0.1, reject_delay=0.1, repeat_delay=0.05, watch_interval=0.1,
+                                  journal=os.path.join(self.directory.name, 'journal.jsonl'))
+        timer = threading.Timer(1, self.add_student)
+        timer.start()
+        # The unknown LRN is remembered for longer than the test runs
+        with self.assertLogs('notifier.runtime', 'INFO') as logs:
+            run_for(runtime, 2.5)
+        timer.join()
+        machine.database.close()
+        self.assertIn('LRN mismatched', [record.getMessage() for record in logs.records])
+        self.assertIn(['student'], [getattr(record, 'entities', None) for record in logs.records])
+        database = sqlite3.connect(self.path)
+        self.assertEqual(database.execute('SELECT student_id FROM core_attendance').fetchall(), [(9,)])
+        database.close()
+
+
+class ShutdownTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_held_guardian_messages_are_queued_on_stop(self):
+        sms_journal = os.path.join(self.directory.name, 'sms.jsonl')
+        machine = create_machine(open_store('memory', self.path), coalesce_window=300, sms_journal=sms_journal)
+        runtime = NotifierRuntime(machine, outbox_interval=0.05, journal=os.path.join(self.directory.name, 'journal.jsonl'))
+        machine.notify_guardian('+639170000101', 'Arrived')
+        with self.assertLogs('notifier.runtime', 'INFO') as logs:
+            run_for(runtime, 0.3)
+        machine.database.close()
+        stopped = next(record for record in logs.records if record.getMessage() == 'Runtime stopped')
+        self.assertEqual(stopped.unsent_sms, 1)
+        self.assertEqual(machine.gsm.modems[0].gsm.outbox, [])
+
+        # Sent by the next run
+        machine = create_machine(open_store('memory', self.path), sms_journal=sms_journal)
+        self.assertTrue(machine.process_outbox())
+        self.assertEqual([number for number, _ in machine.gsm.modems[0].gsm.outbox], ['+639170000101'])
+        machine.database.close()
+
+
+class ColorLog(MemoryIndicator):
+    '''
+    Memory LED that keeps every color it showed
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.colors = []
+
+    def show(self, color: str):
+        super().show(color)
+        self.colors.append(color)
+
+
+class ScanDebounceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        now = datetime.datetime.now().replace(microsecond=0)
+        if (now + datetime.timedelta(minutes=5)).date() != now.date():
+            self.skipTest('The class must end today')
+        add_class(self.path, now - datetime.timedelta(minutes=5), now + datetime.timedelta(minutes=5))
+        self.date = now.date()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scan(self, lrn: str):
+        # The badge stays in front of the camera
+        frames = itertools.chain([()] * 5, [(lrn,)] * 100, itertools.repeat(()))
+        machine = create_machine(open_store('memory', self.path), frames)
+        machine.indicator = ColorLog()
+        runtime = NotifierRuntime(machine, accept_delay=0.1, reject_delay=0.1, repeat_delay=0.05,
+                                  journal=os.path.join(self.directory.name, 'journal.jsonl'))
+        run_for(runtime, 1.5)
+        machine.database.close()
+        return {color for color in machine.indicator.colors if color in ('green', 'red')}
+
+    def test_accepted_badge_stays_green(self):
+        self.assertEqual(self.scan('LRN1'), {'green'})
+
+    def test_recorded_badge_stays_red(self):
+        database = sqlite3.connect(self.path)
+        with database:
+            database.execute("INSERT INTO core_attendance (student_id, schedule_id, date, time_in) VALUES (1, 1, ?, '08:00:00')",
+                             (self.date.isoformat(),))
+        database.close()
+        self.assertEqual(self.scan('LRN1'), {'red'})
+
+
+class BatchScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        now = datetime.datetime.now().replace(microsecond=0)
+        if (now + datetime.timedelta(minutes=5)).date() != now.date():
+            self.skipTest('The class must end today')
+        self.lrns = add_class(self.path, now - datetime.timedelta(minutes=5), now + datetime.timedelta(minutes=5), students=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_badges_held_up_together_are_written_at_once(self):
+        frames = itertools.chain([()] * 5, [tuple(self.lrns)] * 10, itertools.repeat(()))
+        machine = create_machine(open_store('sqlite', self.path), frames)
+        runtime = NotifierRuntime(machine, accept_delay=0.1, journal=os.path.join(self.directory.name, 'journal.jsonl'),
+                                  batch=True, batch_window=0.05)
+        run_for(runtime, 1)
+        machine.database.close()
+        self.assertEqual(runtime.attendance_writes, 1)
+        database = sqlite3.connect(self.path)
+        self.assertEqual(database.execute('SELECT student_id FROM core_attendance ORDER BY student_id').fetchall(), [(1,), (2,), (3,)])
+        database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import contextlib
+import io
+import sqlite3
+import tempfile
+import unittest
+
+from notifier.simulation import database_size, main
+
+from .support import create_test_database
+
+
+class DatabaseSizeTest(unittest.TestCase):
+
+    def test_free_pages_and_wal_are_counted_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = create_test_database(directory)
+            database = sqlite3.connect(path)
+            database.execute('PRAGMA journal_mode=WAL')
+            database.execute('CREATE TABLE scratch (value TEXT)')
+            database.executemany('INSERT INTO scratch VALUES (?)', [('x' * 500,)] * 200)
+            database.commit()
+            full = database_size(path)
+            database.execute('DELETE FROM scratch')
+            database.commit()
+            # The deleted rows leave free pages behind
+            empty = database_size(path)
+            self.assertGreater(full - empty, 80 * 1024)
+            database.executemany('INSERT INTO scratch VALUES (?)', [('x' * 500,)] * 200)
+            database.commit()
+            # Still in the WAL until the size is measured
+            self.assertEqual(database_size(path), full)
+            database.close()
+
+
+class SimulationTest(unittest.TestCase):
+
+    def test_short_day(self):
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(output):
+            main(['--students', '5', '--periods', '1', '--period', '2', '--gap', '0', '--absent-rate', '0',
+                  '--rate', '20', '--accept-delay', '0.05', '--send-time', '0', '--drain', '2', '--directory', directory])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0].split(' in ')[0], 'Simulated 1 periods of 2s')
+        self.assertIn('Students  arrived 5, scanned 5, recorded 5, gave up 0', lines)
+        self.assertTrue(lines[-1].startswith('Database  grew'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import sqlite3
+import tempfile
+import unittest
+
+from notifier.sync import LocalSyncServer, UnitSync
+
+from .support import create_test_database
+
+ROSTER = {
+    'teachers': [[1, 'Ana', 'Cruz', '+639170000001']],
+    'students': [[1, 'SRV1', 'Ben', 'Reyes', '+639170000011'], [2, 'SRV2', 'Carla', 'Santos', '+639170000012']],
+    'schedules': [[1, 'Math', 1, '08:00:00', '09:00:00', 1, 15, 30]],
+}
+
+
+class UnitSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = create_test_database(self.directory.name)
+        self.database = sqlite3.connect(self.path)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def add_local_roster(self):
+        self.database.execute("INSERT INTO core_teacher (id, first_name, last_name, phone_number) VALUES (1, 'Local', 'Teacher', '+639170000099')")
+        self.database.execute("INSERT INTO core_student (id, lrn, first_name, last_name, guardian_phone_number) VALUES (1, 'LOCAL1', 'Dan', 'Lim', '+639170000021')")
+        self.database.execute('''
+            INSERT INTO core_schedule (id, subject, day, start, end, teacher_id, late_after, very_late_after)
+            VALUES (1, 'Science', 2, '10:00:00', '11:00:00', 1, 15, 30)
+        ''')
+        self.database.execute("INSERT INTO core_attendance (id, student_id, schedule_id, date, time_in) VALUES (1, 1, 1, '2026-10-20', '10:01:00')")
+        self.database.commit()
+
+    def students(self):
+        return self.database.execute('SELECT id, lrn, server_id FROM core_student ORDER BY lrn').fetchall()
+
+    def sync(self, server):
+        return UnitSync(self.path, server.url, server.token).sync()
+
+    def test_pull_applies_roster(self):
+        with LocalSyncServer(ROSTER) as server:
+            self.sync(server)
+        self.assertEqual(self.students(), [(1, 'SRV1', 1), (2, 'SRV2', 2)])
+        self.assertEqual(self.database.execute('SELECT id, teacher_id, server_id FROM core_schedule').fetchall(), [(1, 1, 1)])
+
+    def test_first_sync_keeps_local_rows_with_the_same_id(self):
+        self.add_local_roster()
+        with LocalSyncServer(ROSTER) as server:
+            self.sync(server)
+        students = self.students()
+        self.assertIn((1, 'LOCAL1', None), students)
+        self.assertEqual([(lrn, server_id) for _, lrn, server_id in students if server_id], [('SRV1', 1), ('SRV2', 2)])
+        # The attendance still belongs to the local student
+        self.assertEqual(self.database.execute('SELECT student_id FROM core_attendance').fetchall(), [(1,)])
+        self.assertEqual(self.database.execute("SELECT subject FROM core_schedule WHERE id = 1").fetchone(), ('Science',))
+
+    def test_first_sync_matches_students_by_lrn(self):
+        self.add_local_roster()
+        self.database.execute("UPDATE core_student SET lrn = 'SRV2' WHERE id = 1")
+        self.database.commit()
+        with LocalSyncServer(ROSTER) as server:
+            self.sync(server)
+        self.assertIn((1, 'SRV2', 2), self.students())
+        self.assertEqual(len(self.students()), 2)
+
+    def test_empty_roster_is_ignored(self):
+        self.add_local_roster()
+        with LocalSyncServer() as server:
+            with self.assertLogs('notifier.sync', 'WARNING'):
+                self.sync(server)
+        self.assertEqual(self.students(), [(1, 'LOCAL1', None)])
+        self.assertEqual(self.database.execute('SELECT COUNT(*) FROM core_schedule').fetchone(), (1,))
+
+    def test_only_removed_rows_are_deleted(self):
+        self.add_local_roster()
+        with LocalSyncServer(ROSTER) as server:
+            self.sync(server)
+        roster = dict(ROSTER, students=ROSTER['students'][:1])
+        with LocalSyncServer(roster, removed={'teachers': [], 'students': [2], 'schedules': []}) as server:
+            self.sync(server)
+        self.assertEqual([lrn for _, lrn, _ in self.students()], ['LOCAL1', 'SRV1'])
+
+    def test_push_keeps_rejected_rows_on_the_server(self):
+        self.add_local_roster()
+        with LocalSyncServer(ROSTER) as server:
+            self.sync(server)
+            student = self.database.execute("SELECT id FROM core_student WHERE lrn = 'SRV1'").fetchone()[0]
+            schedule = self.database.execute('SELECT id FROM core_schedule WHERE server_id = 1').fetchone()[0]
+            self.database.execute(
+                "INSERT INTO core_attendance (id, student_id, schedule_id, date, time_in) VALUES (2, ?, ?, '2026-10-19', '08:01:00')",
+                (student, schedule))
+            self.database.commit()
+            self.assertEqual(self.sync(server), 1)
+            # The attendance of the local student and schedule is rejected, not lost
+            self.assertEqual(list(server.rejected), [1])
+            self.assertEqual(server.attendances[2][1:3], ['SRV1', 1])
+            self.assertEqual(server.high_water, 2)
+            self.assertEqual(self.sync(server), 0)
+        # The archiver only moves attendances up to the mark the unit saw
+        self.assertEqual(self.database.execute('SELECT high_water FROM core_syncstate').fetchone()[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
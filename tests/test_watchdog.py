@@ -0,0 +1,106 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from notifier.watchdog import Supervisor
+
+
+class SlowDatabase:
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def check_writable(self):
+        time.sleep(self.delay)
+
+
+class LockedDatabase:
+    '''
+    Database whose write lock is held by another connection for the first `locked` checks
+    '''
+
+    def __init__(self, locked: int):
+        self.locked = locked
+        self.reconnect = mock.Mock()
+
+    def check_writable(self):
+        if self.locked:
+            self.locked -= 1
+            raise sqlite3.OperationalError('database is locked')
+
+
+class SupervisorWatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.directory.name, 'notify')
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.socket.close()
+        self.directory.cleanup()
+
+    def run_supervisor(self, probe_delay: float, probe_timeout: float, seconds: float, database = None):
+        machine = types.SimpleNamespace(read_started=None, last_frame=None, failed_reads=0,
+                                        database=database or SlowDatabase(probe_delay))
+        runtime = types.SimpleNamespace(machine=machine, db=self.executor, fail=mock.Mock())
+        environment = {'NOTIFY_SOCKET': self.address, 'WATCHDOG_USEC': '100000', 'WATCHDOG_PID': str(os.getpid())}
+        with mock.patch.dict(os.environ, environment):
+            supervisor = Supervisor(runtime, interval=0.01, modem_interval=3600, database_interval=0.01,
+                                    probe_timeout=probe_timeout, max_restarts=1)
+            # Only the database is probed
+            supervisor.next_probe['modem'] = float('inf')
+
+            async def run():
+                task = asyncio.create_task(supervisor.run())
+                await asyncio.sleep(seconds)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+            asyncio.run(run())
+        states = []
+        while True:
+            try:
+                states.append(self.socket.recv(64).decode())
+            except BlockingIOError:
+                return supervisor, runtime, states
+
+    def test_slow_probe_does_not_hold_up_pings(self):
+        supervisor, _, states = self.run_supervisor(probe_delay=0.4, probe_timeout=1, seconds=0.35)
+        self.assertIsNone(supervisor.failure)
+        # Pinged every 0.05 seconds while the probe took longer than WatchdogSec
+        self.assertGreaterEqual(states.count('WATCHDOG=1'), 4)
+
+    def test_hung_probe_stops_pings(self):
+        supervisor, _, states = self.run_supervisor(probe_delay=0.5, probe_timeout=0.1, seconds=0.4)
+        self.assertEqual(supervisor.failure, 'Database check is hung')
+        self.assertIn('STATUS=Database check is hung', states)
+        self.assertEqual(states[-1], 'STATUS=Database check is hung')
+
+    def test_locked_database_is_degraded_not_failed(self):
+        database = LockedDatabase(locked=5)
+        supervisor, runtime, states = self.run_supervisor(0, probe_timeout=1, seconds=0.3, database=database)
+        self.assertIsNone(supervisor.failure)
+        runtime.fail.assert_not_called()
+        database.reconnect.assert_not_called()
+        self.assertEqual(supervisor.restarts['database'], 0)
+        self.assertIn('STATUS=Database is locked, attendances are journaled', states)
+        # Cleared once the lock is free
+        self.assertEqual(supervisor.degraded, {})
+        self.assertIn('STATUS=Running', states)
+        self.assertEqual(states.count('STATUS=Database is locked, attendances are journaled'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()